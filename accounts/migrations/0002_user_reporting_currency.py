@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='reporting_currency',
+            field=models.CharField(default='USD', max_length=10),
+        ),
+    ]
@@ -2,5 +2,5 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
-  
-    pass
+    # Divisa en la que se reportan los totales agregados del dashboard.
+    reporting_currency = models.CharField(max_length=10, default='USD')
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
@@ -5,12 +6,25 @@ from rest_framework import serializers
 from .models import User
 
 
+def check_reporting_currency(value):
+    """Normaliza la divisa de reporte; sólo se admiten las de MARKET_FX_CURRENCIES."""
+    value = value.strip().upper()
+    if value not in settings.MARKET_FX_CURRENCIES:
+        raise serializers.ValidationError(
+            f"Unsupported currency; use one of: {', '.join(settings.MARKET_FX_CURRENCIES)}"
+        )
+    return value
+
+
 class RegisterUser(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
         model = User
-        fields = ('username', 'email', 'password')
+        fields = ('username', 'email', 'password', 'reporting_currency')
+
+    def validate_reporting_currency(self, value):
+        return check_reporting_currency(value)
 
     def validate_password(self, value):
         try:
@@ -23,6 +37,17 @@ class RegisterUser(serializers.ModelSerializer):
         user = User.objects.create_user(
             username=validated_data['username'],
             email=validated_data['email'],
-            password=validated_data['password']
+            password=validated_data['password'],
+            reporting_currency=validated_data.get('reporting_currency', 'USD'),
         )
-        return user
\ No newline at end of file
+        return user
+
+
+class UserProfile(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'email', 'reporting_currency')
+        read_only_fields = ('id', 'username')
+
+    def validate_reporting_currency(self, value):
+        return check_reporting_currency(value)
@@ -0,0 +1,30 @@
+from django.test import TestCase, override_settings
+
+from .models import User
+
+
+@override_settings(MARKET_FX_CURRENCIES=['USD', 'EUR'])
+class ReportingCurrencyTests(TestCase):
+    def _register(self, **extra):
+        data = {'username': 'ana', 'email': 'ana@example.com', 'password': 'a-Long-passw0rd', **extra}
+        return self.client.post('/api/auth/register/', data, content_type='application/json')
+
+    def test_registration_validates_and_normalizes_the_currency(self):
+        response = self._register(reporting_currency='XYZ')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('reporting_currency', response.json())
+        self.assertEqual(self._register(reporting_currency='eur').status_code, 201)
+        self.assertEqual(User.objects.get(username='ana').reporting_currency, 'EUR')
+
+    def test_profile_changes_the_currency(self):
+        user = User.objects.create_user(username='ana', password='x')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/api/auth/me/').json()['reporting_currency'], 'USD')
+        response = self.client.patch('/api/auth/me/', {'reporting_currency': 'ABC'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            '/api/auth/me/', {'reporting_currency': 'EUR', 'username': 'other'}, content_type='application/json',
+        )
+        self.assertEqual(response.json()['reporting_currency'], 'EUR')
+        user.refresh_from_db()
+        self.assertEqual((user.username, user.reporting_currency), ('ana', 'EUR'))
@@ -7,7 +7,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 
-from .serializers import RegisterUser
+from .serializers import RegisterUser, UserProfile
 
 
 @api_view(['GET'])
@@ -65,4 +65,19 @@ class RegisterUserView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response({'detail': 'User registered successfully.'}, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ProfileView(APIView):
+    """GET/PATCH /api/auth/me/ - Datos del usuario actual; permite cambiar email y reporting_currency."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(UserProfile(request.user).data)
+
+    def patch(self, request):
+        serializer = UserProfile(request.user, data=request.data, partial=True)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
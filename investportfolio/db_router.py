@@ -0,0 +1,100 @@
+"""
+Enrutado de lecturas a réplicas con consistencia read-your-writes.
+
+Las lecturas van a una réplica (elegida una vez por petición) salvo que:
+  - la petición sea de escritura o el cliente haya escrito hace poco
+    (ver `investportfolio.middleware.PrimaryPinningMiddleware`),
+  - ya se haya escrito en la primaria durante la petición actual,
+  - la consulta se ejecute dentro de una transacción abierta en la primaria
+    (p. ej. `select_for_update`).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class _RoutingState:
+    __slots__ = ('pinned', 'wrote', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+def _current_state():
+    """Estado del ámbito actual; fuera de un `routing_scope` uno desechable.
+
+    Los hilos sin petición (refresco de cotizaciones, alertas, comandos) no guardan
+    estado: una escritura no fija a la primaria las lecturas del resto de su vida.
+    """
+    state = _state.get()
+    return state if state is not None else _RoutingState()
+
+
+@contextmanager
+def routing_scope(pinned=False):
+    """Abre un ámbito de enrutado aislado (una petición) y devuelve su estado."""
+    token = _state.set(_RoutingState(pinned=pinned))
+    try:
+        yield _state.get()
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Fuerza que las lecturas del bloque se hagan en la primaria."""
+    state = _state.get()
+    if state is None:
+        with routing_scope(pinned=True):
+            yield
+        return
+    previous = state.pinned
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = previous
+
+
+class PrimaryReplicaRouter:
+    def _replicas(self):
+        return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if alias in connections]
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        state = _current_state()
+        if state.pinned or state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # Relaciones de una instancia ya cargada se leen de la misma base.
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if state.replica is None:
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        _current_state().wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *self._replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas son copias físicas de la primaria: sólo se migra la primaria.
+        if db in self._replicas():
+            return False
+        return None
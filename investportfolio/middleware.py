@@ -0,0 +1,34 @@
+from django.conf import settings
+
+from .db_router import routing_scope
+
+PIN_COOKIE_NAME = 'db_primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PrimaryPinningMiddleware:
+    """Fija las lecturas a la primaria en escrituras y durante unos segundos después.
+
+    Las peticiones no seguras (POST, PUT, PATCH, DELETE) leen siempre de la primaria.
+    Si una petición escribe, se emite una cookie corta para que las siguientes
+    lecturas del mismo cliente tampoco vayan a una réplica con retraso.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = request.method not in SAFE_METHODS or PIN_COOKIE_NAME in request.COOKIES
+        with routing_scope(pinned=pinned) as state:
+            response = self.get_response(request)
+            wrote = state.wrote
+        if wrote and getattr(settings, 'DATABASE_REPLICAS', []):
+            response.set_cookie(
+                PIN_COOKIE_NAME,
+                '1',
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
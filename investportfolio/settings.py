@@ -52,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'investportfolio.middleware.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,17 +84,59 @@ WSGI_APPLICATION = 'investportfolio.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+def _database_from_env(prefix, fallback_prefix=None):
+    """Configuración de una conexión PostgreSQL a partir de variables `<prefix>_*`.
+
+    Las variables ausentes se heredan de `<fallback_prefix>_*` (la primaria), de modo
+    que una réplica sólo necesita declarar lo que cambia (normalmente el host).
+    """
+    def env(key, default=None):
+        value = os.environ.get(f'{prefix}_{key}')
+        if value is None and fallback_prefix:
+            value = os.environ.get(f'{fallback_prefix}_{key}')
+        return default if value is None else value
+
+    config = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.environ.get('POSTGRES_DB'),
-        'USER': os.environ.get('POSTGRES_USER'),
-        'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
-        'HOST': os.environ.get('POSTGRES_HOST'),
-        'PORT': os.environ.get('POSTGRES_PORT'),
+        'NAME': env('DB'),
+        'USER': env('USER'),
+        'PASSWORD': env('PASSWORD'),
+        'HOST': env('HOST'),
+        'PORT': env('PORT'),
+        'CONN_MAX_AGE': int(env('CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': env('CONN_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': {},
     }
+    if env('POOL', 'False') == 'True':
+        # El pool nativo requiere psycopg 3 y no admite conexiones persistentes.
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS']['pool'] = {
+            'min_size': int(env('POOL_MIN_SIZE', '2')),
+            'max_size': int(env('POOL_MAX_SIZE', '10')),
+            'timeout': int(env('POOL_TIMEOUT', '10')),
+        }
+    return config
+
+
+DATABASES = {
+    'default': _database_from_env('POSTGRES'),
 }
 
+# Réplicas de sólo lectura: POSTGRES_REPLICAS=replica1,replica2 y, por alias,
+# POSTGRES_REPLICA1_HOST=... (el resto de variables se hereda de la primaria).
+DATABASE_REPLICAS = [
+    alias.strip() for alias in os.environ.get('POSTGRES_REPLICAS', '').split(',') if alias.strip()
+]
+for _alias in DATABASE_REPLICAS:
+    DATABASES[_alias] = _database_from_env(f'POSTGRES_{_alias.upper()}', fallback_prefix='POSTGRES')
+    # En tests la réplica apunta a la base de datos de la primaria.
+    DATABASES[_alias]['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['investportfolio.db_router.PrimaryReplicaRouter']
+
+# Segundos durante los que un cliente lee de la primaria tras una escritura.
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('POSTGRES_REPLICA_PIN_SECONDS', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -156,4 +199,110 @@ SESSION_COOKIE_SECURE = True
 # Needed for POSTing to session-auth endpoints from that origin
 CSRF_TRUSTED_ORIGINS = ALLOWED_ORIGINS
 
-APPEND_SLASH=True
\ No newline at end of file
+APPEND_SLASH=True
+
+# Cache (LocMem por proceso por defecto; p. ej. django.core.cache.backends.redis.RedisCache para compartirla)
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    # Cotizaciones, últimos precios conocidos y series de riesgo son una entrada por
+    # símbolo: el límite por defecto de LocMem (300) las expulsaría continuamente.
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_MAX_ENTRIES', '10000'))}
+
+# Market data
+# Segundos que una cotización se sirve desde la caché sin volver a consultar Yahoo Finance.
+MARKET_QUOTE_TTL = int(os.environ.get('MARKET_QUOTE_TTL', '60'))
+# Segundos tras caducar en los que se sirve el último precio (stale) mientras se
+# refresca en segundo plano; 0 desactiva stale-while-revalidate.
+MARKET_QUOTE_STALE_GRACE = int(os.environ.get('MARKET_QUOTE_STALE_GRACE', '120'))
+# Segundos que se recuerda un símbolo sin cotización (desconocido o sin precio); 0 lo desactiva.
+MARKET_QUOTE_MISSING_TTL = int(os.environ.get('MARKET_QUOTE_MISSING_TTL', '30'))
+# Segundos que se reutiliza un tipo de cambio antes de volver a pedirlo.
+MARKET_FX_TTL = int(os.environ.get('MARKET_FX_TTL', '300'))
+# Divisas aceptadas como divisa de reporte (?currency= del dashboard), códigos ISO separados por comas.
+MARKET_FX_CURRENCIES = [
+    code.strip().upper() for code in os.environ.get(
+        'MARKET_FX_CURRENCIES',
+        'USD,EUR,GBP,JPY,CHF,CAD,AUD,NZD,SEK,NOK,DKK,PLN,CZK,HUF,HKD,SGD,CNY,KRW,INR,TWD,'
+        'ILS,TRY,ZAR,BRL,MXN,COP,CLP,PEN,ARS',
+    ).split(',') if code.strip()
+]
+# Proveedor de datos de mercado (ruta a la clase); portfolio.providers.StubProvider sirve
+# precios locales y simula latencia/errores con MARKET_STUB_LATENCY y MARKET_STUB_FAILURE_RATE.
+MARKET_PRICE_PROVIDER = os.environ.get('MARKET_PRICE_PROVIDER', 'portfolio.providers.YahooProvider')
+MARKET_STUB_LATENCY = float(os.environ.get('MARKET_STUB_LATENCY', '0'))
+MARKET_STUB_FAILURE_RATE = float(os.environ.get('MARKET_STUB_FAILURE_RATE', '0'))
+# Guard del upstream (por proceso): deadline por llamada en segundos, llamadas
+# concurrentes, espera máxima por un hueco, token bucket (llamadas/s y ráfaga) y
+# circuit breaker (fallos seguidos para abrirlo y segundos hasta la llamada de prueba).
+MARKET_UPSTREAM_TIMEOUT = float(os.environ.get('MARKET_UPSTREAM_TIMEOUT', '5'))
+MARKET_UPSTREAM_MAX_CONCURRENCY = int(os.environ.get('MARKET_UPSTREAM_MAX_CONCURRENCY', '8'))
+MARKET_UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get('MARKET_UPSTREAM_QUEUE_TIMEOUT', '0.5'))
+MARKET_UPSTREAM_RATE = float(os.environ.get('MARKET_UPSTREAM_RATE', '10'))
+MARKET_UPSTREAM_BURST = int(os.environ.get('MARKET_UPSTREAM_BURST', '20'))
+MARKET_BREAKER_FAILURES = int(os.environ.get('MARKET_BREAKER_FAILURES', '5'))
+MARKET_BREAKER_RESET = float(os.environ.get('MARKET_BREAKER_RESET', '30'))
+# Segundos que se conserva el último precio conocido para servirlo si el upstream cae.
+MARKET_LAST_KNOWN_TTL = int(os.environ.get('MARKET_LAST_KNOWN_TTL', '86400'))
+# Snapshot de precios compartido entre workers (fichero mmap escrito por
+# `manage.py refresh_price_snapshot`); vacío lo desactiva. Las entradas con más de
+# MARKET_SNAPSHOT_MAX_AGE segundos se ignoran y se piden a la caché / upstream.
+MARKET_SNAPSHOT_PATH = os.environ.get('MARKET_SNAPSHOT_PATH', '')
+MARKET_SNAPSHOT_INTERVAL = float(os.environ.get('MARKET_SNAPSHOT_INTERVAL', '30'))
+MARKET_SNAPSHOT_MAX_AGE = float(os.environ.get('MARKET_SNAPSHOT_MAX_AGE', '120'))
+MARKET_QUOTES_MAX_SYMBOLS = int(os.environ.get('MARKET_QUOTES_MAX_SYMBOLS', '50'))
+# Puntos máximos por defecto (y límite superior) del historial de MarketQuoteView.
+MARKET_HISTORY_MAX_POINTS = int(os.environ.get('MARKET_HISTORY_MAX_POINTS', '500'))
+MARKET_HISTORY_MAX_POINTS_LIMIT = int(os.environ.get('MARKET_HISTORY_MAX_POINTS_LIMIT', '2000'))
+
+# Risk analytics
+RISK_BENCHMARK_SYMBOL = os.environ.get('RISK_BENCHMARK_SYMBOL', 'SPY')
+# Tasa libre de riesgo anual (fracción) para el ratio de Sharpe.
+RISK_FREE_RATE = float(os.environ.get('RISK_FREE_RATE', '0'))
+RISK_MAX_YEARS = int(os.environ.get('RISK_MAX_YEARS', '10'))
+# Segundos que se reutilizan las series y matrices de rentabilidades cacheadas.
+RISK_CACHE_TTL = int(os.environ.get('RISK_CACHE_TTL', '3600'))
+# Segundos para series o matrices vacías o incompletas (p. ej. tras una descarga fallida).
+RISK_EMPTY_CACHE_TTL = int(os.environ.get('RISK_EMPTY_CACHE_TTL', '30'))
+
+# Ledger: particionado por año de AssetTransaction (sólo PostgreSQL). Se aplica en la
+# migración 0007 si está activo al migrar, o después con `manage.py partition_ledger`.
+LEDGER_PARTITIONING = os.environ.get('LEDGER_PARTITIONING', 'False') == 'True'
+
+# Delta sync (GET /api/portfolios/sync/?since=<cursor>)
+# Entradas del change log (u objetos, en una sincronización completa) por respuesta;
+# con más pendientes se devuelve has_more.
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '1000'))
+# Días que se conservan las entradas (`manage.py prune_changelog`); los cursores más
+# antiguos reciben una sincronización completa (reset).
+SYNC_CHANGELOG_RETENTION_DAYS = int(os.environ.get('SYNC_CHANGELOG_RETENTION_DAYS', '30'))
+
+# Price alerts
+# Evalúa las alertas en cada descarga de cotizaciones (hilo en segundo plano por proceso).
+PRICE_ALERTS_ENABLED = os.environ.get('PRICE_ALERTS_ENABLED', 'True') == 'True'
+# Segundos máximos entre sincronizaciones del índice en memoria con las alertas modificadas.
+PRICE_ALERTS_SYNC_INTERVAL = float(os.environ.get('PRICE_ALERTS_SYNC_INTERVAL', '10'))
+# Envía un email al dueño de cada alerta disparada (usa EMAIL_BACKEND); siempre se registran en el log.
+PRICE_ALERTS_EMAIL = os.environ.get('PRICE_ALERTS_EMAIL', 'False') == 'True'
+
+# Portfolio simulation (Monte Carlo, POST /api/portfolios/<id>/simulate/)
+SIMULATION_DEFAULT_PATHS = int(os.environ.get('SIMULATION_DEFAULT_PATHS', '10000'))
+SIMULATION_MAX_PATHS = int(os.environ.get('SIMULATION_MAX_PATHS', '100000'))
+SIMULATION_MAX_HORIZON_DAYS = int(os.environ.get('SIMULATION_MAX_HORIZON_DAYS', '2520'))
+# La simulación corre dentro de la petición: caminos x días de horizonte por petición
+# (10000 caminos a 2520 días, unos segundos de CPU) y puntos del fan chart, que acotan
+# el resultado en memoria (caminos x puntos en float64).
+SIMULATION_MAX_PATH_DAYS = int(os.environ.get('SIMULATION_MAX_PATH_DAYS', '25200000'))
+SIMULATION_MAX_STEPS = int(os.environ.get('SIMULATION_MAX_STEPS', '52'))
+# Bytes de arrays temporales por bloque de caminos (64 MB); el tamaño del bloque se
+# calcula con el horizonte, los holdings y el historial.
+SIMULATION_CHUNK_BYTES = int(os.environ.get('SIMULATION_CHUNK_BYTES', '67108864'))
+
+# Live valuation streaming (SSE)
+# Segundos entre consultas de precios del bucle compartido y entre keep-alives.
+STREAM_TICK_INTERVAL = float(os.environ.get('STREAM_TICK_INTERVAL', '5'))
+STREAM_HEARTBEAT_INTERVAL = float(os.environ.get('STREAM_HEARTBEAT_INTERVAL', '15'))
@@ -0,0 +1,120 @@
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+
+from portfolio.models import Portfolio
+
+from .db_router import routing_scope, use_primary
+from .middleware import PIN_COOKIE_NAME, PrimaryPinningMiddleware
+
+REPLICA = 'replica'
+
+
+def _add_local_replica():
+    """Alias de réplica local: la misma base que la primaria (como TEST MIRROR en settings)."""
+    if REPLICA not in connections:
+        connections.settings[REPLICA] = {**connections.settings[DEFAULT_DB_ALIAS], 'TEST': {'MIRROR': DEFAULT_DB_ALIAS}}
+
+
+_add_local_replica()
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class PrimaryReplicaRouterTests(TransactionTestCase):
+    # Sin el atomic de TestCase: dentro de una transacción todo se lee de la primaria.
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        with routing_scope():
+            self.assertEqual(router.db_for_read(Portfolio), REPLICA)
+            self.assertEqual(router.db_for_write(Portfolio), DEFAULT_DB_ALIAS)
+
+    def test_reads_after_a_write_stay_on_primary(self):
+        with routing_scope():
+            router.db_for_write(Portfolio)
+            self.assertEqual(router.db_for_read(Portfolio), DEFAULT_DB_ALIAS)
+        with routing_scope():
+            self.assertEqual(router.db_for_read(Portfolio), REPLICA)
+
+    def test_pinned_scope_and_use_primary(self):
+        with routing_scope(pinned=True):
+            self.assertEqual(router.db_for_read(Portfolio), DEFAULT_DB_ALIAS)
+        with routing_scope():
+            with use_primary():
+                self.assertEqual(router.db_for_read(Portfolio), DEFAULT_DB_ALIAS)
+            self.assertEqual(router.db_for_read(Portfolio), REPLICA)
+        with use_primary():
+            self.assertEqual(router.db_for_read(Portfolio), DEFAULT_DB_ALIAS)
+
+    def test_reads_inside_primary_transaction_stay_on_primary(self):
+        with routing_scope():
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                self.assertEqual(router.db_for_read(Portfolio), DEFAULT_DB_ALIAS)
+            self.assertEqual(router.db_for_read(Portfolio), REPLICA)
+
+    def test_write_outside_scope_does_not_pin_later_reads(self):
+        results = []
+
+        def background():
+            router.db_for_write(Portfolio)
+            results.append(router.db_for_read(Portfolio))
+
+        thread = threading.Thread(target=background)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [REPLICA])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        with routing_scope():
+            self.assertEqual(router.db_for_read(Portfolio), DEFAULT_DB_ALIAS)
+
+    def test_queryset_routing(self):
+        with routing_scope():
+            self.assertEqual(Portfolio.objects.all().db, REPLICA)
+        with routing_scope(pinned=True):
+            self.assertEqual(Portfolio.objects.all().db, DEFAULT_DB_ALIAS)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], DATABASE_REPLICA_PIN_SECONDS=5)
+class PrimaryPinningMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.reads = []
+
+    def _middleware(self, write=False):
+        def view(request):
+            if write:
+                router.db_for_write(Portfolio)
+            self.reads.append(router.db_for_read(Portfolio))
+            return HttpResponse()
+
+        return PrimaryPinningMiddleware(view)
+
+    def test_safe_request_reads_from_replica_without_cookie(self):
+        response = self._middleware()(self.factory.get('/api/portfolios/'))
+        self.assertEqual(self.reads, [REPLICA])
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+
+    def test_unsafe_request_reads_from_primary(self):
+        self._middleware()(self.factory.post('/api/portfolios/'))
+        self.assertEqual(self.reads, [DEFAULT_DB_ALIAS])
+
+    def test_write_sets_pin_cookie(self):
+        response = self._middleware(write=True)(self.factory.post('/api/portfolios/'))
+        cookie = response.cookies[PIN_COOKIE_NAME]
+        self.assertEqual(cookie['max-age'], 5)
+        self.assertTrue(cookie['httponly'])
+
+    def test_pin_cookie_sends_reads_to_primary(self):
+        request = self.factory.get('/api/portfolios/')
+        request.COOKIES[PIN_COOKIE_NAME] = '1'
+        self._middleware()(request)
+        self.assertEqual(self.reads, [DEFAULT_DB_ALIAS])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_cookie_without_replicas(self):
+        response = self._middleware(write=True)(self.factory.post('/api/portfolios/'))
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
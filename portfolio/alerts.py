@@ -0,0 +1,317 @@
+"""
+Motor de alertas de precio (modelo PriceAlert).
+
+Cada proceso mantiene en memoria, por símbolo, un `AlertBook` con los trigger_price de
+las alertas activas en dos listas ordenadas. El orden se elige para que las alertas que
+cruza un precio sean siempre un sufijo de la lista:
+  - ABOVE (dispara si precio >= trigger): claves -trigger_price, ascendentes;
+  - BELOW (dispara si precio <= trigger): claves trigger_price, ascendentes.
+Evaluar una cotización es un `bisect` por lista más retirar el sufijo: O(log n + k)
+para k alertas disparadas, en vez de recorrer todas las alertas del símbolo.
+
+Cada descarga del proveedor (`pricing.quotes_fetched`) encola la evaluación en un hilo
+propio: la petición que disparó el refresco no espera. El índice se carga completo la
+primera vez y después se sincroniza con las alertas modificadas (updated_at) como mucho
+cada PRICE_ALERTS_SYNC_INTERVAL segundos. El disparo se confirma en la base de datos con
+la fila bloqueada y sólo si sigue activa y cruzada, así varios procesos con el mismo
+índice no disparan dos veces la misma alerta. Las candidatas que no se disparan se releen:
+las que siguen activas vuelven al índice (p. ej. las bloqueadas por otro proceso) y las
+borradas, que la sincronización por updated_at no ve, salen de él.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mass_mail
+from django.db import close_old_connections, router, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery
+from django.db.models.functions import NullIf
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .models import Asset, PriceAlert
+from .pricing import quotes_fetched
+
+logger = logging.getLogger(__name__)
+
+ABOVE = PriceAlert.Direction.ABOVE
+PNL_PCT = PriceAlert.Kind.PNL_PCT
+PLACES = Decimal('0.0001')
+# Margen al releer cambios: cubre transacciones confirmadas poco después de su updated_at.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+# Se emite con alerts=[PriceAlert, ...] tras confirmar el disparo (notificaciones).
+alert_triggered = Signal()
+
+
+def compute_trigger_price(kind, threshold, average_price=None):
+    """Precio que dispara la alerta; None si es de P&L y el asset no tiene precio promedio."""
+    if kind != PNL_PCT:
+        return threshold
+    if not average_price or average_price <= 0:
+        return None
+    return (average_price * (1 + threshold / 100)).quantize(PLACES)
+
+
+def crosses(direction, trigger_price, price):
+    return price >= trigger_price if direction == ABOVE else price <= trigger_price
+
+
+class AlertBook:
+    __slots__ = ('above_keys', 'above_ids', 'below_keys', 'below_ids')
+
+    def __init__(self, above=(), below=()):
+        # above/below: pares (clave, alert_id) ya ordenados.
+        self.above_keys = [key for key, _ in above]
+        self.above_ids = [alert_id for _, alert_id in above]
+        self.below_keys = [key for key, _ in below]
+        self.below_ids = [alert_id for _, alert_id in below]
+
+    def __len__(self):
+        return len(self.above_ids) + len(self.below_ids)
+
+    def _side(self, direction, price):
+        if direction == ABOVE:
+            return self.above_keys, self.above_ids, -price
+        return self.below_keys, self.below_ids, price
+
+    def add(self, alert_id, direction, price):
+        keys, ids, key = self._side(direction, price)
+        i = bisect_right(keys, key)
+        keys.insert(i, key)
+        ids.insert(i, alert_id)
+
+    def remove(self, alert_id, direction, price):
+        keys, ids, key = self._side(direction, price)
+        i = bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key:
+            if ids[i] == alert_id:
+                del keys[i], ids[i]
+                return
+            i += 1
+
+    def crossed(self, price):
+        """Retira y devuelve los ids de las alertas que dispara `price`."""
+        i = bisect_left(self.above_keys, -price)
+        fired = self.above_ids[i:]
+        del self.above_keys[i:], self.above_ids[i:]
+        j = bisect_left(self.below_keys, price)
+        fired += self.below_ids[j:]
+        del self.below_keys[j:], self.below_ids[j:]
+        return fired
+
+
+class AlertIndex:
+    def __init__(self):
+        self.books = {}
+        self.entries = {}  # alert_id -> (symbol, direction, trigger_price)
+        self.synced_at = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self, rows):
+        """Reemplaza el contenido con filas (id, symbol, direction, trigger_price); un sort por libro."""
+        grouped = {}
+        entries = {}
+        for alert_id, symbol, direction, price in rows:
+            price = float(price)
+            entries[alert_id] = (symbol, direction, price)
+            above, below = grouped.setdefault(symbol, ([], []))
+            if direction == ABOVE:
+                above.append((-price, alert_id))
+            else:
+                below.append((price, alert_id))
+        self.books = {symbol: AlertBook(sorted(above), sorted(below)) for symbol, (above, below) in grouped.items()}
+        self.entries = entries
+
+    def discard(self, alert_id):
+        entry = self.entries.pop(alert_id, None)
+        if entry is not None:
+            symbol, direction, price = entry
+            self.books[symbol].remove(alert_id, direction, price)
+
+    def upsert(self, alert_id, symbol, direction, price, active=True):
+        self.discard(alert_id)
+        if not active or price is None:
+            return
+        price = float(price)
+        self.entries[alert_id] = (symbol, direction, price)
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = AlertBook()
+        book.add(alert_id, direction, price)
+
+    def crossed(self, prices):
+        """Retira las alertas cruzadas por `prices` (symbol -> precio): dict alert_id -> precio."""
+        fired = {}
+        for symbol, price in prices.items():
+            book = self.books.get(symbol)
+            if not book:
+                continue
+            for alert_id in book.crossed(price):
+                self.entries.pop(alert_id, None)
+                fired[alert_id] = price
+        return fired
+
+    def reload(self, alert_ids, using=None):
+        """Relee las alertas `alert_ids`: reinserta las activas y retira el resto (disparadas o borradas)."""
+        rows = PriceAlert.objects.using(using).filter(
+            pk__in=list(alert_ids), active=True, trigger_price__isnull=False,
+        ).order_by().values_list('id', 'symbol', 'direction', 'trigger_price')
+        missing = set(alert_ids)
+        for row in rows:
+            self.upsert(*row)
+            missing.discard(row[0])
+        for alert_id in missing:
+            self.discard(alert_id)
+
+    def sync(self):
+        """Carga completa la primera vez; después, sólo las alertas modificadas desde la última."""
+        now = timezone.now()
+        fields = ('id', 'symbol', 'direction', 'trigger_price')
+        if self.synced_at is None:
+            self.load(
+                PriceAlert.objects.filter(active=True, trigger_price__isnull=False)
+                .order_by().values_list(*fields).iterator(chunk_size=10000)
+            )
+        else:
+            changed = PriceAlert.objects.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP)
+            for row in changed.order_by().values_list(*fields, 'active').iterator(chunk_size=10000):
+                self.upsert(*row)
+        self.synced_at = now
+        self.checked_at = time.monotonic()
+
+
+_index = AlertIndex()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_index():
+    """Índice del proceso, sincronizado como mucho cada PRICE_ALERTS_SYNC_INTERVAL segundos."""
+    if _index.synced_at is None or time.monotonic() - _index.checked_at >= settings.PRICE_ALERTS_SYNC_INTERVAL:
+        _index.sync()
+    return _index
+
+
+def fire(candidates):
+    """Confirma el disparo de las alertas candidatas (alert_id -> precio) y devuelve las disparadas.
+
+    Las filas bloqueadas por otro proceso se saltan (ese proceso ya las está disparando) y
+    se descartan las que ya no cruzan con su trigger_price actual (índice desactualizado).
+    """
+    db = router.db_for_write(PriceAlert)
+    now = timezone.now()
+    with transaction.atomic(using=db):
+        alerts = PriceAlert.objects.using(db).select_for_update(skip_locked=True).filter(
+            pk__in=list(candidates), active=True, trigger_price__isnull=False,
+        )
+        fired = [
+            alert for alert in alerts
+            if crosses(alert.direction, alert.trigger_price, Decimal(str(candidates[alert.pk])))
+        ]
+        for alert in fired:
+            alert.active = False
+            alert.triggered_at = now
+            alert.triggered_price = Decimal(str(candidates[alert.pk])).quantize(PLACES)
+            alert.updated_at = now
+        PriceAlert.objects.using(db).bulk_update(fired, ['active', 'triggered_at', 'triggered_price', 'updated_at'])
+    if fired:
+        alert_triggered.send(sender=PriceAlert, alerts=fired)
+    return fired
+
+
+def evaluate(quotes):
+    """Dispara las alertas que cruzan las cotizaciones `quotes` (symbol -> quote)."""
+    with _index.lock:
+        index = get_index()
+        candidates = index.crossed({
+            symbol: float(quote['price']) for symbol, quote in quotes.items() if quote.get('price') is not None
+        })
+        if not candidates:
+            return []
+        try:
+            fired = fire(candidates)
+            # crossed() ya las retiró: las no disparadas que sigan activas vuelven al índice.
+            pending = candidates.keys() - {alert.pk for alert in fired}
+            if pending:
+                index.reload(pending, using=router.db_for_write(PriceAlert))
+            return fired
+        except Exception:
+            # Las candidatas ya salieron del índice: se recarga entero en la próxima evaluación.
+            index.synced_at = None
+            raise
+
+
+def _evaluate_in_background(quotes):
+    close_old_connections()
+    try:
+        evaluate(quotes)
+    except Exception:
+        logger.exception('Price alert evaluation failed for %s', ', '.join(quotes))
+
+
+@receiver(quotes_fetched)
+def _on_quotes_fetched(sender, quotes, **kwargs):
+    global _executor
+    if not settings.PRICE_ALERTS_ENABLED:
+        return
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Un único hilo: las cotizaciones se evalúan en el orden en que llegan.
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='price-alerts')
+    _executor.submit(_evaluate_in_background, quotes)
+
+
+@receiver(alert_triggered)
+def _notify_triggered(sender, alerts, **kwargs):
+    """Entrega de las alertas disparadas: log siempre y email al dueño con PRICE_ALERTS_EMAIL."""
+    for alert in alerts:
+        logger.info(
+            'Price alert %s fired for user %s: %s %s %s at %s',
+            alert.pk, alert.owner_id, alert.symbol, alert.direction, alert.trigger_price, alert.triggered_price,
+        )
+    if not settings.PRICE_ALERTS_EMAIL:
+        return
+    emails = dict(
+        get_user_model().objects.filter(pk__in={alert.owner_id for alert in alerts})
+        .exclude(email='').values_list('pk', 'email')
+    )
+    messages = [
+        (
+            f'Price alert: {alert.symbol} {alert.direction.lower()} {alert.trigger_price}',
+            f'{alert.symbol} traded at {alert.triggered_price} ({alert}).',
+            None,
+            [emails[alert.owner_id]],
+        )
+        for alert in alerts if alert.owner_id in emails
+    ]
+    try:
+        send_mass_mail(messages)
+    except Exception:
+        # El disparo ya está confirmado: un fallo del correo no debe reintentarlo.
+        logger.exception('Unable to email %d triggered price alerts', len(messages))
+
+
+def reprice_alerts(asset_ids, using=None):
+    """Recalcula el trigger_price de las alertas PNL_PCT activas tras cambiar el precio promedio."""
+    if not asset_ids:
+        return 0
+    average_price = Subquery(Asset.objects.filter(pk=OuterRef('asset_id')).values('average_price')[:1])
+    trigger_price = ExpressionWrapper(
+        NullIf(average_price, 0) * (1 + F('threshold') / 100),
+        output_field=DecimalField(max_digits=20, decimal_places=4),
+    )
+    return PriceAlert.objects.using(using).filter(asset_id__in=asset_ids, kind=PNL_PCT, active=True).update(
+        trigger_price=trigger_price, updated_at=timezone.now(),
+    )
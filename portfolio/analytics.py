@@ -0,0 +1,24 @@
+"""
+Acceso perezoso a los módulos de analítica, que dependen de NumPy (y, vía la capa de
+precios, de pandas y yfinance).
+
+Vistas y serializers importan este módulo al cargar las URLs y usan sus atributos
+(`analytics.helpers.portfolio_performance`, `analytics.risk.portfolio_risk`, ...): cada
+submódulo se importa en el primer acceso, así un worker recién arrancado no carga las
+librerías numéricas (`manage.py bench_startup` lo comprueba).
+"""
+import importlib
+
+MODULES = frozenset({'catalogue', 'charts', 'fx', 'helpers', 'risk', 'simulation', 'streaming'})
+
+
+def __getattr__(name):
+    if name not in MODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    module = importlib.import_module(f'{__package__}.{name}')
+    globals()[name] = module
+    return module
+
+
+def __dir__():
+    return sorted(set(globals()) | MODULES)
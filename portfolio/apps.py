@@ -3,3 +3,8 @@ from django.apps import AppConfig
 class PortfolioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'portfolio'
+
+    def ready(self):
+        # Conecta las señales del change log (sincronización incremental) y la evaluación
+        # de alertas de precio en cada descarga de cotizaciones.
+        from . import alerts, sync  # noqa: F401
@@ -0,0 +1,141 @@
+"""
+Índice en memoria del catálogo de símbolos (modelo Symbol) para autocompletado.
+
+Cada proceso construye el índice en el primer uso:
+  - tickers ordenados: la búsqueda por prefijo es un `bisect` más un recorrido lineal
+    sobre los resultados contiguos (equivalente a un trie, sin un nodo por carácter);
+  - índice invertido de trigramas de los nombres (al estilo pg_trgm): cada trigrama
+    apunta a un array de filas y la puntuación de una consulta es un `np.bincount`
+    sobre las filas de sus trigramas.
+
+`load_symbols` incrementa la versión del catálogo en la base de datos (CatalogueVersion,
+compartida por todos los procesos sin depender de la caché); cada proceso la comprueba
+cada CHECK_INTERVAL segundos y reconstruye el índice si cambió. Mientras el catálogo no
+se haya cargado nunca, cualquier símbolo se acepta; después, sólo los del catálogo.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+
+import numpy as np
+from django.db.models import F
+
+from .models import CatalogueVersion, Symbol
+
+CHECK_INTERVAL = 10
+MIN_SCORE = 0.5
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def trigrams(text):
+    """Trigramas de las palabras de `text` (minúsculas, dos espacios delante y uno detrás)."""
+    grams = set()
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SymbolIndex:
+    def __init__(self, rows, version=None):
+        # rows: (ticker, name, exchange, currency) ordenadas por ticker; version: la del
+        # catálogo al construirlo (None si nunca se ha cargado).
+        self.rows = rows
+        self.version = version
+        self.tickers = [row[0] for row in rows]
+        self.known = frozenset(self.tickers)
+        self.name_lengths = np.array([len(row[1]) for row in rows], dtype=np.int32)
+        postings = {}
+        for i, row in enumerate(rows):
+            for gram in trigrams(row[1]):
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, ticker):
+        return ticker in self.known
+
+    def prefix(self, prefix, limit):
+        """Filas cuyo ticker empieza por `prefix`, en orden alfabético."""
+        start = bisect_left(self.tickers, prefix)
+        end = min(start + limit, len(self.tickers))
+        matches = []
+        for i in range(start, end):
+            if not self.tickers[i].startswith(prefix):
+                break
+            matches.append(i)
+        return matches
+
+    def names(self, query, limit):
+        """Filas cuyo nombre comparte al menos MIN_SCORE de los trigramas de `query`."""
+        grams = [self.postings[g] for g in trigrams(query) if g in self.postings]
+        total = len(trigrams(query))
+        if not grams or not total:
+            return []
+        counts = np.bincount(np.concatenate(grams), minlength=len(self.rows))
+        candidates = np.flatnonzero(counts >= max(1, np.ceil(total * MIN_SCORE)))
+        if not len(candidates):
+            return []
+        # Más trigramas en común primero; a igualdad, nombres más cortos (más específicos).
+        order = np.lexsort((self.name_lengths[candidates], -counts[candidates]))
+        return candidates[order[:limit]].tolist()
+
+    def search(self, query, limit=10):
+        """Coincidencias de ticker por prefijo (exacta primero) seguidas de coincidencias por nombre."""
+        query = query.strip()
+        if not query:
+            return []
+        ids = self.prefix(query.upper(), limit)
+        if len(ids) < limit:
+            seen = set(ids)
+            ids += [i for i in self.names(query, limit) if i not in seen][:limit - len(ids)]
+        exact = query.upper()
+        ids.sort(key=lambda i: self.tickers[i] != exact)
+        return [
+            {'symbol': ticker, 'name': name, 'exchange': exchange, 'currency': currency}
+            for ticker, name, exchange, currency in (self.rows[i] for i in ids)
+        ]
+
+
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def bump_version():
+    """Invalida los índices de todos los procesos (tras cargar o modificar el catálogo)."""
+    if not CatalogueVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        CatalogueVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+def current_version():
+    return CatalogueVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+
+
+def get_index():
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < CHECK_INTERVAL:
+        return _index
+    version = current_version()
+    if _index is not None and version == _index.version:
+        _checked_at = now
+        return _index
+    with _lock:
+        if _index is None or version != _index.version:
+            rows = list(Symbol.objects.order_by('ticker').values_list('ticker', 'name', 'exchange', 'currency'))
+            _index = SymbolIndex(rows, version)
+        _checked_at = now
+    return _index
+
+
+def is_known(ticker):
+    """True si `ticker` está en el catálogo, o si el catálogo aún no se ha cargado nunca."""
+    index = get_index()
+    if index.version is None and not len(index):
+        return True
+    return ticker in index
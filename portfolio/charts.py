@@ -0,0 +1,76 @@
+"""
+Series de precios compactas para gráficos.
+
+El historial se devuelve en forma columnar (arrays paralelos de timestamps y valores),
+reducido a `max_points` con LTTB (Largest-Triangle-Three-Buckets), que conserva la
+forma visual de la serie (picos y valles) con un tamaño de payload acotado.
+"""
+import numpy as np
+
+DELTA_SCALE = 10000  # 4 decimales, igual que los DecimalField de precios.
+
+
+def lttb(x, y, max_points):
+    """Índices de los puntos seleccionados por LTTB sobre arrays x, y (ordenados por x).
+
+    El cálculo de áreas de cada bucket está vectorizado; el recorrido por buckets es
+    secuencial porque cada punto elegido depende del anterior.
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Buckets interiores (el primer y el último punto siempre se conservan).
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+    # Para el último bucket el "siguiente" es el último punto.
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bx = x[start:end]
+        by = y[start:end]
+        area = np.abs((x[prev] - next_x[i]) * (by - y[prev]) - (x[prev] - bx) * (next_y[i] - y[prev]))
+        prev = start + int(np.argmax(area))
+        selected[i + 1] = prev
+    return selected
+
+
+def compact_history(timestamps, values, max_points, encoding='plain'):
+    """Serie columnar reducida: {'t': [...], 'v': [...], 'points', 'source_points'}.
+
+    timestamps en segundos epoch (enteros). Con encoding='delta' los arrays se envían
+    como enteros delta-codificados (primer valor absoluto, después diferencias) y los
+    valores escalados por `scale`; el cliente los reconstruye con una suma acumulada.
+    """
+    t = np.asarray(timestamps, dtype=np.int64)
+    v = np.asarray(values, dtype=np.float64)
+    mask = ~np.isnan(v)
+    t, v = t[mask], v[mask]
+    source_points = len(t)
+    idx = lttb(t, v, max_points)
+    t, v = t[idx], v[idx]
+    data = {'points': len(t), 'source_points': source_points}
+    if encoding == 'delta':
+        scaled = np.rint(v * DELTA_SCALE).astype(np.int64)
+        data.update({
+            'encoding': 'delta',
+            'scale': DELTA_SCALE,
+            't': np.diff(t, prepend=0).tolist(),
+            'v': np.diff(scaled, prepend=0).tolist(),
+        })
+    else:
+        data.update({
+            'encoding': 'plain',
+            't': t.tolist(),
+            'v': np.round(v, 4).tolist(),
+        })
+    return data
@@ -0,0 +1,81 @@
+"""
+Tipos de cambio para valorar activos cotizados en distintas divisas.
+
+Los pares se piden por lotes (`EURUSD=X`, `COPUSD=X`, ...) con la misma consulta
+múltiple de la capa de precios y se guardan en caché MARKET_FX_TTL segundos, así
+un portfolio multidivisa no cuesta más round trips que uno de una sola divisa.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .pricing import fetch_quotes
+from .upstream import UpstreamUnavailable
+
+CACHE_PREFIX = 'market:fx:'
+
+# Divisas que Yahoo cotiza en subunidades (peniques, centavos...).
+MINOR_UNITS = {
+    'GBp': ('GBP', 100),
+    'GBX': ('GBP', 100),
+    'ZAc': ('ZAR', 100),
+    'ILA': ('ILS', 100),
+}
+
+
+def normalize_currency(code):
+    """Devuelve (código ISO, divisor) de una divisa tal como la reporta Yahoo."""
+    if code in MINOR_UNITS:
+        return MINOR_UNITS[code]
+    return (code or '').upper(), 1
+
+
+def _pair_symbol(source, target):
+    return f'{source}{target}=X'
+
+
+def _cache_key(source, target):
+    return f'{CACHE_PREFIX}{source}{target}'
+
+
+def get_rates(currencies, target):
+    """Tipos de cambio hacia `target`: dict divisa -> unidades de target por unidad.
+
+    Acepta códigos de subunidades (p. ej. 'GBp'). Las divisas sin cotización
+    disponible no aparecen en el resultado.
+    """
+    target = target.upper()
+    normalized = {code: normalize_currency(code) for code in set(currencies) if code}
+    sources = {iso for iso, _ in normalized.values() if iso != target}
+    cached = cache.get_many([_cache_key(s, target) for s in sources])
+    rates = {s: cached[_cache_key(s, target)] for s in sources if _cache_key(s, target) in cached}
+    missing = [s for s in sources if s not in rates]
+    if missing:
+        try:
+            quotes = fetch_quotes([_pair_symbol(s, target) for s in missing])
+        except UpstreamUnavailable:
+            # Sin upstream: las divisas sin tipo en caché quedan sin convertir (NaN).
+            quotes = {}
+        fetched = {}
+        for source in missing:
+            quote = quotes.get(_pair_symbol(source, target))
+            if quote is not None and quote['price']:
+                fetched[source] = float(quote['price'])
+        cache.set_many({_cache_key(s, target): r for s, r in fetched.items()}, timeout=settings.MARKET_FX_TTL)
+        rates.update(fetched)
+    rates[target] = 1.0
+    result = {}
+    for code, (iso, divisor) in normalized.items():
+        if iso in rates:
+            result[code] = rates[iso] / divisor
+    return result
+
+
+def conversion_factors(currencies, target):
+    """Array de factores alineado con `currencies` para convertir precios a `target`.
+
+    Las divisas desconocidas (None) y las que no tienen tipo de cambio disponible quedan
+    como NaN (sin convertir); el llamador decide qué divisa asumir cuando falta.
+    """
+    rates = get_rates([c for c in currencies if c], target)
+    return np.array([rates.get(c, np.nan) if c else np.nan for c in currencies], dtype=np.float64)
@@ -1,82 +1,197 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
-import yfinance as yf
 
+import numpy as np
+from django.conf import settings
 
-def asset_transactions_performance(asset):
+from .fx import conversion_factors
+from .lots import FIFO
+from .models import AssetTransaction
+from .pricing import get_quote, get_quotes
+from .snapshot import get_snapshot
+
+ZERO = Decimal('0')
+
+
+def current_price(symbol):
+    """Precio actual de mercado del símbolo (Decimal) o None si no está disponible."""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        prices, _, _ = snapshot.lookup([symbol], max_age=settings.MARKET_SNAPSHOT_MAX_AGE)
+        if not np.isnan(prices[0]):
+            return Decimal(str(prices[0]))
+    quote = get_quote(symbol)
+    if quote is None:
+        return None
+    return Decimal(str(quote['price']))
+
+
+def open_quantities(asset, transactions):
+    """Cantidad aún abierta de cada compra (tx.id -> cantidad), tras las ventas posteriores.
+
+    En FIFO es el remaining_quantity de su lote (sin lote: agotada). Con costo promedio
+    las compras no tienen lote: cada venta cierra la misma fracción de todas las abiertas.
+    """
+    if asset.portfolio.cost_basis_method == FIFO:
+        lots = {lot.transaction_id: lot.remaining_quantity for lot in asset.lots.all()}
+        return {tx.id: lots.get(tx.id, ZERO) for tx in transactions if tx.side == AssetTransaction.Side.BUY}
+    # Cantidad abierta = cantidad / escala al comprar * escala actual: O(1) por venta.
+    closed = {}
+    base = {}
+    scale = Decimal('1')
+    position = ZERO
+    for tx in transactions:
+        if tx.side == AssetTransaction.Side.BUY:
+            base[tx.id] = tx.quantity / scale
+            position += tx.quantity
+            continue
+        if position <= 0:
+            continue
+        left = max(position - tx.quantity, ZERO)
+        if left == 0:
+            closed.update(dict.fromkeys(base, ZERO))
+            base, scale = {}, Decimal('1')
+        else:
+            scale *= left / position
+        position = left
+    return {**closed, **{tx_id: quantity * scale for tx_id, quantity in base.items()}}
+
+
+def asset_transactions_performance(asset, actual_price=None):
     """
     Calcula el rendimiento individual de cada transacción de un asset.
-    Retorna lista de dicts con: buy_price, quantity, actual_price, profit_loss, performance_pct.
+    Compras: buy_price, quantity, remaining_quantity (aún abierta), actual_price,
+    profit_loss (no realizada, sobre la cantidad abierta), performance_pct.
+    Ventas: sell_price, quantity, actual_price, profit_loss (realizada), performance_pct.
     Todos los valores numéricos con máx 2 decimales.
     """
-    transactions = asset.transactions.order_by('created_at')
-    if not transactions.exists():
+    # all() reutiliza las transacciones prefetched (retrieve); se ordenan en memoria.
+    transactions = sorted(asset.transactions.all(), key=lambda tx: (tx.created_at, tx.id))
+    if not transactions:
         return []
-    symbol = asset.symbol
     try:
-        ticker = yf.Ticker(symbol)
-        info = getattr(ticker, 'info', {}) or {}
-        actual_price = info.get('regularMarketPrice')
-        if actual_price is None:
-            fast_info = getattr(ticker, 'fast_info', None)
-            if fast_info:
-                actual_price = getattr(fast_info, 'lastPrice', None) or getattr(fast_info, 'last_price', None)
-        if actual_price is None:
+        actual_price_dec = actual_price if actual_price is not None else current_price(asset.symbol)
+        if actual_price_dec is None:
             return []
-        actual_price_dec = Decimal(actual_price)
+        open_quantity = open_quantities(asset, transactions)
         results = []
         for tx in transactions:
-            buy_price = Decimal(tx.price)
+            price = Decimal(tx.price)
             quantity = Decimal(tx.quantity)
-            profit_loss = (actual_price_dec - buy_price) * quantity
-            performance_pct = (actual_price_dec - buy_price) / buy_price * 100 if buy_price != 0 else Decimal('0')
-            results.append({
-                'buy_price': float(round(buy_price, 2)),
+            if tx.side == AssetTransaction.Side.SELL:
+                profit_loss = Decimal(tx.realized_profit_loss or 0)
+                cost = quantity * price - profit_loss
+                performance_pct = profit_loss / cost * 100 if cost != 0 else Decimal('0')
+                price_key = 'sell_price'
+            else:
+                profit_loss = (actual_price_dec - price) * Decimal(open_quantity[tx.id])
+                performance_pct = (actual_price_dec - price) / price * 100 if price != 0 else Decimal('0')
+                price_key = 'buy_price'
+            row = {
+                'side': tx.side,
+                price_key: float(round(price, 2)),
                 'quantity': float(round(quantity, 2)),
                 'actual_price': float(round(actual_price_dec, 2)),
                 'profit_loss': float(round(profit_loss, 2)),
                 'performance_pct': float(round(performance_pct, 2)),
-            })
+            }
+            if tx.side == AssetTransaction.Side.BUY:
+                row['remaining_quantity'] = float(round(open_quantity[tx.id], 2))
+            results.append(row)
         return results
     except Exception:
         return []
 
-def asset_weighted_performance(asset):
+def portfolio_performance(assets, currency=None, with_transactions=True):
     """
-    Calcula métricas usando los valores registrados de assets.
-    Retorna dict: symbol, total_quantity, total_cost, actual_value, total_profit_loss, performance, transactions.
-    Valores con máximo 2 decimales. performance = (ganancia_total / costo_total) * 100.
+    Calcula las métricas de varios assets convirtiéndolas a `currency`.
+    Retorna dict asset.id -> métricas de asset_weighted_performance, más 'currency' (divisa de
+    cotización), 'fx_rate' y 'stale' (último precio conocido, pendiente de refresco).
+    Los precios se leen primero del snapshot compartido (mmap) y sólo los que faltan se
+    piden a la capa de precios; cotizaciones y tipos de cambio van por lotes y la
+    conversión es una única multiplicación vectorizada sobre el array de precios.
+    Sin `currency` cada asset se valora en su propia divisa. Las filas por transacción
+    se mantienen en la divisa de cotización; with_transactions=False las omite.
     """
-    tx_perf = asset_transactions_performance(asset)
-    if not tx_perf:
-        return {
-            'symbol': asset.symbol,
-            'error': 'No hay transacciones o precio actual.'
-        }
-    from decimal import Decimal as D
-    total_cost = D('0')
-    actual_value = D('0')
-    total_quantity = D('0')
-    for row in tx_perf:
-        buy_price = D(str(row['buy_price']))
-        quantity = D(str(row['quantity']))
-        actual_price = D(str(row['actual_price']))
-        total_cost += buy_price * quantity
-        actual_value += actual_price * quantity
-        total_quantity += quantity
-    if total_cost == 0:
-        return {
+    assets = list(assets)
+    if not assets:
+        return {}
+    symbols = [asset.symbol for asset in assets]
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        prices, quote_currencies, _ = snapshot.lookup(symbols, max_age=settings.MARKET_SNAPSHOT_MAX_AGE)
+    else:
+        prices, quote_currencies = np.full(len(assets), np.nan), [None] * len(assets)
+    stale = np.zeros(len(assets), dtype=bool)
+    missing = [i for i in range(len(assets)) if np.isnan(prices[i])]
+    if missing:
+        quotes = get_quotes([symbols[i] for i in missing])
+        for i in missing:
+            quote = quotes.get(symbols[i])
+            if quote is not None:
+                prices[i] = quote['price']
+                quote_currencies[i] = quote.get('currency')
+                stale[i] = bool(quote.get('stale'))
+    if currency:
+        # Sin divisa de cotización se asume la divisa base del portfolio del asset.
+        factors = conversion_factors(
+            [code or asset.portfolio.base_currency for code, asset in zip(quote_currencies, assets)], currency,
+        )
+    else:
+        factors = np.ones(len(assets))
+    quantities = np.array([float(asset.quantity) for asset in assets])
+    average_prices = np.array([float(asset.average_price) for asset in assets])
+    realized = np.array([float(asset.realized_profit_loss) for asset in assets])
+
+    total_cost = quantities * average_prices * factors
+    actual_value = quantities * prices * factors
+    total_profit_loss = actual_value - total_cost
+    realized = realized * factors
+    with np.errstate(divide='ignore', invalid='ignore'):
+        performance = np.where(total_cost > 0, total_profit_loss / total_cost * 100, 0.0)
+
+    results = {}
+    for i, asset in enumerate(assets):
+        if np.isnan(prices[i]):
+            tx_perf = []
+        elif with_transactions:
+            tx_perf = asset_transactions_performance(asset, Decimal(str(prices[i])))
+        else:
+            tx_perf = None
+        if tx_perf == []:
+            results[asset.id] = {
+                'symbol': asset.symbol,
+                'error': 'No hay transacciones o precio actual.'
+            }
+            continue
+        if np.isnan(factors[i]):
+            results[asset.id] = {
+                'symbol': asset.symbol,
+                'error': f'Tipo de cambio {quote_currencies[i]}/{currency} no disponible.'
+            }
+            continue
+        results[asset.id] = {
             'symbol': asset.symbol,
-            'error': 'Costo total es cero.'
+            'currency': quote_currencies[i],
+            'fx_rate': round(float(factors[i]), 6),
+            'stale': bool(stale[i]),
+            'total_quantity': round(float(quantities[i]), 2),
+            'total_cost': round(float(total_cost[i]), 2),
+            'actual_value': round(float(actual_value[i]), 2),
+            'total_profit_loss': round(float(total_profit_loss[i]), 2),
+            'realized_profit_loss': round(float(realized[i]), 2),
+            'performance': round(float(performance[i]), 2),
         }
-    total_profit_loss = actual_value - total_cost
-    performance = (total_profit_loss / total_cost) * 100
-    return {
-        'symbol': asset.symbol,
-        'total_quantity': float(round(total_quantity, 2)),
-        'total_cost': float(round(total_cost, 2)),
-        'actual_value': float(round(actual_value, 2)),
-        'total_profit_loss': float(round(total_profit_loss, 2)),
-        'performance': float(round(performance, 2)),
-        'transactions': tx_perf
-    }
+        if tx_perf is not None:
+            results[asset.id]['transactions'] = tx_perf
+    return results
+
+
+def asset_weighted_performance(asset, currency=None):
+    """
+    Calcula métricas a partir de la posición abierta persistida en el asset (motor de lotes).
+    Retorna dict: symbol, total_quantity, total_cost, actual_value, total_profit_loss (no realizada),
+    realized_profit_loss, performance, transactions.
+    Valores con máximo 2 decimales. performance = (ganancia_no_realizada / costo_abierto) * 100.
+    """
+    return portfolio_performance([asset], currency)[asset.id]
@@ -0,0 +1,71 @@
+"""
+Historial diario de precios almacenado en DailyPrice.
+
+Los huecos se completan con una única descarga por lote para todos los símbolos que
+lo necesitan; el comando `sync_prices` mantiene al día los símbolos en cartera para
+que las peticiones no tengan que esperar a Yahoo Finance.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import DailyPrice
+from .pricing import get_histories
+
+logger = logging.getLogger(__name__)
+
+SYNC_MARKER_PREFIX = 'history:synced:'
+SYNC_MARKER_TTL = 6 * 3600
+# Margen para fines de semana/festivos antes de considerar desactualizada una serie.
+STALE_AFTER = timedelta(days=3)
+GAP_TOLERANCE = timedelta(days=7)
+
+
+def sync_daily_prices(symbols, start):
+    """Descarga y guarda los cierres que faltan desde `start` para `symbols`.
+
+    Devuelve el número de filas nuevas. Cada símbolo se revisa como mucho una vez
+    cada SYNC_MARKER_TTL segundos (evita reintentar símbolos sin más historial).
+    """
+    today = timezone.now().date()
+    markers = {symbol: f'{SYNC_MARKER_PREFIX}{symbol}:{start}' for symbol in symbols}
+    # Los símbolos revisados recientemente no vuelven a consultar la cobertura.
+    recent = cache.get_many(list(markers.values()))
+    symbols = [symbol for symbol in symbols if markers[symbol] not in recent]
+    if not symbols:
+        return 0
+    cache.set_many({markers[symbol]: True for symbol in symbols}, SYNC_MARKER_TTL)
+    coverage = {
+        row['symbol']: row
+        for row in DailyPrice.objects.filter(symbol__in=symbols)
+        .values('symbol')
+        .annotate(first=Min('date'), last=Max('date'))
+    }
+    pending = {}
+    for symbol in symbols:
+        row = coverage.get(symbol)
+        if row is None or row['first'] > start + GAP_TOLERANCE:
+            pending[symbol] = start
+        elif row['last'] < today - STALE_AFTER:
+            pending[symbol] = row['last']
+    if not pending:
+        return 0
+    try:
+        histories = get_histories(list(pending), start=min(pending.values()))
+    except Exception:
+        logger.warning('Daily price download failed for %s', ', '.join(pending), exc_info=True)
+        cache.delete_many([markers[s] for s in pending])
+        return 0
+    # Los días ya guardados (el rango first..last de cada símbolo) no se reinsertan: así el
+    # recuento devuelto son filas nuevas y no cierres descargados.
+    rows = [
+        DailyPrice(symbol=symbol, date=ts.date(), close=float(close))
+        for symbol, series in histories.items()
+        for ts, close in series.items()
+        if symbol not in coverage or not coverage[symbol]['first'] <= ts.date() <= coverage[symbol]['last']
+    ]
+    created = DailyPrice.objects.bulk_create(rows, batch_size=5000, ignore_conflicts=True)
+    return len(created)
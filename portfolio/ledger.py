@@ -0,0 +1,146 @@
+"""
+Particionado opcional del ledger (AssetTransaction) por rango de created_at en PostgreSQL.
+
+La tabla se reconstruye como tabla particionada con una partición por año más una
+partición DEFAULT, conservando filas, índices, el FK a Asset y la secuencia de ids.
+Restricciones de PostgreSQL que condicionan el diseño:
+  - la clave primaria de una tabla particionada debe incluir la clave de partición,
+    así que pasa a ser (id, created_at); los ids siguen saliendo de una secuencia;
+  - sin un UNIQUE sobre id no puede haber FKs que apunten a la tabla: el FK de
+    AssetLot.transaction se elimina y la integridad la mantiene la aplicación (los
+    lotes se crean en la misma transacción que su compra y Django emula el CASCADE).
+
+Se activa con LEDGER_PARTITIONING=True antes de migrar o, más tarde, con
+`manage.py partition_ledger`; `partition_ledger --ensure` crea las particiones de los
+próximos años.
+
+Los nombres de tabla salen del registro de modelos `apps`: la migración pasa el suyo
+(modelos históricos) y el resto del código usa el registro actual.
+"""
+from django.apps import apps as global_apps
+from django.utils import timezone
+
+
+def _tables(apps=None):
+    """(tabla del ledger, tabla de lotes) según el registro de modelos `apps`."""
+    apps = apps or global_apps
+    return (
+        apps.get_model('portfolio', 'AssetTransaction')._meta.db_table,
+        apps.get_model('portfolio', 'AssetLot')._meta.db_table,
+    )
+
+
+def is_supported(connection):
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(connection, apps=None):
+    table, _ = _tables(apps)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def ensure_partitions(connection, years_ahead=2, source=None, first_year=None, apps=None):
+    """Crea las particiones anuales que falten hasta el año actual + `years_ahead`.
+
+    Los años se cubren desde el menor entre `first_year` y el de la primera fila de
+    `source` (o desde el año actual). Una partición para un año que ya tenga filas en DEFAULT
+    falla: por eso se crean por adelantado (también antes de importar histórico).
+    """
+    table, _ = _tables(apps)
+    source = source or table
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT EXTRACT(YEAR FROM MIN(created_at))::int FROM {qn(source)}')
+        starts = [year for year in (first_year, cursor.fetchone()[0]) if year is not None]
+        current_year = timezone.now().year
+        created = []
+        for year in range(min(starts, default=current_year), current_year + years_ahead + 1):
+            name = f'{table}_y{year}'
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is not None:
+                continue
+            cursor.execute(
+                f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} '
+                f"FOR VALUES FROM ('{year}-01-01 00:00:00+00') TO ('{year + 1}-01-01 00:00:00+00')"
+            )
+            created.append(name)
+        cursor.execute('SELECT to_regclass(%s)', [f'{table}_default'])
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f'CREATE TABLE {qn(table + "_default")} PARTITION OF {qn(table)} DEFAULT')
+            created.append(f'{table}_default')
+    return created
+
+
+def _rebuild(connection, partitioned, apps=None):
+    """Copia el ledger a una tabla nueva (particionada o no) y la pone en su lugar."""
+    table, lot_table = _tables(apps)
+    qn = connection.ops.quote_name
+    old = f'{table}_rebuild_old'
+    seq = f'{table}_id_seq'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN "
+            "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p')",
+            [table, table],
+        )
+        # Las definiciones mencionan el nombre final de la tabla: valen para la nueva.
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old)}')
+        cursor.execute(f'ALTER TABLE {qn(old)} RENAME CONSTRAINT {qn(table + "_pkey")} TO {qn(old + "_pkey")}')
+        cursor.execute(f'CREATE SEQUENCE {qn(seq + "_new")}')
+        cursor.execute(
+            f'CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+            + (' PARTITION BY RANGE (created_at)' if partitioned else '')
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval('{seq}_new')")
+        primary_key = '(id, created_at)' if partitioned else '(id)'
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(table + "_pkey")} PRIMARY KEY {primary_key}')
+
+    if partitioned:
+        # Antes de copiar: las filas van directamente a su partición anual.
+        ensure_partitions(connection, source=old, apps=apps)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(old)}')
+        cursor.execute(f"SELECT setval('{seq}_new', COALESCE((SELECT MAX(id) FROM {qn(table)}), 0) + 1, false)")
+        # CASCADE elimina el FK de los lotes hacia la tabla antigua (y su secuencia).
+        cursor.execute(f'DROP TABLE {qn(old)} CASCADE')
+        cursor.execute(f'DROP SEQUENCE IF EXISTS {qn(seq)}')
+        cursor.execute(f'ALTER SEQUENCE {qn(seq + "_new")} RENAME TO {qn(seq)}')
+        cursor.execute(f'ALTER SEQUENCE {qn(seq)} OWNED BY {qn(table)}.id')
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+        if not partitioned:
+            cursor.execute(
+                f'ALTER TABLE {qn(lot_table)} ADD CONSTRAINT {qn(lot_table + "_transaction_id_fk")} '
+                f'FOREIGN KEY (transaction_id) REFERENCES {qn(table)} (id) DEFERRABLE INITIALLY DEFERRED'
+            )
+        cursor.execute(f'ANALYZE {qn(table)}')
+
+
+def partition(connection, apps=None):
+    """Convierte el ledger en tabla particionada por año (no-op si ya lo está)."""
+    if not is_supported(connection) or is_partitioned(connection, apps):
+        return False
+    _rebuild(connection, partitioned=True, apps=apps)
+    return True
+
+
+def unpartition(connection, apps=None):
+    """Vuelve a una tabla normal y restaura el FK de AssetLot (no-op si no está particionada)."""
+    if not is_supported(connection) or not is_partitioned(connection, apps):
+        return False
+    _rebuild(connection, partitioned=False, apps=apps)
+    return True
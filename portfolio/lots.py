@@ -0,0 +1,131 @@
+"""
+Motor de asignación de lotes (FIFO / costo promedio).
+
+El estado abierto se persiste (Asset.quantity/average_price y AssetLot), de modo que
+cada transacción lo actualiza de forma incremental:
+  - compra: O(1) (un lote nuevo en FIFO),
+  - venta: O(log n) para localizar el lote abierto más antiguo por índice más O(1)
+    amortizado por lote agotado.
+La reproducción completa del ledger (`rebuild_position`) sólo se usa para reconstruir
+el estado, p. ej. al cambiar el método del portfolio.
+"""
+from collections import deque
+from decimal import Decimal
+
+from django.db.models import F, Sum
+
+from .models import AssetLot, AssetTransaction, Portfolio
+
+FIFO = Portfolio.CostBasisMethod.FIFO
+ZERO = Decimal('0')
+
+
+def open_lots(transactions):
+    """Crea los lotes de un conjunto de compras ya guardadas (portfolios FIFO)."""
+    lots = [
+        AssetLot(asset_id=tx.asset_id, transaction=tx, price=tx.price, remaining_quantity=tx.quantity)
+        for tx in transactions
+    ]
+    return AssetLot.objects.bulk_create(lots)
+
+
+def consume_lots(asset, quantity):
+    """Consume `quantity` de los lotes abiertos más antiguos y devuelve el costo retirado.
+
+    Debe llamarse con la fila del asset bloqueada.
+    """
+    remaining = quantity
+    cost = ZERO
+    consumed = []
+    for lot in asset.lots.filter(remaining_quantity__gt=0).order_by('id').iterator(chunk_size=100):
+        take = min(lot.remaining_quantity, remaining)
+        lot.remaining_quantity -= take
+        cost += take * lot.price
+        consumed.append(lot)
+        remaining -= take
+        if remaining <= 0:
+            break
+    AssetLot.objects.bulk_update(consumed, ['remaining_quantity'])
+    return cost
+
+
+def open_cost(asset):
+    """Costo de los lotes abiertos del asset: base del precio promedio FIFO tras una venta."""
+    return asset.lots.filter(remaining_quantity__gt=0).aggregate(
+        cost=Sum(F('remaining_quantity') * F('price'), default=ZERO),
+    )['cost']
+
+
+def replay(transactions, method):
+    """Reproduce un ledger ordenado y devuelve el estado resultante.
+
+    Retorna dict: quantity, average_price, realized_profit_loss, lots (deque de
+    [transaction, remaining] abiertos) y sells (transacciones de venta con su
+    realized_profit_loss recalculado).
+    """
+    quantity = ZERO
+    cost = ZERO
+    average_price = ZERO
+    realized = ZERO
+    lots = deque()
+    sells = []
+    for tx in transactions:
+        if tx.side == AssetTransaction.Side.BUY:
+            quantity += tx.quantity
+            cost += tx.quantity * tx.price
+            average_price = cost / quantity
+            if method == FIFO:
+                lots.append([tx, tx.quantity])
+            continue
+        if method == FIFO:
+            removed = ZERO
+            remaining = tx.quantity
+            while remaining > 0 and lots:
+                lot = lots[0]
+                take = min(lot[1], remaining)
+                removed += take * lot[0].price
+                lot[1] -= take
+                remaining -= take
+                if lot[1] <= 0:
+                    lots.popleft()
+        else:
+            removed = tx.quantity * average_price
+        tx.realized_profit_loss = tx.quantity * tx.price - removed
+        realized += tx.realized_profit_loss
+        sells.append(tx)
+        quantity -= tx.quantity
+        cost -= removed
+        if quantity > 0:
+            average_price = cost / quantity
+    return {
+        'quantity': quantity,
+        'average_price': average_price,
+        'realized_profit_loss': realized,
+        'lots': lots,
+        'sells': sells,
+    }
+
+
+def rebuild_position(asset, method=None, save=True):
+    """Reconstruye quantity, average_price, realized P&L y lotes desde el ledger.
+
+    Debe llamarse dentro de una transacción con la fila del asset bloqueada. Con
+    `save=False` sólo asigna los campos del asset (el llamador los guarda en bloque).
+    """
+    method = method or asset.portfolio.cost_basis_method
+    transactions = asset.transactions.order_by('created_at', 'id')
+    state = replay(transactions.iterator(chunk_size=2000), method)
+    AssetTransaction.objects.bulk_update(state['sells'], ['realized_profit_loss'], batch_size=1000)
+    asset.lots.all().delete()
+    if method == FIFO:
+        AssetLot.objects.bulk_create([
+            AssetLot(asset=asset, transaction=tx, price=tx.price, remaining_quantity=remaining)
+            for tx, remaining in state['lots']
+        ], batch_size=1000)
+    asset.quantity = state['quantity']
+    if state['average_price'] > 0:
+        asset.average_price = state['average_price']
+    asset.realized_profit_loss = state['realized_profit_loss']
+    if save:
+        asset.save(update_fields=['quantity', 'average_price', 'realized_profit_loss'])
+    return asset
@@ -0,0 +1,87 @@
+import random
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolio.alerts import AlertIndex
+from portfolio.models import PriceAlert
+
+ABOVE = PriceAlert.Direction.ABOVE
+BELOW = PriceAlert.Direction.BELOW
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el índice de alertas en memoria con alertas sintéticas (por defecto 1M): construcción, '
+        'memoria y latencia por refresco de cotizaciones, frente a recorrer todas las alertas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alerts', type=int, default=1_000_000)
+        parser.add_argument('--symbols', type=int, default=5000)
+        parser.add_argument('--ticks', type=int, default=2000, help='Refrescos de cotizaciones simulados.')
+        parser.add_argument('--batch', type=int, default=50, help='Símbolos por refresco.')
+        parser.add_argument('--volatility', type=float, default=0.01, help='Desviación del paseo aleatorio por tick.')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        n, n_symbols = options['alerts'], options['symbols']
+        symbols = np.array([f'SYM{i}' for i in range(n_symbols)])
+        base = rng.uniform(5, 500, n_symbols)
+        alert_symbols = rng.integers(0, n_symbols, n)
+        above = rng.random(n) < 0.5
+        # Umbrales a ±1-30% del precio inicial, en el lado que corresponde a su dirección.
+        distance = rng.uniform(0.01, 0.30, n)
+        triggers = np.round(base[alert_symbols] * np.where(above, 1 + distance, 1 - distance), 4)
+        directions = np.where(above, ABOVE, BELOW)
+
+        started = time.perf_counter()
+        index = AlertIndex()
+        index.load(zip(range(n), symbols[alert_symbols].tolist(), directions.tolist(), triggers.tolist()))
+        build = time.perf_counter() - started
+        try:
+            import resource
+            rss = f', peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB'
+        except ImportError:  # pragma: no cover - Windows
+            rss = ''
+        self.stdout.write(f'Index of {n:,} alerts over {n_symbols:,} symbols built in {build:.2f}s{rss}')
+
+        # Referencia: un recorrido vectorizado de todas las alertas activas en cada refresco.
+        active = np.ones(n, dtype=bool)
+        prices = base.copy()
+        random.seed(options['seed'])
+        index_times, scan_times = [], []
+        fired_total = 0
+        for _ in range(options['ticks']):
+            batch = np.array(random.sample(range(n_symbols), options['batch']))
+            prices[batch] *= np.exp(rng.normal(0, options['volatility'], len(batch)))
+            quotes = dict(zip(symbols[batch].tolist(), prices[batch].tolist()))
+
+            started = time.perf_counter()
+            fired = index.crossed(quotes)
+            index_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            tick = np.full(n_symbols, np.nan)
+            tick[batch] = prices[batch]
+            current = tick[alert_symbols]
+            hit = active & ~np.isnan(current) & np.where(above, current >= triggers, current <= triggers)
+            scanned = np.flatnonzero(hit)
+            active[scanned] = False
+            scan_times.append(time.perf_counter() - started)
+
+            if set(fired) != set(scanned.tolist()):
+                raise CommandError('Index and full scan disagree on the fired alerts.')
+            fired_total += len(fired)
+
+        def describe(times):
+            ms = sorted(t * 1000 for t in times)
+            return f'median {statistics.median(ms):.3f} ms, p99 {ms[int(len(ms) * 0.99) - 1]:.3f} ms'
+
+        self.stdout.write(f"{options['ticks']:,} refreshes of {options['batch']} symbols, {fired_total:,} alerts fired")
+        self.stdout.write(f'  sorted index: {describe(index_times)}')
+        self.stdout.write(f'  full scan:    {describe(scan_times)}')
+        self.stdout.write(self.style.SUCCESS(f'{len(index):,} alerts still armed; both strategies fired the same alerts'))
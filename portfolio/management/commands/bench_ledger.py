@@ -0,0 +1,159 @@
+import json
+import statistics
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from portfolio import ledger
+from portfolio.models import Asset, AssetTransaction, Portfolio
+
+TX_TABLE = AssetTransaction._meta.db_table
+
+QUERIES = {
+    # Agregado de posición de un asset: index-only scan sobre el índice cubriente.
+    'position_aggregate': (
+        f'SELECT side, SUM(quantity), SUM(quantity * price), SUM(realized_profit_loss) '
+        f'FROM {TX_TABLE} WHERE asset_id = %(asset)s GROUP BY side'
+    ),
+    # Agregado de un portfolio completo (dashboard / reconciliación por lotes).
+    'portfolio_aggregate': (
+        f'SELECT asset_id, side, SUM(quantity), SUM(quantity * price) '
+        f'FROM {TX_TABLE} WHERE asset_id = ANY(%(assets)s) GROUP BY asset_id, side'
+    ),
+    # Página del ledger ya ordenada por el índice: sin nodo Sort.
+    'ledger_page': (
+        f'SELECT * FROM {TX_TABLE} WHERE asset_id = %(asset)s ORDER BY created_at DESC LIMIT 50'
+    ),
+    # Ventana reciente: con particiones, sólo se visita la partición del año en curso.
+    'recent_window': (
+        f'SELECT COUNT(*), SUM(quantity * price) FROM {TX_TABLE} '
+        f"WHERE asset_id = %(asset)s AND created_at >= now() - interval '30 days'"
+    ),
+}
+FULL_SCAN = (
+    f'SELECT asset_id, side, SUM(quantity), SUM(quantity * price) FROM {TX_TABLE} GROUP BY asset_id, side'
+)
+
+
+def _nodes(plan):
+    """Nodos del plan en preorden; los hijos de un Append se resumen por tipo (uno por partición)."""
+    label = plan['Node Type']
+    if plan.get('Index Name'):
+        label += f" on {plan['Index Name']}"
+    elif plan.get('Relation Name'):
+        label += f" on {plan['Relation Name']}"
+    children = plan.get('Plans', [])
+    if plan['Node Type'] in ('Append', 'Merge Append') and children:
+        counts = Counter(child['Node Type'] for child in children)
+        return [f"{label} [{', '.join(f'{n} x {node}' for node, n in counts.items())}]"]
+    nodes = [label]
+    for child in children:
+        nodes.extend(_nodes(child))
+    return nodes
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera un ledger sintético en PostgreSQL (por defecto 1M transacciones; --rows 10000000 '
+        'para el escenario de 10M) y muestra planes y tiempos de las consultas típicas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--assets', type=int, default=1000)
+        parser.add_argument('--years', type=int, default=3, help='Años sobre los que se reparten las fechas.')
+        parser.add_argument('--repeat', type=int, default=20, help='Ejecuciones por consulta (se reporta la mediana).')
+        parser.add_argument('--full-scan', action='store_true', help='Incluye el agregado sobre todo el ledger.')
+        parser.add_argument('--keep', action='store_true', help='No borra los datos generados.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('bench_ledger requires PostgreSQL.')
+        user = get_user_model().objects.create_user(username=f'bench-{uuid.uuid4().hex[:12]}')
+        portfolio = Portfolio.objects.create(owner=user, name='bench-ledger')
+        Asset.objects.bulk_create(
+            [Asset(portfolio=portfolio, symbol=f'BENCH{i}', quantity=0, average_price=0) for i in range(options['assets'])],
+            batch_size=5000,
+        )
+        asset_ids = list(Asset.objects.filter(portfolio=portfolio).values_list('id', flat=True))
+        try:
+            self._generate(asset_ids, options['rows'], options['years'])
+            self.stdout.write(
+                f"Layout: {'partitioned by year' if ledger.is_partitioned(connection) else 'single table'}, "
+                f'{self._table_rows():,} rows in {TX_TABLE}'
+            )
+            params = {'asset': asset_ids[len(asset_ids) // 2], 'assets': asset_ids[:50]}
+            queries = dict(QUERIES)
+            if options['full_scan']:
+                queries['full_aggregate'] = FULL_SCAN
+            for name, sql in queries.items():
+                self._report(name, sql, params, options['repeat'] if name != 'full_aggregate' else 3)
+        finally:
+            if not options['keep']:
+                with connection.cursor() as cursor:
+                    # Borrado directo: el CASCADE emulado por Django cargaría millones de ids.
+                    cursor.execute(f'DELETE FROM {TX_TABLE} WHERE asset_id = ANY(%s)', [asset_ids])
+                user.delete()
+
+    def _generate(self, asset_ids, rows, years):
+        started = time.perf_counter()
+        if ledger.is_partitioned(connection):
+            ledger.ensure_partitions(connection, first_year=timezone.now().year - years)
+        chunk = 1_000_000
+        with connection.cursor() as cursor:
+            for offset in range(0, rows, chunk):
+                cursor.execute(
+                    f'''
+                    INSERT INTO {TX_TABLE} (asset_id, quantity, price, side, realized_profit_loss, created_at)
+                    SELECT ids[1 + g %% cardinality(ids)],
+                           (1 + g %% 10)::numeric(20, 4),
+                           (10 + (g %% 5000) / 100.0)::numeric(20, 4),
+                           CASE WHEN g %% 5 = 0 THEN 'SELL' ELSE 'BUY' END,
+                           CASE WHEN g %% 5 = 0 THEN ((g %% 100) - 50)::numeric(20, 4) END,
+                           now() - random() * (%s * interval '365 days')
+                    FROM generate_series(%s, %s) AS g, (SELECT %s::bigint[] AS ids) AS a
+                    ''',
+                    [years, offset + 1, min(offset + chunk, rows), asset_ids],
+                )
+            # VACUUM actualiza el visibility map: sin él no hay index-only scans.
+            cursor.execute(f'VACUUM ANALYZE {TX_TABLE}')
+        self.stdout.write(f'Generated {rows:,} transactions in {time.perf_counter() - started:.1f}s')
+
+    def _table_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {TX_TABLE}')
+            return cursor.fetchone()[0]
+
+    def _report(self, name, sql, params, repeat):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+            result = cursor.fetchone()[0]
+            explain = (json.loads(result) if isinstance(result, str) else result)[0]
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+        plan = explain['Plan']
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(f'  plan: {" -> ".join(_nodes(plan))}')
+        self.stdout.write(
+            f"  buffers: hit={plan.get('Shared Hit Blocks', 0)} read={plan.get('Shared Read Blocks', 0)}"
+            f"  heap fetches: {sum(self._collect(plan, 'Heap Fetches'))}"
+            f"  pruned partitions: {sum(self._collect(plan, 'Subplans Removed'))}"
+        )
+        self.stdout.write(
+            f"  execution: {explain['Execution Time']:.2f} ms (EXPLAIN), "
+            f'median {statistics.median(timings):.2f} ms over {repeat} runs'
+        )
+
+    def _collect(self, plan, key):
+        yield plan.get(key, 0)
+        for child in plan.get('Plans', []):
+            yield from self._collect(child, key)
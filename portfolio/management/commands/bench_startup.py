@@ -0,0 +1,81 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Se ejecuta en un intérprete limpio: mide lo que paga un worker recién arrancado.
+PROBE = r'''
+import importlib, json, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+t1 = time.perf_counter()
+importlib.import_module(sys.argv[1])
+t2 = time.perf_counter()
+try:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+except ImportError:  # pragma: no cover - Windows
+    rss_kb = None
+print(json.dumps({
+    'setup': t1 - t0,
+    'urls': t2 - t1,
+    'rss_mb': rss_kb / 1024 if rss_kb is not None else None,
+    'modules': sorted(m for m in sys.argv[2].split(',') if m and m in sys.modules),
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el arranque de un worker (django.setup() + carga de las URLs): tiempo de import '
+        'y RSS, y falla si se superan los límites o se cargan librerías de mercado al arrancar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Arranques medidos (se reporta la mediana).')
+        parser.add_argument('--max-seconds', type=float, default=None, help='Límite de setup + URLs en segundos.')
+        parser.add_argument('--max-rss-mb', type=float, default=None, help='Límite de RSS tras el arranque.')
+        parser.add_argument(
+            '--forbid', default='yfinance,pandas,numpy',
+            help='Módulos que no deben cargarse al arrancar (separados por comas, vacío para no comprobar).',
+        )
+
+    def _probe(self, forbid):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'investportfolio.settings')}
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, settings.ROOT_URLCONF, forbid],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Startup probe failed:\n{result.stderr}')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        runs = [self._probe(options['forbid']) for _ in range(max(1, options['runs']))]
+        setup = statistics.median(r['setup'] for r in runs)
+        urls = statistics.median(r['urls'] for r in runs)
+        rss = [r['rss_mb'] for r in runs if r['rss_mb'] is not None]
+        rss_mb = statistics.median(rss) if rss else None
+        loaded = sorted({m for r in runs for m in r['modules']})
+
+        self.stdout.write(
+            f'django.setup(): {setup * 1000:.0f} ms, urls: {urls * 1000:.0f} ms, '
+            f'total: {(setup + urls) * 1000:.0f} ms, RSS: '
+            + (f'{rss_mb:.1f} MB' if rss_mb is not None else 'n/a')
+            + f' (median of {len(runs)} runs)'
+        )
+        failures = []
+        if loaded:
+            failures.append(f'modules loaded at startup: {", ".join(loaded)}')
+        if options['max_seconds'] is not None and setup + urls > options['max_seconds']:
+            failures.append(f'startup {setup + urls:.3f}s > {options["max_seconds"]}s')
+        if options['max_rss_mb'] is not None and rss_mb is not None and rss_mb > options['max_rss_mb']:
+            failures.append(f'RSS {rss_mb:.1f} MB > {options["max_rss_mb"]} MB')
+        if failures:
+            raise CommandError('Startup regression: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('OK'))
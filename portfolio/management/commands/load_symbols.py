@@ -0,0 +1,67 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from portfolio.catalogue import bump_version
+from portfolio.models import Symbol
+
+COLUMNS = {
+    'ticker': ('ticker', 'symbol'),
+    'name': ('name', 'description'),
+    'exchange': ('exchange',),
+    'currency': ('currency',),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga el catálogo de símbolos desde un CSV con cabecera (ticker/symbol, name, exchange, '
+        'currency). Inserta o actualiza por ticker en lotes; --replace borra los que no aparecen.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--replace', action='store_true', help='Elimina los símbolos que no están en el fichero.')
+
+    def handle(self, *args, **options):
+        with open(options['csv_path'], newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f, delimiter=options['delimiter'])
+            headers = {h.strip().lower(): h for h in reader.fieldnames or []}
+            columns = {}
+            for field, aliases in COLUMNS.items():
+                columns[field] = next((headers[a] for a in aliases if a in headers), None)
+            if columns['ticker'] is None:
+                raise CommandError('The CSV needs a "ticker" or "symbol" column.')
+            symbols = {}
+            for row in reader:
+                ticker = (row[columns['ticker']] or '').strip().upper()
+                if not ticker or len(ticker) > 20:
+                    continue
+                symbols[ticker] = Symbol(
+                    ticker=ticker,
+                    **{
+                        field: (row[column] or '').strip()[:Symbol._meta.get_field(field).max_length]
+                        for field, column in columns.items()
+                        if field != 'ticker' and column is not None
+                    },
+                )
+
+        update_fields = [field for field, column in columns.items() if field != 'ticker' and column is not None]
+        with transaction.atomic():
+            Symbol.objects.bulk_create(
+                list(symbols.values()),
+                batch_size=options['batch_size'],
+                update_conflicts=bool(update_fields),
+                ignore_conflicts=not update_fields,
+                unique_fields=['ticker'] if update_fields else None,
+                update_fields=update_fields or None,
+            )
+            deleted = 0
+            if options['replace']:
+                deleted, _ = Symbol.objects.exclude(ticker__in=list(symbols)).delete()
+            # En la misma transacción: quien vea la versión nueva ve también los símbolos.
+            bump_version()
+        self.stdout.write(self.style.SUCCESS(f'{len(symbols)} symbols loaded, {deleted} removed'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from portfolio import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        'Particiona por año la tabla de transacciones (PostgreSQL). --ensure crea las particiones '
+        'de los próximos años; --undo vuelve a una tabla sin particionar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--ensure', action='store_true', help='Sólo crea las particiones que falten.')
+        parser.add_argument('--years-ahead', type=int, default=2)
+        parser.add_argument('--from-year', type=int, help='Primer año con partición propia (histórico a importar).')
+        parser.add_argument('--undo', action='store_true')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not ledger.is_supported(connection):
+            raise CommandError('Ledger partitioning requires PostgreSQL.')
+        with transaction.atomic(using=options['database']):
+            if options['undo']:
+                done = ledger.unpartition(connection)
+                self.stdout.write('Ledger unpartitioned.' if done else 'Ledger is not partitioned.')
+                return
+            if options['ensure']:
+                if not ledger.is_partitioned(connection):
+                    raise CommandError('Ledger is not partitioned; run without --ensure first.')
+            elif not ledger.partition(connection):
+                self.stdout.write('Ledger is already partitioned.')
+            created = ledger.ensure_partitions(connection, options['years_ahead'], first_year=options['from_year'])
+        self.stdout.write(self.style.SUCCESS(f'Partitions created: {", ".join(created) or "none"}'))
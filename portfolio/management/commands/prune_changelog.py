@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from portfolio.sync import prune
+
+
+class Command(BaseCommand):
+    help = (
+        'Borra las entradas del change log de sincronización más antiguas que --days (se conserva '
+        'la última de cada usuario). Los clientes con un cursor anterior recibirán una sincronización completa.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SYNC_CHANGELOG_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        deleted = prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} change log entries deleted'))
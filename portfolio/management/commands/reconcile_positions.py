@@ -0,0 +1,180 @@
+import csv
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from portfolio.models import Asset
+from portfolio.reconcile import reconcile_chunk
+
+REPORT_HEADER = ['asset_id', 'symbol', 'field', 'stored', 'expected']
+
+
+def _part(path, index):
+    return f'{path}.{index}'
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path, data):
+    # Escritura atómica: una interrupción nunca deja un checkpoint a medias.
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _init_worker():
+    django.setup()
+
+
+def reconcile_range(index, first_id, last_id, options):
+    """Reconcilia los assets first_id..last_id por chunks, guardando el progreso tras cada uno.
+
+    Devuelve (progreso, muestras de discrepancias). Un chunk ya confirmado cuyo checkpoint
+    no llegó a escribirse se repite al reanudar; como ya está corregido, no cambia nada.
+    """
+    checkpoint = options['checkpoint'] and _part(options['checkpoint'], index)
+    progress = (checkpoint and _read_json(checkpoint)) or {
+        'after_id': first_id - 1, 'assets': 0, 'mismatched_assets': 0, 'mismatches': 0, 'done': False,
+    }
+    samples = []
+    report = open(_part(options['report'], index), 'a', newline='') if options['report'] else None
+    try:
+        writer = report and csv.writer(report)
+        while not progress['done']:
+            after_id, count, mismatches = reconcile_chunk(
+                progress['after_id'], last_id, options['chunk_size'], options['tolerance'], fix=not options['dry_run'],
+            )
+            if after_id is None:
+                progress['done'] = True
+            else:
+                progress['after_id'] = after_id
+                progress['assets'] += count
+                progress['mismatched_assets'] += len({m[0] for m in mismatches})
+                progress['mismatches'] += len(mismatches)
+                samples.extend(mismatches[:max(0, options['show'] - len(samples))])
+                if writer:
+                    writer.writerows(mismatches)
+                    report.flush()
+            if checkpoint:
+                _write_json(checkpoint, progress)
+    finally:
+        if report:
+            report.close()
+        connections.close_all()
+    return progress, samples
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula quantity, average_price y realized_profit_loss de cada asset desde el ledger '
+        '(agregado agrupado por chunks de assets), informa de las discrepancias y las corrige. '
+        'Reanudable con --checkpoint/--resume y paralelizable con --workers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Assets por consulta y bulk_update.')
+        parser.add_argument('--workers', type=int, default=1, help='Procesos en paralelo (uno por rango de ids).')
+        parser.add_argument('--checkpoint', help='Fichero de progreso (se crea uno por rango: <fichero>.<n>).')
+        parser.add_argument('--resume', action='store_true', help='Continúa desde --checkpoint.')
+        parser.add_argument('--dry-run', action='store_true', help='Sólo informa; no modifica los assets.')
+        parser.add_argument('--tolerance', type=Decimal, default=Decimal('0.01'),
+                            help='Diferencia admitida en average_price y realized_profit_loss.')
+        parser.add_argument('--report', help='CSV con todas las discrepancias.')
+        parser.add_argument('--show', type=int, default=20, help='Discrepancias que se muestran por consola.')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        if options['resume'] and not checkpoint:
+            raise CommandError('--resume requires --checkpoint.')
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive.')
+        state = _read_json(checkpoint) if options['resume'] else None
+        if state is None:
+            state = {'ranges': self.id_ranges(options['workers'])}
+            if checkpoint:
+                for index in range(len(state['ranges'])):
+                    if os.path.exists(_part(checkpoint, index)):
+                        os.remove(_part(checkpoint, index))
+                _write_json(checkpoint, state)
+            if options['report']:
+                for index in range(len(state['ranges'])):
+                    if os.path.exists(_part(options['report'], index)):
+                        os.remove(_part(options['report'], index))
+        ranges = state['ranges']
+        if not ranges:
+            self.stdout.write('No assets to reconcile.')
+            return
+
+        job_options = {key: options[key] for key in (
+            'checkpoint', 'report', 'chunk_size', 'tolerance', 'dry_run', 'show',
+        )}
+        started = time.perf_counter()
+        results = []
+        if options['workers'] == 1:
+            for index, (first_id, last_id) in enumerate(ranges):
+                results.append(reconcile_range(index, first_id, last_id, job_options))
+        else:
+            # Los procesos hijos abren sus propias conexiones: no se heredan las del padre.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+                futures = [
+                    executor.submit(reconcile_range, index, first_id, last_id, job_options)
+                    for index, (first_id, last_id) in enumerate(ranges)
+                ]
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    progress = results[-1][0]
+                    self.stdout.write(
+                        f"Range done: {progress['assets']} assets, {progress['mismatched_assets']} mismatched"
+                    )
+
+        elapsed = time.perf_counter() - started
+        assets = sum(progress['assets'] for progress, _ in results)
+        mismatched = sum(progress['mismatched_assets'] for progress, _ in results)
+        samples = [sample for _, batch in results for sample in batch][:options['show']]
+        for asset_id, symbol, field, stored, expected in samples:
+            self.stdout.write(f'  asset {asset_id} {symbol}: {field} stored={stored} expected={expected}')
+        if options['report']:
+            self.merge_reports(options['report'], len(ranges))
+            self.stdout.write(f"Mismatch report written to {options['report']}")
+        action = 'found' if options['dry_run'] else 'fixed'
+        style = self.style.WARNING if mismatched else self.style.SUCCESS
+        self.stdout.write(style(
+            f'{assets} assets reconciled in {elapsed:.1f}s, {mismatched} mismatched assets {action}'
+        ))
+
+    def id_ranges(self, count):
+        """Rangos [primer_id, último_id] con el mismo número de assets cada uno (ntile)."""
+        db = router.db_for_write(Asset)
+        table = connections[db].ops.quote_name(Asset._meta.db_table)
+        with connections[db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT MIN(id), MAX(id) FROM (SELECT id, NTILE(%s) OVER (ORDER BY id) AS bucket FROM {table}) AS t '
+                'GROUP BY bucket ORDER BY 1',
+                [count],
+            )
+            return [list(row) for row in cursor.fetchall()]
+
+    def merge_reports(self, path, count):
+        with open(path, 'w', newline='') as out:
+            out.write(','.join(REPORT_HEADER) + '\n')
+            for index in range(count):
+                part = _part(path, index)
+                if os.path.exists(part):
+                    with open(part) as f:
+                        shutil.copyfileobj(f, out)
+                    os.remove(part)
@@ -0,0 +1,72 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolio.models import Asset
+from portfolio.pricing import fetch_quotes
+from portfolio.snapshot import PriceSnapshot, write_snapshot
+from portfolio.upstream import UpstreamUnavailable
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresca el snapshot de precios compartido (MARKET_SNAPSHOT_PATH) con los símbolos en '
+        'cartera. Debe haber un único refresco por host; los workers lo leen vía mmap.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.MARKET_SNAPSHOT_PATH)
+        parser.add_argument('--interval', type=float, default=settings.MARKET_SNAPSHOT_INTERVAL)
+        parser.add_argument('--once', action='store_true', help='Un solo refresco y salir.')
+        parser.add_argument('--batch-size', type=int, default=settings.MARKET_QUOTES_MAX_SYMBOLS)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError('Set MARKET_SNAPSHOT_PATH or pass --path.')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(f'{path}.lock', 'w') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise CommandError(f'Another refresher is already writing {path}.')
+            while True:
+                self.refresh(path, options['batch_size'])
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+    def refresh(self, path, batch_size):
+        started = time.perf_counter()
+        held = set(Asset.objects.filter(quantity__gt=0).values_list('symbol', flat=True).distinct())
+        symbols = sorted(held)
+        # Las entradas que no se consigan refrescar conservan su precio y su antigüedad:
+        # los lectores descartan las que superan MARKET_SNAPSHOT_MAX_AGE.
+        previous = PriceSnapshot(path).quotes()
+        quotes = {symbol: quote for symbol, (quote, _) in previous.items() if symbol in held}
+        timestamps = {symbol: stamp for symbol, (_, stamp) in previous.items()}
+        failed = 0
+        for i in range(0, len(symbols), batch_size):
+            batch = symbols[i:i + batch_size]
+            try:
+                fetched = fetch_quotes(batch)
+            except UpstreamUnavailable as e:
+                failed += len(batch)
+                self.stderr.write(f'Upstream unavailable for {len(batch)} symbols: {e}')
+                continue
+            for symbol, quote in fetched.items():
+                quotes[symbol] = quote
+                timestamps.pop(symbol, None)
+        written = write_snapshot(path, quotes, timestamps)
+        self.stdout.write(
+            f'{written} prices written to {path} in {(time.perf_counter() - started) * 1000:.0f} ms'
+            + (f' ({failed} not refreshed)' if failed else '')
+        )
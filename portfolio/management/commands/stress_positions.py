@@ -0,0 +1,72 @@
+import threading
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from portfolio.models import Asset, Portfolio
+from portfolio.services import apply_buy, apply_buys
+
+
+class Command(BaseCommand):
+    help = (
+        'Lanza compras concurrentes sobre un mismo asset y verifica que no se pierden '
+        'actualizaciones de quantity/average_price. Usa datos temporales que se borran al final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--buys', type=int, default=50, help='Compras por hilo.')
+        parser.add_argument('--batch-symbols', type=int, default=5, help='Símbolos extra comprados en lote por cada compra.')
+
+    def handle(self, *args, **options):
+        threads, buys, batch_symbols = options['threads'], options['buys'], options['batch_symbols']
+        user = get_user_model().objects.create_user(username=f'stress-{uuid.uuid4().hex[:12]}')
+        portfolio = Portfolio.objects.create(owner=user, name='stress')
+        errors = []
+        barrier = threading.Barrier(threads)
+
+        def worker(index):
+            try:
+                barrier.wait()
+                for n in range(buys):
+                    # Precio distinto por compra para que el promedio dependa de todas ellas.
+                    price = Decimal(100 + (index * buys + n) % 7)
+                    apply_buy(portfolio, 'HOT', Decimal('1'), price)
+                    if batch_symbols:
+                        apply_buys(portfolio, [(f'B{k}', Decimal('1'), price) for k in range(batch_symbols)])
+            except Exception as e:  # pragma: no cover - se reporta abajo
+                errors.append(e)
+            finally:
+                connection.close()
+
+        try:
+            pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+            if errors:
+                raise CommandError(f'{len(errors)} workers failed: {errors[0]!r}')
+
+            expected_qty = Decimal(threads * buys)
+            expected_cost = sum(Decimal(100 + i % 7) for i in range(threads * buys))
+            expected_avg = (expected_cost / expected_qty).quantize(Decimal('0.0001'))
+            failures = []
+            for asset in Asset.objects.filter(portfolio=portfolio):
+                tx_count = asset.transactions.count()
+                avg = asset.average_price.quantize(Decimal('0.0001'))
+                if asset.quantity != expected_qty or tx_count != expected_qty:
+                    failures.append(f'{asset.symbol}: quantity={asset.quantity} transactions={tx_count} expected={expected_qty}')
+                # El promedio se redondea a 4 decimales en cada compra: se tolera esa deriva.
+                elif abs(avg - expected_avg) > Decimal('0.01'):
+                    failures.append(f'{asset.symbol}: average_price={avg} expected={expected_avg}')
+            if failures:
+                raise CommandError('Lost updates detected:\n' + '\n'.join(failures))
+            self.stdout.write(self.style.SUCCESS(
+                f'OK: {threads} threads x {buys} buys, quantity={expected_qty}, average_price={expected_avg}'
+            ))
+        finally:
+            user.delete()
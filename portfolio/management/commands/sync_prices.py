@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from portfolio.history import SYNC_MARKER_PREFIX, sync_daily_prices
+from portfolio.models import Asset
+
+
+class Command(BaseCommand):
+    help = 'Completa el historial diario (DailyPrice) de los símbolos en cartera y del benchmark de riesgo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=settings.RISK_MAX_YEARS)
+        parser.add_argument('--batch-size', type=int, default=100, help='Símbolos por descarga.')
+
+    def handle(self, *args, **options):
+        start = timezone.now().date() - timedelta(days=365 * options['years'])
+        symbols = sorted(
+            set(Asset.objects.filter(quantity__gt=0).values_list('symbol', flat=True).distinct())
+            | {settings.RISK_BENCHMARK_SYMBOL}
+        )
+        # Ejecución explícita: ignora las marcas que limitan los reintentos en peticiones.
+        cache.delete_many([f'{SYNC_MARKER_PREFIX}{s}:{start}' for s in symbols])
+        created = 0
+        batch_size = options['batch_size']
+        for i in range(0, len(symbols), batch_size):
+            created += sync_daily_prices(symbols[i:i + batch_size], start)
+        self.stdout.write(self.style.SUCCESS(f'{len(symbols)} symbols synced, {created} new daily prices'))
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:34
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0002_assettransaction_alter_asset_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='realized_profit_loss',
+            field=models.DecimalField(decimal_places=4, default=Decimal('0'), help_text='Ganancia/pérdida realizada acumulada por ventas', max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='assettransaction',
+            name='realized_profit_loss',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Ganancia/pérdida realizada (sólo ventas)', max_digits=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='assettransaction',
+            name='side',
+            field=models.CharField(choices=[('BUY', 'Compra'), ('SELL', 'Venta')], default='BUY', max_length=4),
+        ),
+        migrations.AddField(
+            model_name='portfolio',
+            name='cost_basis_method',
+            field=models.CharField(choices=[('AVG', 'Costo promedio'), ('FIFO', 'FIFO')], default='AVG', help_text='Método de asignación de costo en ventas', max_length=4),
+        ),
+        migrations.AlterField(
+            model_name='assettransaction',
+            name='quantity',
+            field=models.DecimalField(decimal_places=4, help_text='Cantidad operada (> 0)', max_digits=20, validators=[django.core.validators.MinValueValidator(Decimal('1E-7'))]),
+        ),
+        migrations.CreateModel(
+            name='AssetLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('remaining_quantity', models.DecimalField(decimal_places=4, max_digits=20)),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='portfolio.asset')),
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='lot', to='portfolio.assettransaction')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('remaining_quantity__gt', 0)), fields=['asset', 'id'], name='idx_lot_asset_open')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0003_sell_transactions_and_lots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=20)),
+                ('date', models.DateField()),
+                ('close', models.FloatField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('symbol', 'date'), name='uniq_dailyprice_symbol_date')],
+            },
+        ),
+    ]
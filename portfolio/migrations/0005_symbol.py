@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_dailyprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Symbol',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticker', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(blank=True, max_length=200)),
+                ('exchange', models.CharField(blank=True, max_length=20)),
+                ('currency', models.CharField(blank=True, max_length=10)),
+            ],
+        ),
+    ]
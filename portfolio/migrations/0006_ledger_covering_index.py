@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0005_symbol'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='assettransaction',
+            options={},
+        ),
+        migrations.RemoveIndex(
+            model_name='assettransaction',
+            name='idx_transaction_asset_created',
+        ),
+        migrations.AlterField(
+            model_name='assettransaction',
+            name='asset',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='portfolio.asset'),
+        ),
+        migrations.AddIndex(
+            model_name='assettransaction',
+            index=models.Index(fields=['asset', 'created_at'], include=('side', 'quantity', 'price', 'realized_profit_loss'), name='idx_tx_asset_created_cov'),
+        ),
+    ]
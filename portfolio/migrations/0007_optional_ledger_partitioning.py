@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_ledger(apps, schema_editor):
+    # Opcional: sólo con LEDGER_PARTITIONING=True y PostgreSQL (ver portfolio.ledger).
+    if not settings.LEDGER_PARTITIONING:
+        return
+    from portfolio.ledger import partition
+
+    partition(schema_editor.connection, apps)
+
+
+def unpartition_ledger(apps, schema_editor):
+    from portfolio.ledger import unpartition
+
+    unpartition(schema_editor.connection, apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_ledger_covering_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_ledger, unpartition_ledger),
+    ]
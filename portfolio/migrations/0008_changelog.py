@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0007_optional_ledger_partitioning'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('portfolio', 'Portfolio'), ('asset', 'Asset'), ('transaction', 'Transacción')], max_length=12)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner', 'version'), include=('kind', 'object_id', 'deleted'), name='uniq_change_owner_version')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0008_changelog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=20)),
+                ('kind', models.CharField(choices=[('PRICE', 'Precio'), ('PNL_PCT', '% sobre precio promedio')], default='PRICE', max_length=7)),
+                ('direction', models.CharField(choices=[('ABOVE', 'Al subir hasta'), ('BELOW', 'Al bajar hasta')], max_length=5)),
+                ('threshold', models.DecimalField(decimal_places=4, help_text='Precio o porcentaje', max_digits=20)),
+                ('trigger_price', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('triggered_at', models.DateTimeField(blank=True, null=True)),
+                ('triggered_price', models.DecimalField(blank=True, decimal_places=4, max_digits=20, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('asset', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='portfolio.asset')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['updated_at'], name='idx_alert_updated')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_counters(apps, schema_editor):
+    ChangeLog = apps.get_model('portfolio', 'ChangeLog')
+    ChangeLogCounter = apps.get_model('portfolio', 'ChangeLogCounter')
+    db = schema_editor.connection.alias
+    latest = ChangeLog.objects.using(db).values('owner_id').annotate(version=Max('version')).order_by()
+    ChangeLogCounter.objects.using(db).bulk_create(
+        [ChangeLogCounter(owner_id=row['owner_id'], version=row['version']) for row in latest],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0009_pricealert'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogCounter',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='changelog_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:48
+
+from django.db import migrations, models
+
+
+def mark_loaded(apps, schema_editor):
+    # Un catálogo ya cargado antes de esta migración cuenta como cargado.
+    Symbol = apps.get_model('portfolio', 'Symbol')
+    CatalogueVersion = apps.get_model('portfolio', 'CatalogueVersion')
+    db = schema_editor.connection.alias
+    if Symbol.objects.using(db).exists():
+        CatalogueVersion.objects.using(db).create(version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0010_changelogcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('loaded_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(mark_loaded, migrations.RunPython.noop),
+    ]
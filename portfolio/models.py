@@ -4,6 +4,10 @@ from django.core.validators import MinValueValidator
 from decimal import Decimal
 
 class Portfolio(models.Model):
+    class CostBasisMethod(models.TextChoices):
+        AVERAGE = 'AVG', 'Costo promedio'
+        FIFO = 'FIFO', 'FIFO'
+
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -11,6 +15,12 @@ class Portfolio(models.Model):
     )
     name = models.CharField(max_length=120)
     base_currency = models.CharField(max_length=10, default='USD')
+    cost_basis_method = models.CharField(
+        max_length=4,
+        choices=CostBasisMethod.choices,
+        default=CostBasisMethod.AVERAGE,
+        help_text='Método de asignación de costo en ventas',
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -45,6 +55,12 @@ class Asset(models.Model):
         validators=[MinValueValidator(Decimal('0.0000001'))],
         help_text='Precio promedio debe ser > 0',
     )
+    realized_profit_loss = models.DecimalField(
+        max_digits=20,
+        decimal_places=4,
+        default=Decimal('0'),
+        help_text='Ganancia/pérdida realizada acumulada por ventas',
+    )
     added_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -68,16 +84,22 @@ class Asset(models.Model):
 
 
 class AssetTransaction(models.Model):
+    class Side(models.TextChoices):
+        BUY = 'BUY', 'Compra'
+        SELL = 'SELL', 'Venta'
+
     asset = models.ForeignKey(
         Asset,
         on_delete=models.CASCADE,
         related_name='transactions',
+        # El índice cubriente (asset, created_at) ya sirve las búsquedas por asset.
+        db_index=False,
     )
     quantity = models.DecimalField(
         max_digits=20,
         decimal_places=4,
         validators=[MinValueValidator(Decimal('0.0000001'))],
-        help_text='Cantidad comprada (> 0)',
+        help_text='Cantidad operada (> 0)',
     )
     price = models.DecimalField(
         max_digits=20,
@@ -85,13 +107,209 @@ class AssetTransaction(models.Model):
         validators=[MinValueValidator(Decimal('0.0000001'))],
         help_text='Precio por unidad (> 0)',
     )
+    side = models.CharField(max_length=4, choices=Side.choices, default=Side.BUY)
+    realized_profit_loss = models.DecimalField(
+        max_digits=20,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        help_text='Ganancia/pérdida realizada (sólo ventas)',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Sin ordering por defecto: cada consulta ordena sólo cuando lo necesita (el ledger
+        # por created_at, id), en vez de forzar un sort en cada fetch relacionado.
+        indexes = [
+            # Índice cubriente (PostgreSQL): el ledger de un asset y los agregados por
+            # asset/side se resuelven con index-only scans, sin visitar el heap.
+            models.Index(
+                fields=['asset', 'created_at'],
+                include=['side', 'quantity', 'price', 'realized_profit_loss'],
+                name='idx_tx_asset_created_cov',
+            ),
+        ]
+
+    def __str__(self):
+        sign = '-' if self.side == self.Side.SELL else '+'
+        return f"TX {self.asset.symbol} {sign}{self.quantity} @ {self.price}"
+
+
+class AssetLot(models.Model):
+    """Lote abierto de una compra (estado persistido del motor FIFO).
+
+    Cada compra de un portfolio FIFO abre un lote; las ventas consumen los lotes
+    abiertos más antiguos. El índice parcial sobre lotes abiertos hace que localizar
+    el siguiente lote sea O(log n) y cada lote se agota una sola vez (O(1) amortizado).
+    """
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name='lots',
+    )
+    transaction = models.OneToOneField(
+        AssetTransaction,
+        on_delete=models.CASCADE,
+        related_name='lot',
+    )
+    price = models.DecimalField(max_digits=20, decimal_places=4)
+    remaining_quantity = models.DecimalField(max_digits=20, decimal_places=4)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['asset', 'id'],
+                name='idx_lot_asset_open',
+                condition=models.Q(remaining_quantity__gt=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f"LOT {self.asset.symbol} {self.remaining_quantity} @ {self.price}"
+
+
+class DailyPrice(models.Model):
+    """Cierre diario almacenado de un símbolo (fuente de las analíticas de riesgo).
+
+    close es float: se carga directamente en arrays NumPy y no se usa para importes.
+    """
+    symbol = models.CharField(max_length=20)
+    date = models.DateField()
+    close = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'date'], name='uniq_dailyprice_symbol_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.date} {self.close}"
+
+
+class Symbol(models.Model):
+    """Catálogo local de instrumentos (autocompletado y validación de símbolos sin red)."""
+    ticker = models.CharField(max_length=20, unique=True)
+    name = models.CharField(max_length=200, blank=True)
+    exchange = models.CharField(max_length=20, blank=True)
+    currency = models.CharField(max_length=10, blank=True)
+
+    def __str__(self):
+        return f"{self.ticker} {self.name}"
+
+
+class CatalogueVersion(models.Model):
+    """Versión del catálogo de símbolos (una sola fila, ver `portfolio.catalogue`).
+
+    `load_symbols` la incrementa; cada proceso la consulta periódicamente y reconstruye
+    su índice en memoria cuando cambia. Sin fila, el catálogo nunca se ha cargado.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    loaded_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"v{self.version}"
+
+
+class ChangeLog(models.Model):
+    """Registro de cambios por usuario para la sincronización incremental.
+
+    Cada alta/modificación (deleted=False) o borrado (tombstone, deleted=True) de un
+    portfolio, asset o transacción añade una fila con la siguiente `version` del usuario;
+    los clientes guardan la última versión vista como cursor (GET /api/portfolios/sync/).
+    """
+    class Kind(models.TextChoices):
+        PORTFOLIO = 'portfolio', 'Portfolio'
+        ASSET = 'asset', 'Asset'
+        TRANSACTION = 'transaction', 'Transacción'
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='changes',
+        # La restricción única (owner, version) ya indexa las búsquedas por usuario.
+        db_index=False,
+    )
+    version = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=12, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Incluye las columnas de la entrada: leer un delta es un index-only scan.
+            models.UniqueConstraint(
+                fields=['owner', 'version'],
+                include=['kind', 'object_id', 'deleted'],
+                name='uniq_change_owner_version',
+            ),
+        ]
+
+    def __str__(self):
+        action = 'DEL' if self.deleted else 'UPD'
+        return f"v{self.version} {action} {self.kind}#{self.object_id}"
+
+
+class ChangeLogCounter(models.Model):
+    """Última versión del change log asignada a cada usuario (ver `portfolio.sync`)."""
+    owner = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='changelog_counter',
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.owner_id}: v{self.version}"
+
+
+class PriceAlert(models.Model):
+    """Alerta de un símbolo vigilado o en cartera (ver portfolio.alerts).
+
+    PRICE dispara cuando el precio alcanza `threshold`; PNL_PCT cuando la ganancia/pérdida
+    no realizada del asset alcanza `threshold` % sobre su average_price. Ambas se evalúan
+    contra `trigger_price`, el precio equivalente (para PNL_PCT se recalcula al cambiar el
+    precio promedio). Son de un solo disparo: al dispararse quedan inactivas.
+    """
+    class Kind(models.TextChoices):
+        PRICE = 'PRICE', 'Precio'
+        PNL_PCT = 'PNL_PCT', '% sobre precio promedio'
+
+    class Direction(models.TextChoices):
+        ABOVE = 'ABOVE', 'Al subir hasta'
+        BELOW = 'BELOW', 'Al bajar hasta'
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='price_alerts',
+    )
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name='alerts',
+        null=True,
+        blank=True,
+    )
+    symbol = models.CharField(max_length=20)
+    kind = models.CharField(max_length=7, choices=Kind.choices, default=Kind.PRICE)
+    direction = models.CharField(max_length=5, choices=Direction.choices)
+    threshold = models.DecimalField(max_digits=20, decimal_places=4, help_text='Precio o porcentaje')
+    trigger_price = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
+    active = models.BooleanField(default=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)
+    triggered_price = models.DecimalField(max_digits=20, decimal_places=4, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['asset', 'created_at'], name='idx_transaction_asset_created'),
+            # Los evaluadores de cada proceso leen los cambios recientes por updated_at.
+            models.Index(fields=['updated_at'], name='idx_alert_updated'),
         ]
 
     def __str__(self):
-        return f"TX {self.asset.symbol} +{self.quantity} @ {self.price}"
+        return f"ALERT {self.symbol} {self.kind} {self.direction} {self.threshold}"
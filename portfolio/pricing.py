@@ -0,0 +1,208 @@
+"""
+Capa de precios: cotizaciones de mercado con caché local y consultas por lotes.
+
+Todas las lecturas de precios (vistas y helpers de rendimiento) pasan por aquí para
+que N símbolos se resuelvan con una sola llamada al proveedor y el resto de
+peticiones se sirvan desde la caché de Django durante MARKET_QUOTE_TTL segundos.
+
+El proveedor (MARKET_PRICE_PROVIDER, ver `portfolio.providers`) se invoca siempre a
+través del guard de `portfolio.upstream`. Si el upstream no está disponible se sirve
+el último precio conocido (guardado MARKET_LAST_KNOWN_TTL segundos) marcado como
+`stale`, en lugar de dejar al worker esperando.
+
+Stale-while-revalidate: durante MARKET_QUOTE_STALE_GRACE segundos después de que una
+cotización caduque se sirve al instante el último precio (`stale: True`) y se refresca
+en segundo plano una sola vez; un marcador `cache.add` por símbolo evita que peticiones
+concurrentes lancen refrescos duplicados.
+
+Los símbolos que el proveedor no devuelve (desconocidos o sin precio) se recuerdan
+MARKET_QUOTE_MISSING_TTL segundos para no repetir la consulta en cada petición.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+from .upstream import UpstreamUnavailable, guarded_call
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'market:quote:'
+LAST_KNOWN_PREFIX = 'market:quote:last:'
+REFRESH_PREFIX = 'market:quote:refreshing:'
+MISSING_PREFIX = 'market:quote:missing:'
+
+# Se emite con quotes={symbol: quote} tras cada descarga correcta del proveedor
+# (refrescos en segundo plano, peticiones sin caché y el refresco del snapshot).
+quotes_fetched = Signal()
+
+_providers = {}
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def normalize_symbol(symbol):
+    return symbol.strip().upper()
+
+
+def _cache_key(symbol):
+    return f'{CACHE_PREFIX}{symbol}'
+
+
+def _last_known_key(symbol):
+    return f'{LAST_KNOWN_PREFIX}{symbol}'
+
+
+def _refresh_key(symbol):
+    return f'{REFRESH_PREFIX}{symbol}'
+
+
+def _missing_key(symbol):
+    return f'{MISSING_PREFIX}{symbol}'
+
+
+def get_provider():
+    """Instancia (una por proceso) del proveedor configurado en MARKET_PRICE_PROVIDER."""
+    path = settings.MARKET_PRICE_PROVIDER
+    provider = _providers.get(path)
+    if provider is None:
+        provider = _providers[path] = import_string(path)()
+    return provider
+
+
+def fetch_quotes(symbols):
+    """Descarga cotizaciones sin pasar por la caché.
+
+    Lanza UpstreamUnavailable si el proveedor falla, tarda demasiado o el guard la rechaza.
+    """
+    quotes = guarded_call(get_provider().quotes, list(symbols))
+    if quotes:
+        quotes_fetched.send(sender=fetch_quotes, quotes=quotes)
+    return quotes
+
+
+def _store_quotes(quotes):
+    # La entrada "last known" es la cotización más `fetched_at` (epoch de descarga) para
+    # medir su edad. Las escritas por versiones anteriores no lo tienen: sirven como
+    # fallback con el upstream caído, pero no se revalidan en segundo plano.
+    now = time.time()
+    cache.set_many({_cache_key(s): q for s, q in quotes.items()}, timeout=settings.MARKET_QUOTE_TTL)
+    cache.set_many(
+        {_last_known_key(s): {**q, 'fetched_at': now} for s, q in quotes.items()},
+        timeout=settings.MARKET_LAST_KNOWN_TTL,
+    )
+
+
+def _stale(entry):
+    """Cotización servida desde una entrada "last known", marcada como stale."""
+    quote = {key: value for key, value in entry.items() if key != 'fetched_at'}
+    quote['stale'] = True
+    return quote
+
+
+def _refresh(symbols):
+    try:
+        _store_quotes(fetch_quotes(symbols))
+    except UpstreamUnavailable as e:
+        logger.warning('Background quote refresh failed for %s (%s)', ', '.join(symbols), e)
+    except Exception:
+        logger.exception('Background quote refresh failed for %s', ', '.join(symbols))
+    finally:
+        cache.delete_many([_refresh_key(s) for s in symbols])
+
+
+def _refresh_in_background(symbols):
+    """Programa un único refresco por símbolo aunque varias peticiones lo pidan a la vez."""
+    global _refresher
+    # El marcador dura lo que la gracia más una llamada completa: cubre el tiempo en cola
+    # del executor (pasada la gracia la cotización ya no se revalida) y lo borra el propio
+    # refresco al terminar.
+    ttl = (
+        settings.MARKET_QUOTE_STALE_GRACE + settings.MARKET_UPSTREAM_TIMEOUT
+        + settings.MARKET_UPSTREAM_QUEUE_TIMEOUT + 1
+    )
+    claimed = [s for s in symbols if cache.add(_refresh_key(s), True, timeout=ttl)]
+    if not claimed:
+        return
+    if _refresher is None:
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='quote-refresh')
+    _refresher.submit(_refresh, claimed)
+
+
+def get_quotes(symbols):
+    """Cotizaciones de varios símbolos: dict symbol -> {symbol, name, price, currency}.
+
+    Los símbolos sin cotización disponible no aparecen en el resultado. Las cotizaciones
+    caducadas dentro del periodo de gracia, o las servidas con el upstream caído, llevan
+    `stale: True`.
+    """
+    symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols if s and s.strip()))
+    if not symbols:
+        return {}
+    cached = cache.get_many([_cache_key(s) for s in symbols])
+    quotes = {s: cached[_cache_key(s)] for s in symbols if _cache_key(s) in cached}
+    missing = [s for s in symbols if s not in quotes]
+    if not missing:
+        return quotes
+    last_known = cache.get_many([_last_known_key(s) for s in missing])
+    known = {
+        s: last_known[_last_known_key(s)] for s in missing
+        if isinstance(last_known.get(_last_known_key(s)), dict)
+    }
+    max_age = settings.MARKET_QUOTE_TTL + settings.MARKET_QUOTE_STALE_GRACE
+    now = time.time()
+    revalidate = [s for s in missing if s in known and now - known[s].get('fetched_at', float('-inf')) <= max_age]
+    if revalidate:
+        quotes.update({s: _stale(known[s]) for s in revalidate})
+        _refresh_in_background(revalidate)
+        missing = [s for s in missing if s not in quotes]
+    if missing and settings.MARKET_QUOTE_MISSING_TTL:
+        unpriceable = cache.get_many([_missing_key(s) for s in missing])
+        missing = [s for s in missing if _missing_key(s) not in unpriceable]
+    if missing:
+        try:
+            fetched = fetch_quotes(missing)
+        except UpstreamUnavailable as e:
+            logger.warning('Market data upstream unavailable (%s), serving last known quotes', e)
+            quotes.update({s: _stale(known[s]) for s in missing if s in known})
+            return quotes
+        _store_quotes(fetched)
+        quotes.update(fetched)
+        if settings.MARKET_QUOTE_MISSING_TTL:
+            cache.set_many(
+                {_missing_key(s): True for s in missing if s not in fetched},
+                timeout=settings.MARKET_QUOTE_MISSING_TTL,
+            )
+    return quotes
+
+
+def get_quote(symbol):
+    """Cotización de un símbolo o None si no está disponible."""
+    return get_quotes([symbol]).get(normalize_symbol(symbol))
+
+
+def get_history(symbol, period):
+    """Serie de cierres (pandas.Series) de un símbolo para el periodo dado.
+
+    Lanza UpstreamUnavailable si el proveedor no está disponible.
+    """
+    return guarded_call(get_provider().history, symbol, period)
+
+
+def get_histories(symbols, period=None, start=None):
+    """Cierres de varios símbolos con una sola descarga: dict symbol -> pandas.Series.
+
+    Acepta un `period` ('5d', '1y'...) o una fecha `start`. Lanza UpstreamUnavailable si
+    el proveedor no está disponible.
+    """
+    symbols = list(dict.fromkeys(normalize_symbol(s) for s in symbols))
+    if not symbols:
+        return {}
+    return guarded_call(get_provider().histories, symbols, period=period, start=start)
@@ -0,0 +1,176 @@
+"""
+Proveedores de datos de mercado.
+
+La capa de precios (`portfolio.pricing`) resuelve el proveedor con el setting
+MARKET_PRICE_PROVIDER y nunca lo llama directamente: todas las llamadas pasan por el
+guard de `portfolio.upstream`. Un proveedor implementa:
+
+  - quotes(symbols) -> dict symbol -> {symbol, name, price, currency}
+  - history(symbol, period) -> pandas.Series de cierres o None
+  - histories(symbols, period=None, start=None) -> dict symbol -> pandas.Series
+"""
+import logging
+import random
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+QUOTE_URL = 'https://query1.finance.yahoo.com/v7/finance/quote'
+
+
+def _quote_from_info(symbol, info):
+    """Construye el dict de cotización {symbol, name, price, currency} o None sin precio."""
+    price = info.get('regularMarketPrice')
+    if price is None:
+        return None
+    return {
+        'symbol': symbol,
+        'name': info.get('shortName') or info.get('longName') or symbol,
+        'price': price,
+        'currency': info.get('currency'),
+    }
+
+
+class YahooProvider:
+    """Yahoo Finance vía yfinance (que, junto con pandas, se importa en el primer uso)."""
+
+    @staticmethod
+    def _yf():
+        import yfinance
+
+        return yfinance
+
+    @staticmethod
+    def _raw_json_client():
+        """Cliente HTTP interno de yfinance para el endpoint de cotizaciones múltiples, o None.
+
+        yfinance no expone una API pública que devuelva nombre, precio y divisa de varios
+        símbolos en un único request (Tickers/fast_info hacen al menos uno por símbolo), así
+        que se usa `yfinance.data.YfData.get_raw_json`, que gestiona cookie y crumb. Es
+        privado: si una versión lo retira, se usa la API pública (`_quotes_public`).
+        """
+        try:
+            from yfinance.data import YfData
+        except ImportError:
+            return None
+        client = YfData()
+        return client if callable(getattr(client, 'get_raw_json', None)) else None
+
+    def _quotes_batch(self, client, symbols):
+        # Un único request al endpoint de cotizaciones múltiples (nombre, precio y divisa).
+        data = client.get_raw_json(
+            QUOTE_URL,
+            params={'symbols': ','.join(symbols), 'formatted': 'false'},
+            timeout=settings.MARKET_UPSTREAM_TIMEOUT,
+        )
+        quotes = {}
+        for row in (data.get('quoteResponse') or {}).get('result') or []:
+            symbol = row.get('symbol', '').strip().upper()
+            quote = _quote_from_info(symbol, row)
+            if quote is not None:
+                quotes[symbol] = quote
+        return quotes
+
+    @staticmethod
+    def _quote_public(symbol, ticker):
+        """Cotización con la API pública: fast_info (precio y divisa) y, si falta, info."""
+        fast_info = getattr(ticker, 'fast_info', None)
+        price = currency = None
+        if fast_info:
+            price = getattr(fast_info, 'last_price', None)
+            currency = getattr(fast_info, 'currency', None)
+        if price is not None:
+            return _quote_from_info(symbol, {'regularMarketPrice': price, 'currency': currency})
+        return _quote_from_info(symbol, getattr(ticker, 'info', {}) or {})
+
+    def _quotes_public(self, symbols):
+        tickers = self._yf().Tickers(' '.join(symbols)).tickers
+        quotes = {}
+        error = None
+        for symbol in symbols:
+            try:
+                quote = self._quote_public(symbol, tickers[symbol])
+            except Exception as e:
+                logger.warning('Quote request failed for %s', symbol, exc_info=True)
+                error = e
+                continue
+            if quote is not None:
+                quotes[symbol] = quote
+        if not quotes and error is not None:
+            # Ningún símbolo respondió: se propaga para que cuente como fallo del upstream.
+            raise error
+        return quotes
+
+    def quotes(self, symbols):
+        """Usa la consulta por lotes; si ésta falla o no existe, la API pública por símbolo."""
+        client = self._raw_json_client()
+        if client is None:
+            return self._quotes_public(symbols)
+        try:
+            return self._quotes_batch(client, symbols)
+        except Exception:
+            logger.warning('Batch quote request failed, falling back to per-symbol lookups', exc_info=True)
+        return self._quotes_public(symbols)
+
+    def history(self, symbol, period):
+        return getattr(self._yf().Ticker(symbol).history(period=period), 'Close', None)
+
+    def histories(self, symbols, period=None, start=None):
+        frame = self._yf().download(
+            symbols, period=period, start=start, progress=False, auto_adjust=False, group_by='column',
+        )
+        if frame is None or frame.empty:
+            return {}
+        close = frame['Close']
+        return {s: close[s].dropna() for s in symbols if s in close}
+
+
+class StubProvider:
+    """Proveedor local para desarrollo y pruebas de carga sin acceso a Yahoo.
+
+    Precios que oscilan alrededor de una base fija por símbolo. MARKET_STUB_LATENCY (segundos) y
+    MARKET_STUB_FAILURE_RATE (0..1) simulan un upstream lento o que falla.
+    """
+
+    def _call(self):
+        latency = settings.MARKET_STUB_LATENCY
+        if latency:
+            time.sleep(latency)
+        if random.random() < settings.MARKET_STUB_FAILURE_RATE:
+            raise ConnectionError('Stub upstream failure')
+
+    @staticmethod
+    def _price(symbol):
+        return round(10 + sum(map(ord, symbol)) % 490 + random.random(), 2)
+
+    def quotes(self, symbols):
+        self._call()
+        return {s: {'symbol': s, 'name': s, 'price': self._price(s), 'currency': 'USD'} for s in symbols}
+
+    def _series(self, symbol, index):
+        import numpy as np
+        import pandas as pd
+
+        base = self._price(symbol)
+        steps = np.random.default_rng(sum(map(ord, symbol))).normal(0, 0.01, len(index))
+        return pd.Series(base * np.exp(np.cumsum(steps)), index=index, name=symbol)
+
+    def history(self, symbol, period):
+        import pandas as pd
+
+        self._call()
+        return self._series(symbol, pd.date_range(end=pd.Timestamp.now(tz='UTC').normalize(), periods=30, freq='D'))
+
+    def histories(self, symbols, period=None, start=None):
+        import pandas as pd
+
+        self._call()
+        end = pd.Timestamp.now(tz='UTC').normalize()
+        if start:
+            # `start` llega como date (sin zona): ambos extremos en UTC.
+            index = pd.bdate_range(start=pd.Timestamp(start, tz='UTC'), end=end)
+        else:
+            index = pd.bdate_range(end=end, periods=30)
+        return {s: self._series(s, index) for s in symbols}
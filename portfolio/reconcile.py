@@ -0,0 +1,149 @@
+"""
+Reconciliación de las posiciones desnormalizadas (Asset.quantity, average_price y
+realized_profit_loss) contra el ledger de transacciones.
+
+La posición esperada sale de un único agregado agrupado por asset, sin reproducir el
+ledger fila a fila. Cada venta guarda su resultado realizado, así que el costo que
+retiró es `quantity * price - realized_profit_loss` (vale para FIFO y costo promedio):
+  quantity      = Σ compras.quantity - Σ ventas.quantity
+  costo abierto = Σ compras.quantity * price - Σ ventas (quantity * price - realized)
+  average_price = costo abierto / quantity
+  realized      = Σ ventas.realized_profit_loss
+En PostgreSQL el agregado se sirve del índice cubriente del ledger (index-only scan).
+En portfolios FIFO también se comprueba que los lotes abiertos (AssetLot) sumen la
+cantidad esperada; esas posiciones se corrigen con `lots.rebuild_position`, que
+reproduce el ledger y rehace los lotes en la misma transacción.
+Los assets se recorren por rangos de id con paginación keyset.
+"""
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .alerts import reprice_alerts
+from .lots import FIFO, rebuild_position
+from .models import Asset, AssetLot, AssetTransaction, ChangeLog
+from .services import lock_assets
+from .sync import record_changes
+
+ZERO = Decimal('0')
+PLACES = Decimal('0.0001')
+FIELDS = ['quantity', 'average_price', 'realized_profit_loss']
+
+_money = DecimalField(max_digits=40, decimal_places=8)
+_buy = Q(side=AssetTransaction.Side.BUY)
+_sell = Q(side=AssetTransaction.Side.SELL)
+
+
+def ledger_totals(asset_ids, using=None):
+    """Dict asset_id -> (quantity, costo abierto, realized) calculado desde el ledger."""
+    amount = ExpressionWrapper(F('quantity') * F('price'), output_field=_money)
+    removed = ExpressionWrapper(
+        F('quantity') * F('price') - Coalesce(F('realized_profit_loss'), Value(ZERO)), output_field=_money,
+    )
+    rows = (
+        AssetTransaction.objects.using(using)
+        .filter(asset_id__in=asset_ids)
+        .order_by()
+        .values('asset_id')
+        .annotate(
+            bought=Sum('quantity', filter=_buy, default=ZERO),
+            sold=Sum('quantity', filter=_sell, default=ZERO),
+            buy_cost=Sum(amount, filter=_buy, default=ZERO),
+            sell_cost=Sum(removed, filter=_sell, default=ZERO),
+            realized=Sum('realized_profit_loss', filter=_sell, default=ZERO),
+        )
+    )
+    return {
+        row['asset_id']: (row['bought'] - row['sold'], row['buy_cost'] - row['sell_cost'], row['realized'])
+        for row in rows
+    }
+
+
+def open_lot_totals(asset_ids, using=None):
+    """Dict asset_id -> cantidad en lotes abiertos, para los assets de portfolios FIFO."""
+    fifo = Asset.objects.using(using).filter(pk__in=asset_ids, portfolio__cost_basis_method=FIFO)
+    totals = dict.fromkeys(fifo.values_list('id', flat=True), ZERO)
+    rows = (
+        AssetLot.objects.using(using)
+        .filter(asset_id__in=list(totals), remaining_quantity__gt=0)
+        .order_by()
+        .values('asset_id')
+        .annotate(open=Sum('remaining_quantity'))
+    )
+    totals.update((row['asset_id'], row['open']) for row in rows)
+    return totals
+
+
+def expected_position(asset, totals):
+    """(quantity, average_price, realized) esperados; sin posición abierta se conserva el precio."""
+    quantity, cost, realized = totals.get(asset.id, (ZERO, ZERO, ZERO))
+    average_price = cost / quantity if quantity > 0 else asset.average_price
+    return quantity.quantize(PLACES), Decimal(average_price).quantize(PLACES), realized.quantize(PLACES)
+
+
+def reconcile_chunk(after_id, last_id, size, tolerance, fix=True):
+    """Reconcilia hasta `size` assets con after_id < id <= last_id, en orden de id.
+
+    Devuelve (último id procesado o None si no quedan, nº de assets, discrepancias).
+    Cada discrepancia es (asset_id, symbol, campo, almacenado, esperado); el campo 'lots'
+    es la cantidad abierta en lotes de un asset FIFO. Con `fix` las filas del chunk se
+    bloquean mientras se agregan y se corrigen con un bulk_update; los assets FIFO pasan
+    antes por rebuild_position, que rehace sus lotes. Las compras y ventas concurrentes
+    de esos assets esperan y no se pierden.
+    average_price y realized_profit_loss se comparan con `tolerance`, porque el
+    precio promedio se redondea a 4 decimales en cada compra.
+    """
+    db = router.db_for_write(Asset)
+    with transaction.atomic(using=db):
+        queryset = Asset.objects.using(db).filter(id__gt=after_id, id__lte=last_id).order_by('id')
+        if fix:
+            # El chunk se delimita por id, pero sus filas se bloquean en el orden (portfolio,
+            # símbolo) de las compras; se procesan de nuevo en orden de id.
+            ids = list(queryset.values_list('id', flat=True)[:size])
+            queryset = lock_assets(Asset.objects.using(db).filter(id__in=ids))
+        else:
+            queryset = queryset[:size]
+        assets = sorted(queryset.only('id', 'symbol', *FIELDS), key=lambda asset: asset.id)
+        if not assets:
+            return None, 0, []
+        totals = ledger_totals([asset.id for asset in assets], using=db)
+        lot_totals = open_lot_totals([asset.id for asset in assets], using=db)
+        mismatches = []
+        changed = []
+        for asset in assets:
+            quantity, average_price, realized = expected_position(asset, totals)
+            diffs = []
+            if asset.id in lot_totals and lot_totals[asset.id] != quantity:
+                diffs.append(('lots', lot_totals[asset.id], quantity))
+            if asset.quantity != quantity:
+                diffs.append(('quantity', asset.quantity, quantity))
+            if quantity > 0 and abs(asset.average_price - average_price) > tolerance:
+                diffs.append(('average_price', asset.average_price, average_price))
+            if abs(asset.realized_profit_loss - realized) > tolerance:
+                diffs.append(('realized_profit_loss', asset.realized_profit_loss, realized))
+            if diffs:
+                mismatches.extend((asset.id, asset.symbol, *diff) for diff in diffs)
+                asset.quantity, asset.average_price, asset.realized_profit_loss = quantity, average_price, realized
+                changed.append(asset)
+        if fix and changed:
+            fifo = [asset for asset in changed if asset.id in lot_totals]
+            for asset in fifo:
+                # Rehace los lotes y el realizado de sus ventas; el asset se guarda abajo.
+                rebuild_position(asset, method=FIFO, save=False)
+            Asset.objects.using(db).bulk_update(changed, FIELDS, batch_size=500)
+            owners = dict(Asset.objects.using(db).filter(pk__in=[asset.pk for asset in changed]).values_list(
+                'pk', 'portfolio__owner_id',
+            ))
+            # bulk_update no emite señales: el change log se escribe aquí.
+            sells = AssetTransaction.objects.using(db).filter(
+                asset__in=fifo, side=AssetTransaction.Side.SELL,
+            ).values_list('id', 'asset_id')
+            record_changes(
+                [(owner_id, ChangeLog.Kind.ASSET, pk, False) for pk, owner_id in owners.items()]
+                + [(owners[asset_id], ChangeLog.Kind.TRANSACTION, pk, False) for pk, asset_id in sells],
+                using=db,
+            )
+            reprice_alerts([asset.pk for asset in changed], using=db)
+    return assets[-1].id, len(assets), mismatches
@@ -0,0 +1,153 @@
+"""
+Analíticas de riesgo vectorizadas con NumPy sobre el historial diario almacenado.
+
+La matriz de rentabilidades diarias alineadas (fechas x símbolos) se cachea por
+conjunto de símbolos y ventana; además cada serie de precios se cachea por símbolo,
+de modo que portfolios que comparten holdings reutilizan las columnas ya cargadas
+y sólo pagan la alineación.
+"""
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DailyPrice
+
+TRADING_DAYS = 252
+SERIES_CACHE_PREFIX = 'risk:series:'
+MATRIX_CACHE_PREFIX = 'risk:matrix:'
+
+
+def _series_key(symbol, start, end):
+    return f'{SERIES_CACHE_PREFIX}{symbol}:{start.isoformat()}:{end.isoformat()}'
+
+
+def _matrix_key(symbols, start, end):
+    digest = hashlib.sha1(','.join(symbols).encode()).hexdigest()
+    return f'{MATRIX_CACHE_PREFIX}{digest}:{start.isoformat()}:{end.isoformat()}'
+
+
+def _ttl(complete):
+    # Resultados vacíos o incompletos (descarga fallida o a medias) caducan enseguida para
+    # no responder "sin historial" durante todo RISK_CACHE_TTL una vez llegan los datos.
+    return settings.RISK_CACHE_TTL if complete else settings.RISK_EMPTY_CACHE_TTL
+
+
+def load_series(symbols, start, end):
+    """Cierres almacenados por símbolo: dict symbol -> (días epoch int64, closes float64)."""
+    keys = {symbol: _series_key(symbol, start, end) for symbol in symbols}
+    cached = cache.get_many(list(keys.values()))
+    series = {symbol: cached[key] for symbol, key in keys.items() if key in cached}
+    missing = [symbol for symbol in symbols if symbol not in series]
+    if missing:
+        rows = (
+            DailyPrice.objects.filter(symbol__in=missing, date__range=(start, end))
+            .order_by('symbol', 'date')
+            .values_list('symbol', 'date', 'close')
+        )
+        grouped = {symbol: ([], []) for symbol in missing}
+        for symbol, day, close in rows.iterator(chunk_size=10000):
+            grouped[symbol][0].append(day.toordinal())
+            grouped[symbol][1].append(close)
+        loaded = {
+            symbol: (np.array(days, dtype=np.int64), np.array(closes, dtype=np.float64))
+            for symbol, (days, closes) in grouped.items()
+        }
+        for complete in (True, False):
+            batch = {keys[s]: v for s, v in loaded.items() if (len(v[0]) > 0) == complete}
+            if batch:
+                cache.set_many(batch, timeout=_ttl(complete))
+        series.update(loaded)
+    return series
+
+
+def return_matrix(symbols, start, end):
+    """Rentabilidades diarias alineadas: (días ordinales, matriz [fechas x symbols]).
+
+    `symbols` define el orden de las columnas. Los precios se propagan hacia delante
+    en días sin cotización (festivos de otro mercado) y los días previos al inicio de
+    una serie cuentan como rentabilidad 0.
+    """
+    symbols = list(symbols)
+    key = _matrix_key(symbols, start, end)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+    series = load_series(symbols, start, end)
+    non_empty = [days for days, _ in series.values() if len(days)]
+    if not non_empty:
+        result = (np.empty(0, dtype=np.int64), np.empty((0, len(symbols))))
+        cache.set(key, result, timeout=_ttl(False))
+        return result
+    dates = np.unique(np.concatenate(non_empty))
+    prices = np.full((len(dates), len(symbols)), np.nan)
+    for j, symbol in enumerate(symbols):
+        days, closes = series[symbol]
+        prices[np.searchsorted(dates, days), j] = closes
+    # Forward-fill vectorizado: índice de la última fila válida por columna.
+    rows = np.where(~np.isnan(prices), np.arange(len(dates))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    prices = prices[rows, np.arange(len(symbols))]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = prices[1:] / prices[:-1] - 1.0
+    returns[~np.isfinite(returns)] = 0.0
+    result = (dates[1:], returns)
+    cache.set(key, result, timeout=_ttl(len(non_empty) == len(symbols) and len(returns) >= 2))
+    return result
+
+
+def max_drawdown(returns):
+    """Máxima caída desde un pico de la serie acumulada (valor negativo)."""
+    wealth = np.cumprod(1.0 + returns)
+    peaks = np.maximum.accumulate(np.concatenate(([1.0], wealth)))[1:]
+    return float(np.min(wealth / peaks - 1.0)) if len(wealth) else 0.0
+
+
+def portfolio_risk(symbols, weights, benchmark, start, end, risk_free_rate=0.0):
+    """Métricas de riesgo de una cartera con pesos `weights` (suman 1) sobre `symbols`.
+
+    Devuelve dict con observations, annualized_volatility, max_drawdown, sharpe_ratio,
+    beta (frente a `benchmark`), holdings (volatilidad por símbolo) y correlation.
+    None si no hay historial suficiente.
+    """
+    columns = sorted(set(symbols) | {benchmark})
+    _, returns = return_matrix(columns, start, end)
+    if len(returns) < 2:
+        return None
+    index = {symbol: j for j, symbol in enumerate(columns)}
+    holding_cols = np.array([index[s] for s in symbols])
+    holdings = returns[:, holding_cols]
+    weights = np.asarray(weights, dtype=np.float64)
+    portfolio_returns = holdings @ weights
+    benchmark_returns = returns[:, index[benchmark]]
+
+    volatility = float(np.std(portfolio_returns, ddof=1) * np.sqrt(TRADING_DAYS))
+    annual_return = float(np.mean(portfolio_returns) * TRADING_DAYS)
+    sharpe = (annual_return - risk_free_rate) / volatility if volatility > 0 else None
+    benchmark_var = float(np.var(benchmark_returns, ddof=1))
+    beta = (
+        float(np.cov(portfolio_returns, benchmark_returns, ddof=1)[0, 1] / benchmark_var)
+        if benchmark_var > 0 else None
+    )
+    holding_vol = np.std(holdings, axis=0, ddof=1) * np.sqrt(TRADING_DAYS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.corrcoef(holdings, rowvar=False) if len(symbols) > 1 else np.ones((1, 1))
+    correlation = np.nan_to_num(np.atleast_2d(correlation), nan=0.0)
+
+    return {
+        'observations': int(len(returns)),
+        'annualized_return': round(annual_return, 6),
+        'annualized_volatility': round(volatility, 6),
+        'max_drawdown': round(max_drawdown(portfolio_returns), 6),
+        'sharpe_ratio': round(sharpe, 4) if sharpe is not None else None,
+        'beta': round(beta, 4) if beta is not None else None,
+        'holdings': [
+            {'symbol': s, 'weight': round(float(w), 6), 'annualized_volatility': round(float(v), 6)}
+            for s, w, v in zip(symbols, weights, holding_vol)
+        ],
+        'correlation': {
+            'symbols': list(symbols),
+            'matrix': np.round(correlation, 4).tolist(),
+        },
+    }
@@ -1,11 +1,23 @@
 from rest_framework import serializers
-from .models import Portfolio, Asset, AssetTransaction
+from . import analytics
+from .alerts import compute_trigger_price
+from .models import Portfolio, Asset, AssetTransaction, PriceAlert
+
+class AssetTransactionListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # El modelo no tiene ordering: se ordenan en memoria las filas ya prefetched
+        # (más recientes primero) en lugar de pedir un ORDER BY por cada asset.
+        items = data.all() if hasattr(data, 'all') else data
+        items = sorted(items, key=lambda tx: (tx.created_at, tx.id), reverse=True)
+        return super().to_representation(items)
+
 
 class AssetTransactionSerializer(serializers.ModelSerializer):
     class Meta:
+        list_serializer_class = AssetTransactionListSerializer
         model = AssetTransaction
-        fields = ["id", "quantity", "price", "created_at"]
-        read_only_fields = ["id", "created_at"]
+        fields = ["id", "side", "quantity", "price", "realized_profit_loss", "created_at"]
+        read_only_fields = ["id", "side", "realized_profit_loss", "created_at"]
 
 
 class AssetSerializer(serializers.ModelSerializer):
@@ -14,8 +26,8 @@ class AssetSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Asset
-        fields = ["id", "portfolio", "symbol", "quantity", "average_price", "added_at", "transactions"]
-        read_only_fields = ["id", "added_at", "transactions"]
+        fields = ["id", "portfolio", "symbol", "quantity", "average_price", "realized_profit_loss", "added_at", "transactions"]
+        read_only_fields = ["id", "realized_profit_loss", "added_at", "transactions"]
 
     def validate_portfolio(self, value: Portfolio):
         request = self.context.get('request')
@@ -25,7 +37,11 @@ class AssetSerializer(serializers.ModelSerializer):
 
     def validate_symbol(self, value: str):
         # Normaliza temprano para coherencia en búsquedas (lookups).
-        return value.strip().upper()
+        value = value.strip().upper()
+        # Con el catálogo cargado (manage.py load_symbols) se valida sin llamadas a la red.
+        if not analytics.catalogue.is_known(value):
+            raise serializers.ValidationError("Unknown symbol.")
+        return value
 
     def update(self, instance: Asset, validated_data):
         # Bloquea intento de mover a otro portfolio por seguridad.
@@ -53,5 +69,91 @@ class PortfolioSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Portfolio
-        fields = ["id", "name", "base_currency", "created_at", "assets"]
+        fields = ["id", "name", "base_currency", "cost_basis_method", "created_at", "assets"]
         read_only_fields = ["id", "created_at"]
+
+
+# Representaciones planas para la sincronización incremental: cada objeto viaja una
+# sola vez, sin anidar assets ni transacciones.
+class PortfolioSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Portfolio
+        fields = ["id", "name", "base_currency", "cost_basis_method", "created_at"]
+
+
+class AssetSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Asset
+        fields = ["id", "portfolio", "symbol", "quantity", "average_price", "realized_profit_loss", "added_at"]
+
+
+class AssetTransactionSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AssetTransaction
+        fields = ["id", "asset", "side", "quantity", "price", "realized_profit_loss", "created_at"]
+
+
+class PriceAlertSerializer(serializers.ModelSerializer):
+    symbol = serializers.CharField(max_length=20, required=False)
+
+    class Meta:
+        model = PriceAlert
+        fields = [
+            "id", "symbol", "asset", "kind", "direction", "threshold", "trigger_price",
+            "active", "triggered_at", "triggered_price", "created_at",
+        ]
+        read_only_fields = ["id", "trigger_price", "triggered_at", "triggered_price", "created_at"]
+
+    def validate_asset(self, value: Asset):
+        request = self.context.get('request')
+        if value is not None and request and value.portfolio.owner != request.user:
+            raise serializers.ValidationError("You do not own the specified asset.")
+        return value
+
+    def validate(self, attrs):
+        # Combina con la instancia en ediciones parciales.
+        merged = {
+            field: attrs.get(field, getattr(self.instance, field, None))
+            for field in ('symbol', 'asset', 'kind', 'direction', 'threshold')
+        }
+        kind = merged['kind'] or PriceAlert.Kind.PRICE
+        asset = merged['asset']
+        if kind == PriceAlert.Kind.PNL_PCT and asset is None:
+            raise serializers.ValidationError({"asset": "P&L alerts require an asset."})
+        if asset is not None:
+            attrs['symbol'] = asset.symbol
+        elif merged['symbol']:
+            attrs['symbol'] = merged['symbol'].strip().upper()
+            if not analytics.catalogue.is_known(attrs['symbol']):
+                raise serializers.ValidationError({"symbol": "Unknown symbol."})
+        else:
+            raise serializers.ValidationError({"symbol": "This field is required."})
+        if merged['direction'] is None:
+            raise serializers.ValidationError({"direction": "This field is required."})
+        if merged['threshold'] is None:
+            raise serializers.ValidationError({"threshold": "This field is required."})
+        if kind == PriceAlert.Kind.PRICE and merged['threshold'] <= 0:
+            raise serializers.ValidationError({"threshold": "Price threshold must be > 0."})
+        if kind == PriceAlert.Kind.PNL_PCT and merged['threshold'] <= -100:
+            raise serializers.ValidationError({"threshold": "P&L threshold must be > -100%."})
+        return attrs
+
+    def _with_trigger(self, validated_data):
+        merged = {
+            field: validated_data.get(field, getattr(self.instance, field, None))
+            for field in ('kind', 'threshold', 'asset', 'active')
+        }
+        asset = merged['asset']
+        validated_data['trigger_price'] = compute_trigger_price(
+            merged['kind'] or PriceAlert.Kind.PRICE, merged['threshold'], asset and asset.average_price,
+        )
+        if merged['active'] is not False:
+            # Alta o reactivación: se olvida el disparo anterior.
+            validated_data.update(triggered_at=None, triggered_price=None)
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self._with_trigger(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self._with_trigger(validated_data))
@@ -0,0 +1,152 @@
+"""
+Servicio de posiciones: aplica compras sobre Asset sin bloqueos de fila.
+
+Cada compra se resuelve con un único `INSERT ... ON CONFLICT DO UPDATE` que suma la
+cantidad y recalcula el precio promedio en la propia base de datos, así las compras
+concurrentes sobre el mismo asset no se serializan en un `select_for_update` ni
+pierden actualizaciones.
+"""
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .alerts import reprice_alerts
+from .lots import FIFO, consume_lots, open_cost, open_lots, rebuild_position
+from .models import Asset, AssetTransaction, ChangeLog
+from .sync import record_changes
+
+
+def lock_assets(queryset):
+    """Bloquea (select_for_update) los assets en el orden del upsert de compras.
+
+    apply_buys bloquea las filas por símbolo dentro del portfolio; quien bloquee varios
+    assets debe hacerlo en orden (portfolio, símbolo) para no interbloquearse con él, y
+    siempre antes del contador del change log (`sync.record_changes`).
+    """
+    return queryset.select_for_update().order_by('portfolio_id', 'symbol')
+
+
+def _merge_buys(buys):
+    """Agrupa las compras por símbolo: cantidad total y precio promedio ponderado.
+
+    Un mismo INSERT no puede tocar dos veces la misma fila en ON CONFLICT.
+    """
+    merged = {}
+    for symbol, quantity, price in buys:
+        qty, cost = merged.get(symbol, (Decimal('0'), Decimal('0')))
+        merged[symbol] = (qty + quantity, cost + quantity * price)
+    return {symbol: (qty, cost / qty) for symbol, (qty, cost) in merged.items()}
+
+
+def apply_buys(portfolio, buys):
+    """Aplica un lote de compras [(symbol, quantity, price), ...] en un solo round trip.
+
+    Crea los assets que no existen, actualiza atómicamente los existentes y registra
+    una AssetTransaction por compra. Devuelve dict symbol -> Asset actualizado.
+    """
+    buys = [(symbol.strip().upper(), Decimal(quantity), Decimal(price)) for symbol, quantity, price in buys]
+    if not buys:
+        return {}
+    merged = _merge_buys(buys)
+    db = router.db_for_write(Asset)
+    qn = connections[db].ops.quote_name
+    table = qn(Asset._meta.db_table)
+    now = timezone.now()
+    rows = []
+    params = []
+    # Orden estable de filas: lotes concurrentes bloquean en el mismo orden y no se interbloquean.
+    for symbol, (qty, avg_price) in sorted(merged.items()):
+        rows.append('(%s, %s, %s, %s, %s, %s)')
+        params.extend([portfolio.pk, symbol, qty, avg_price, Decimal('0'), now])
+    sql = f"""
+        INSERT INTO {table} ({qn('portfolio_id')}, {qn('symbol')}, {qn('quantity')}, {qn('average_price')},
+            {qn('realized_profit_loss')}, {qn('added_at')})
+        VALUES {', '.join(rows)}
+        ON CONFLICT ({qn('portfolio_id')}, {qn('symbol')}) DO UPDATE SET
+            {qn('average_price')} = (
+                {table}.{qn('quantity')} * {table}.{qn('average_price')}
+                + EXCLUDED.{qn('quantity')} * EXCLUDED.{qn('average_price')}
+            ) / ({table}.{qn('quantity')} + EXCLUDED.{qn('quantity')}),
+            {qn('quantity')} = {table}.{qn('quantity')} + EXCLUDED.{qn('quantity')}
+        RETURNING *
+    """
+    with transaction.atomic(using=db):
+        assets = {asset.symbol: asset for asset in Asset.objects.raw(sql, params, using=db)}
+        created = AssetTransaction.objects.using(db).bulk_create([
+            AssetTransaction(asset=assets[symbol], quantity=quantity, price=price)
+            for symbol, quantity, price in buys
+        ])
+        if portfolio.cost_basis_method == FIFO:
+            open_lots(created)
+        # El upsert y bulk_create no emiten señales: el change log se escribe aquí.
+        record_changes(
+            [(portfolio.owner_id, ChangeLog.Kind.ASSET, asset.pk, False) for asset in assets.values()]
+            + [(portfolio.owner_id, ChangeLog.Kind.TRANSACTION, tx.pk, False) for tx in created],
+            using=db,
+        )
+        reprice_alerts([asset.pk for asset in assets.values()], using=db)
+    return assets
+
+
+def apply_buy(portfolio, symbol, quantity, price):
+    """Aplica una compra y devuelve el Asset actualizado."""
+    assets = apply_buys(portfolio, [(symbol, quantity, price)])
+    return next(iter(assets.values()))
+
+
+def apply_sell(asset, quantity, price):
+    """Registra una venta y actualiza la posición con el método del portfolio.
+
+    La venta bloquea la fila del asset (las compras concurrentes esperan a que termine)
+    y consume lotes de forma incremental; devuelve el Asset actualizado.
+    """
+    quantity = Decimal(quantity)
+    price = Decimal(price)
+    db = router.db_for_write(Asset)
+    with transaction.atomic(using=db):
+        asset = Asset.objects.using(db).select_for_update().select_related('portfolio').get(pk=asset.pk)
+        if quantity > asset.quantity:
+            raise serializers.ValidationError({'quantity': 'Cannot sell more than the current quantity.'})
+        if asset.portfolio.cost_basis_method == FIFO:
+            cost_removed = consume_lots(asset, quantity)
+        else:
+            cost_removed = quantity * asset.average_price
+        realized = quantity * price - cost_removed
+        remaining_quantity = asset.quantity - quantity
+        if remaining_quantity > 0 and asset.portfolio.cost_basis_method == FIFO:
+            # Desde los lotes que quedan, no desde el promedio guardado (redondeado).
+            asset.average_price = open_cost(asset) / remaining_quantity
+        elif remaining_quantity > 0:
+            asset.average_price = (asset.quantity * asset.average_price - cost_removed) / remaining_quantity
+        asset.quantity = remaining_quantity
+        asset.realized_profit_loss += realized
+        asset.save(update_fields=['quantity', 'average_price', 'realized_profit_loss'])
+        AssetTransaction.objects.using(db).create(
+            asset=asset,
+            quantity=quantity,
+            price=price,
+            side=AssetTransaction.Side.SELL,
+            realized_profit_loss=realized,
+        )
+        reprice_alerts([asset.pk], using=db)
+    return asset
+
+
+def rebuild_portfolio_positions(portfolio):
+    """Reconstruye desde el ledger todas las posiciones de un portfolio (cambio de método)."""
+    db = router.db_for_write(Asset)
+    with transaction.atomic(using=db):
+        # Todos los assets se bloquean antes de rebuild_position (que los guarda y, con la
+        # señal, toma el contador del change log), en el mismo orden que el upsert de compras.
+        assets = list(lock_assets(Asset.objects.using(db).filter(portfolio=portfolio)))
+        for asset in assets:
+            asset.portfolio = portfolio
+            rebuild_position(asset)
+        # rebuild_position recalcula el realizado de las ventas con bulk_update (sin señales).
+        sells = AssetTransaction.objects.using(db).filter(
+            asset__portfolio=portfolio, side=AssetTransaction.Side.SELL,
+        ).values_list('id', flat=True)
+        record_changes([(portfolio.owner_id, ChangeLog.Kind.TRANSACTION, pk, False) for pk in sells], using=db)
+        reprice_alerts([asset.pk for asset in assets], using=db)
@@ -0,0 +1,138 @@
+"""
+Proyección Monte Carlo del valor de una cartera buy-and-hold, vectorizada con NumPy.
+
+Los caminos se generan a partir de las rentabilidades diarias históricas de los holdings
+(`risk.return_matrix`, en log-rentabilidades) con uno de dos métodos:
+  - bootstrap: cada día simulado es un día histórico al azar (fila completa, así se
+    conserva la correlación entre holdings);
+  - cholesky: log-rentabilidades normales multivariantes con la media y la covarianza
+    históricas (factor de Cholesky de la covarianza).
+Sólo se materializan los `steps` puntos de control del horizonte: la suma de k días
+de un tramo se obtiene de una vez.
+  - Bootstrap: los días elegidos se cuentan por (camino, tramo) con `np.bincount`,
+    lo que da una matriz multinomial de conteos. El incremento del tramo es
+    `conteos @ log_returns`, un único producto de matrices por bloque.
+  - Cholesky: el incremento de un tramo es exacto, N(k·mu, k·Sigma).
+Los caminos se procesan en bloques cuyo tamaño sale de un presupuesto en bytes
+(`chunk_bytes`) y de lo que ocupa cada camino en los arrays temporales del método, que
+crece con el horizonte, los holdings y, en el bootstrap por conteos, el historial.
+"""
+import numpy as np
+
+BOOTSTRAP = 'bootstrap'
+CHOLESKY = 'cholesky'
+METHODS = (BOOTSTRAP, CHOLESKY)
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def _segments(horizon, steps):
+    """Tamaños (en días) de los tramos entre puntos de control, sin tramos vacíos."""
+    edges = np.unique(np.linspace(0, horizon, min(steps, horizon) + 1).round().astype(np.int64))
+    return np.diff(edges)
+
+
+def _cholesky(cov):
+    """Factor de Cholesky; con covarianza singular (series idénticas o planas) añade un jitter."""
+    jitter = 0.0
+    scale = max(float(np.mean(np.diag(cov))), 1e-12)
+    while True:
+        try:
+            return np.linalg.cholesky(cov + jitter * np.eye(len(cov)))
+        except np.linalg.LinAlgError:
+            jitter = scale * 1e-10 if jitter == 0.0 else jitter * 10
+
+
+def _use_counts(days_hist, sizes):
+    """Bootstrap por conteos salvo que la matriz de conteos supere a los días muestreados."""
+    return len(sizes) * days_hist <= 16 * int(sizes.sum())
+
+
+def _path_bytes(method, days_hist, holdings, sizes):
+    """Bytes aproximados por camino en los arrays temporales de un bloque."""
+    horizon, segments = int(sizes.sum()), len(sizes)
+    # Incrementos, cumsum y exp por tramo (float64).
+    total = 3 * segments * holdings * 8
+    if method == CHOLESKY:
+        # z, z @ factor.T y el escalado.
+        return total + 3 * segments * holdings * 8
+    if _use_counts(days_hist, sizes):
+        # Días e índices de bincount (int64), conteos int64 y su copia float32.
+        return total + 3 * horizon * 8 + segments * days_hist * 12
+    # Días (int64) y las filas históricas reunidas (float32).
+    return total + horizon * 8 + horizon * holdings * 4
+
+
+def _bootstrap_increments(rng, log_returns, sizes, paths):
+    """Suma de log-rentabilidades por tramo [paths x tramos x holdings] remuestreando días."""
+    days_hist, holdings = log_returns.shape
+    horizon = int(sizes.sum())
+    segment_of_day = np.repeat(np.arange(len(sizes)), sizes)
+    days = rng.integers(0, days_hist, size=(paths, horizon))
+    if _use_counts(days_hist, sizes):
+        # Conteos multinomiales por (camino, tramo) y un producto de matrices (float32: los
+        # conteos son exactos y el producto cuesta la mitad).
+        bins = (np.arange(paths)[:, None] * len(sizes) + segment_of_day) * days_hist + days
+        counts = np.bincount(bins.ravel(), minlength=paths * len(sizes) * days_hist)
+        counts = counts.reshape(paths * len(sizes), days_hist).astype(np.float32)
+        return (counts @ log_returns.astype(np.float32)).reshape(paths, len(sizes), holdings)
+    # Historial largo frente al horizonte: la matriz de conteos sería mayor que los días
+    # muestreados y sale más barato sumarlos directamente.
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    return np.add.reduceat(log_returns.astype(np.float32)[days], starts, axis=1)
+
+
+def simulate_values(returns, values, horizon, paths, method=BOOTSTRAP, steps=12, chunk_bytes=64 << 20, seed=None):
+    """Valor simulado de la cartera en cada punto de control.
+
+    `returns`: rentabilidades diarias históricas [días x holdings]; `values`: valor actual
+    de cada holding. Devuelve (días de los puntos de control, matriz [paths x puntos]).
+    Los temporales de cada bloque ocupan como mucho unos `chunk_bytes`; el resultado,
+    paths x puntos en float64, se suma aparte.
+    """
+    log_returns = np.log1p(np.maximum(np.asarray(returns, dtype=np.float64), -0.999999))
+    values = np.asarray(values, dtype=np.float64)
+    sizes = _segments(horizon, steps)
+    rng = np.random.default_rng(seed)
+    if method == CHOLESKY:
+        mu = log_returns.mean(axis=0)
+        factor = _cholesky(np.atleast_2d(np.cov(log_returns, rowvar=False, ddof=1)))
+        scale = np.sqrt(sizes)[None, :, None]
+        drift = sizes[None, :, None] * mu
+    chunk_size = max(1, chunk_bytes // _path_bytes(method, len(log_returns), len(values), sizes))
+    out = np.empty((paths, len(sizes)))
+    for start in range(0, paths, chunk_size):
+        n = min(chunk_size, paths - start)
+        if method == CHOLESKY:
+            z = rng.standard_normal((n * len(sizes), len(values)))
+            increments = (z @ factor.T).reshape(n, len(sizes), len(values)) * scale + drift
+        else:
+            increments = _bootstrap_increments(rng, log_returns, sizes, n)
+        growth = np.exp(np.cumsum(increments, axis=1, dtype=np.float64))
+        out[start:start + n] = growth @ values
+    return np.cumsum(sizes), out
+
+
+def summarize(checkpoints, simulated, initial_value, cost_basis, confidence=0.95):
+    """Percentiles, probabilidades de pérdida y VaR/CVaR (pérdidas en positivo) del horizonte."""
+    terminal = simulated[:, -1]
+    pnl = terminal - initial_value
+    alpha = 1.0 - confidence
+    var_threshold = np.quantile(pnl, alpha)
+    tail = pnl[pnl <= var_threshold]
+    fan = np.percentile(simulated, PERCENTILES, axis=0)
+    terminal_pct = np.percentile(terminal, PERCENTILES)
+    return {
+        'initial_value': round(float(initial_value), 2),
+        'cost_basis': round(float(cost_basis), 2),
+        'expected_value': round(float(terminal.mean()), 2),
+        'percentiles': {f'p{p}': round(float(v), 2) for p, v in zip(PERCENTILES, terminal_pct)},
+        'probability_of_loss': round(float(np.mean(terminal < initial_value)), 4),
+        'probability_below_cost': round(float(np.mean(terminal < cost_basis)), 4) if cost_basis > 0 else None,
+        'confidence': confidence,
+        'value_at_risk': round(float(max(-var_threshold, 0.0)), 2),
+        'conditional_value_at_risk': round(float(max(-tail.mean(), 0.0)), 2) if len(tail) else None,
+        'fan': [
+            {'day': int(day), **{f'p{p}': round(float(fan[i, j]), 2) for i, p in enumerate(PERCENTILES)}}
+            for j, day in enumerate(checkpoints)
+        ],
+    }
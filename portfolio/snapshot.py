@@ -0,0 +1,167 @@
+"""
+Snapshot de precios compartido entre workers mediante un fichero mapeado en memoria.
+
+Un único refresco (`manage.py refresh_price_snapshot`) escribe el fichero y lo publica
+con `os.replace` (atómico); cada worker lo abre con `mmap` y lee los arrays sin
+copiarlos, así las páginas se comparten entre procesos a través de la page cache y
+ningún worker calienta su propia copia de las cotizaciones.
+
+Formato (little endian, todos los bloques alineados a 8 bytes):
+
+    cabecera   magic b'PSNP', versión u32, count u64, written_at f8
+    symbols    count x S16   (ordenados, para búsqueda binaria)
+    prices     count x f8
+    timestamps count x f8    (epoch de cada cotización)
+    currencies count x S8
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+MAGIC = b'PSNP'
+VERSION = 1
+HEADER = struct.Struct('<4sIQd')
+SYMBOL_DTYPE = np.dtype('S16')
+CURRENCY_DTYPE = np.dtype('S8')
+
+
+def write_snapshot(path, quotes, timestamps=None):
+    """Escribe `quotes` (dict symbol -> {price, currency}) en `path` de forma atómica.
+
+    `timestamps` (dict symbol -> epoch) permite conservar la edad de entradas heredadas
+    de un snapshot anterior; por defecto se usa la hora actual. Los símbolos que no caben
+    en el ancho fijo se omiten. Devuelve el número de símbolos escritos.
+    """
+    now = time.time()
+    timestamps = timestamps or {}
+    rows = sorted(
+        (symbol, quote) for symbol, quote in quotes.items()
+        if quote.get('price') is not None and len(symbol.encode()) <= SYMBOL_DTYPE.itemsize
+    )
+    count = len(rows)
+    symbols = np.array([symbol.encode() for symbol, _ in rows], dtype=SYMBOL_DTYPE)
+    prices = np.array([float(quote['price']) for _, quote in rows], dtype='<f8')
+    stamps = np.array([timestamps.get(symbol, now) for symbol, _ in rows], dtype='<f8')
+    currencies = np.array([(quote.get('currency') or '').encode()[:CURRENCY_DTYPE.itemsize] for _, quote in rows], dtype=CURRENCY_DTYPE)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.prices-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, count, now))
+            for array in (symbols, prices, stamps, currencies):
+                f.write(array.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return count
+
+
+class PriceSnapshot:
+    """Lector del snapshot; vuelve a mapear el fichero cuando el refresco lo reemplaza."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._identity = None
+        self._arrays = None
+
+    def _load(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if identity == self._identity:
+            return self._arrays
+        with self._lock:
+            if identity != self._identity:
+                self._arrays = self._map()
+                self._identity = identity
+            return self._arrays
+
+    def _map(self):
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, written_at = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            return None
+        offset = HEADER.size
+        arrays = []
+        for dtype in (SYMBOL_DTYPE, np.dtype('<f8'), np.dtype('<f8'), CURRENCY_DTYPE):
+            # np.frombuffer no copia: los arrays apuntan directamente a las páginas mapeadas.
+            arrays.append(np.frombuffer(mapped, dtype=dtype, count=count, offset=offset))
+            offset += dtype.itemsize * count
+        # El mmap anterior se libera cuando dejan de existir los arrays que lo referencian.
+        return (*arrays, written_at)
+
+    def written_at(self):
+        arrays = self._load()
+        return arrays[4] if arrays is not None else None
+
+    def lookup(self, symbols, max_age=None):
+        """Precios de `symbols`: (prices float64, currencies list, timestamps float64).
+
+        Los símbolos ausentes, o con más de `max_age` segundos, quedan como NaN / None.
+        """
+        n = len(symbols)
+        prices = np.full(n, np.nan)
+        stamps = np.full(n, np.nan)
+        currencies = [None] * n
+        arrays = self._load()
+        if arrays is None or not n or not len(arrays[0]):
+            return prices, currencies, stamps
+        index, all_prices, all_stamps, all_currencies, _ = arrays
+        keys = [s.encode() for s in symbols]
+        wanted = np.array(keys, dtype=SYMBOL_DTYPE)
+        pos = np.minimum(np.searchsorted(index, wanted), len(index) - 1)
+        found = index[pos] == wanted
+        if any(len(k) > SYMBOL_DTYPE.itemsize for k in keys):
+            # S16 trunca: un símbolo más largo nunca está en el snapshot.
+            found &= np.array([len(k) <= SYMBOL_DTYPE.itemsize for k in keys])
+        if max_age is not None:
+            found &= all_stamps[pos] >= time.time() - max_age
+        prices[found] = all_prices[pos[found]]
+        stamps[found] = all_stamps[pos[found]]
+        for i in np.flatnonzero(found):
+            currencies[i] = all_currencies[pos[i]].decode() or None
+        return prices, currencies, stamps
+
+    def quotes(self):
+        """Contenido completo: dict symbol -> ({price, currency}, timestamp)."""
+        arrays = self._load()
+        if arrays is None:
+            return {}
+        index, prices, stamps, currencies, _ = arrays
+        return {
+            symbol.decode(): ({'price': float(price), 'currency': currency.decode() or None}, float(stamp))
+            for symbol, price, stamp, currency in zip(index, prices, stamps, currencies)
+        }
+
+
+_snapshots = {}
+
+
+def get_snapshot():
+    """Lector del snapshot configurado en MARKET_SNAPSHOT_PATH, o None si está desactivado."""
+    path = settings.MARKET_SNAPSHOT_PATH
+    if not path:
+        return None
+    snapshot = _snapshots.get(path)
+    if snapshot is None:
+        snapshot = _snapshots.setdefault(path, PriceSnapshot(path))
+    return snapshot
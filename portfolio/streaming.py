@@ -0,0 +1,166 @@
+"""
+Valoración en vivo de portfolios por Server-Sent Events (requiere servir la app ASGI).
+
+Cada proceso ejecuta un único bucle de precios (`TickHub`) que consulta por lotes los
+símbolos con suscriptores y, para cada símbolo cuyo precio cambia, notifica sólo a las
+suscripciones de ese símbolo mediante el índice symbol -> suscriptores. El coste por
+tick es proporcional a los cambios de precio, no a clientes conectados x holdings.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .fx import conversion_factors
+from .pricing import get_quotes
+
+logger = logging.getLogger(__name__)
+
+
+class PortfolioSubscription:
+    """Estado incremental de un cliente conectado a la valoración de un portfolio."""
+
+    def __init__(self, portfolio_id, currency, holdings):
+        # holdings: symbol -> (quantity, cost en divisa base, factor FX a la divisa base)
+        self.portfolio_id = portfolio_id
+        self.currency = currency
+        self.holdings = holdings
+        self.values = {}
+        self.prices = {}
+        self.total_value = 0.0
+        self.total_cost = sum(cost for _, cost, _ in holdings.values())
+        self.pending = {}
+        self.wakeup = asyncio.Event()
+
+    @property
+    def symbols(self):
+        return list(self.holdings)
+
+    def on_price(self, symbol, price):
+        quantity, _, factor = self.holdings[symbol]
+        value = quantity * price * factor
+        self.total_value += value - self.values.get(symbol, 0.0)
+        self.values[symbol] = value
+        self.prices[symbol] = price
+        # Los cambios se acumulan hasta que el cliente los consume (un evento por lote).
+        self.pending[symbol] = {'price': price, 'value': round(value, 2)}
+        self.wakeup.set()
+
+    def _totals(self):
+        return {
+            'portfolio': self.portfolio_id,
+            'currency': self.currency,
+            'total_cost': round(self.total_cost, 2),
+            'current_value': round(self.total_value, 2),
+            'total_profit_loss': round(self.total_value - self.total_cost, 2),
+        }
+
+    def snapshot(self):
+        assets = {s: {'price': self.prices[s], 'value': round(self.values[s], 2)} for s in self.values}
+        return {**self._totals(), 'assets': assets}
+
+    def drain(self):
+        changes, self.pending = self.pending, {}
+        self.wakeup.clear()
+        return {**self._totals(), 'assets': changes}
+
+
+class TickHub:
+    """Bucle de precios compartido por todas las conexiones del proceso."""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.last_prices = {}
+        self._task = None
+        self._loop = None
+
+    def subscribe(self, subscription):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # El bucle de eventos cambió (p. ej. otro worker ASGI): se reinicia el estado.
+            self.subscribers.clear()
+            self._task = None
+            self._loop = loop
+        for symbol in subscription.symbols:
+            self.subscribers[symbol].add(subscription)
+            price = self.last_prices.get(symbol)
+            if price is not None and subscription.prices.get(symbol) != price:
+                subscription.on_price(symbol, price)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def unsubscribe(self, subscription):
+        for symbol in subscription.symbols:
+            subscribers = self.subscribers.get(symbol)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscribers[symbol]
+
+    def publish(self, quotes):
+        """Aplica cotizaciones nuevas y notifica sólo a los suscriptores de símbolos que cambian."""
+        for symbol, quote in quotes.items():
+            price = quote['price']
+            if price is None or self.last_prices.get(symbol) == price:
+                continue
+            self.last_prices[symbol] = price
+            for subscription in self.subscribers.get(symbol, ()):
+                subscription.on_price(symbol, price)
+
+    async def _run(self):
+        while self.subscribers:
+            try:
+                quotes = await sync_to_async(get_quotes, thread_sensitive=False)(list(self.subscribers))
+            except Exception:
+                # Un tick fallido no corta el bucle: los suscriptores siguen con el siguiente.
+                logger.exception('Price tick failed for %d symbols', len(self.subscribers))
+            else:
+                self.publish(quotes)
+            await asyncio.sleep(settings.STREAM_TICK_INTERVAL)
+
+    async def stream(self, subscription):
+        """Generador SSE: un snapshot inicial y después sólo los cambios."""
+        self.subscribe(subscription)
+        try:
+            yield _event('snapshot', subscription.snapshot())
+            while True:
+                try:
+                    await asyncio.wait_for(subscription.wakeup.wait(), settings.STREAM_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _event('valuation', subscription.drain())
+        finally:
+            self.unsubscribe(subscription)
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+def build_subscription(portfolio):
+    """Crea la suscripción de un portfolio con sus holdings convertidos a la divisa base."""
+    assets = [asset for asset in portfolio.assets.all() if asset.quantity > 0]
+    quotes = get_quotes([asset.symbol for asset in assets])
+    # Sin divisa de cotización se asume la divisa base del portfolio.
+    currencies = [(quotes.get(asset.symbol) or {}).get('currency') or portfolio.base_currency for asset in assets]
+    factors = conversion_factors(currencies, portfolio.base_currency)
+    holdings = {}
+    for asset, factor in zip(assets, factors):
+        if factor != factor:  # NaN: sin tipo de cambio disponible
+            continue
+        quantity = float(asset.quantity)
+        holdings[asset.symbol] = (quantity, quantity * float(asset.average_price) * factor, float(factor))
+    subscription = PortfolioSubscription(portfolio.id, portfolio.base_currency, holdings)
+    for symbol, quote in quotes.items():
+        if symbol in holdings:
+            subscription.on_price(symbol, quote['price'])
+    subscription.drain()
+    return subscription
+
+
+hub = TickHub()
@@ -0,0 +1,254 @@
+"""
+Change log para la sincronización incremental de portfolios (GET /api/portfolios/sync/).
+
+Cada escritura registra (usuario, versión, tipo, id, borrado) en ChangeLog:
+  - los `save()`/`delete()` del ORM, mediante las señales conectadas abajo (alta y edición
+    de portfolios desde la API, ventas, reconstrucciones de posiciones...);
+  - las escrituras masivas que no emiten señales (upsert de compras, bulk_update), con
+    llamadas explícitas a `record_changes` desde los servicios.
+Los borrados en cascada sólo registran la raíz: el tombstone de un portfolio implica sus
+assets y transacciones, y el de un asset sus transacciones.
+
+Las versiones son consecutivas por usuario y, en PostgreSQL, se reservan con un único
+`INSERT ... ON CONFLICT DO UPDATE ... RETURNING` sobre ChangeLogCounter (en otros
+motores, con un UPDATE/INSERT por usuario dentro de la misma transacción). La fila del
+contador queda bloqueada hasta el commit, así los escritores de un usuario confirman en
+orden de versión y un cliente que ya leyó la versión N nunca pierde una N-1 confirmada
+más tarde. Para no interbloquearse, el contador se toma después de bloquear los assets
+(siempre en orden de portfolio y símbolo, ver `services.lock_assets`) y, con varios
+usuarios, en orden de id; nunca se bloquea la fila del usuario.
+
+La sincronización completa también se pagina: el cursor `<versión>:<tipo>:<último id>`
+recorre los objetos por tipo e id fijando la versión del change log en la primera página,
+y lo cambiado mientras tanto llega después como delta desde esa versión.
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import F, Max, Min, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Asset, AssetTransaction, ChangeLog, ChangeLogCounter, Portfolio
+from .serializers import AssetSyncSerializer, AssetTransactionSyncSerializer, PortfolioSyncSerializer
+
+Kind = ChangeLog.Kind
+
+_SERIALIZERS = {
+    Kind.PORTFOLIO: ('portfolios', PortfolioSyncSerializer),
+    Kind.ASSET: ('assets', AssetSyncSerializer),
+    Kind.TRANSACTION: ('transactions', AssetTransactionSyncSerializer),
+}
+
+
+def _reserve_versions(using, counts):
+    """Reserva `counts[owner_id]` versiones por usuario: dict owner_id -> última versión reservada.
+
+    Los usuarios que ya no existen (borrado en curso) no aparecen: su change log
+    desaparece con ellos.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return _reserve_versions_orm(using, counts)
+    qn = connection.ops.quote_name
+    table = qn(ChangeLogCounter._meta.db_table)
+    users = qn(get_user_model()._meta.db_table)
+    owner, version = qn('owner_id'), qn('version')
+    values = ', '.join(['(%s::bigint, %s::bigint)'] * len(counts))
+    params = [value for owner_id in sorted(counts) for value in (owner_id, counts[owner_id])]
+    sql = f"""
+        INSERT INTO {table} ({owner}, {version})
+        SELECT v.owner_id, v.n FROM (VALUES {values}) AS v(owner_id, n)
+        WHERE EXISTS (SELECT 1 FROM {users} u WHERE u.{qn('id')} = v.owner_id)
+        ORDER BY v.owner_id
+        ON CONFLICT ({owner}) DO UPDATE SET {version} = {table}.{version} + EXCLUDED.{version}
+        RETURNING {owner}, {version}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def _reserve_versions_orm(using, counts):
+    # Motores sin upsert con RETURNING (SQLite en desarrollo): el UPDATE bloquea la fila del
+    # contador hasta el commit igual que el upsert; SQLite serializa además las escrituras.
+    counters = ChangeLogCounter.objects.using(using)
+    owners = get_user_model().objects.using(using).filter(pk__in=list(counts)).values_list('pk', flat=True)
+    reserved = {}
+    for owner_id in sorted(owners):
+        if not counters.filter(owner_id=owner_id).update(version=F('version') + counts[owner_id]):
+            counters.create(owner_id=owner_id, version=counts[owner_id])
+        reserved[owner_id] = counters.filter(owner_id=owner_id).values_list('version', flat=True).get()
+    return reserved
+
+
+def record_changes(changes, using=None):
+    """Registra cambios [(owner_id, kind, object_id, deleted), ...] (el último por objeto gana)."""
+    by_owner = {}
+    for owner_id, kind, object_id, deleted in changes:
+        by_owner.setdefault(owner_id, {})[(kind, object_id)] = deleted
+    if not by_owner:
+        return
+    using = using or router.db_for_write(ChangeLog)
+    with transaction.atomic(using=using):
+        last = _reserve_versions(using, {owner_id: len(entries) for owner_id, entries in by_owner.items()})
+        ChangeLog.objects.using(using).bulk_create([
+            ChangeLog(
+                owner_id=owner_id, version=last[owner_id] - len(entries) + n,
+                kind=kind, object_id=object_id, deleted=deleted,
+            )
+            for owner_id, entries in by_owner.items() if owner_id in last
+            for n, ((kind, object_id), deleted) in enumerate(entries.items(), start=1)
+        ])
+
+
+def _owner_of(instance):
+    """Usuario dueño del objeto, sin consultas si el portfolio ya está cargado."""
+    if isinstance(instance, AssetTransaction):
+        if not AssetTransaction.asset.is_cached(instance):
+            return Asset.objects.filter(pk=instance.asset_id).values_list('portfolio__owner_id', flat=True).first()
+        instance = instance.asset
+    if isinstance(instance, Asset):
+        if not Asset.portfolio.is_cached(instance):
+            return Portfolio.objects.filter(pk=instance.portfolio_id).values_list('owner_id', flat=True).first()
+        instance = instance.portfolio
+    return instance.owner_id
+
+
+def _is_root(instance, origin):
+    """True si el borrado se pidió sobre este modelo (no es una cascada desde su padre)."""
+    return isinstance(origin, type(instance)) or getattr(origin, 'model', None) is type(instance)
+
+
+_KINDS = {Portfolio: Kind.PORTFOLIO, Asset: Kind.ASSET, AssetTransaction: Kind.TRANSACTION}
+
+
+@receiver(post_save, sender=Portfolio)
+@receiver(post_save, sender=Asset)
+@receiver(post_save, sender=AssetTransaction)
+def _record_save(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    owner_id = _owner_of(instance)
+    if owner_id is not None:
+        record_changes([(owner_id, _KINDS[sender], instance.pk, False)], using)
+
+
+@receiver(post_delete, sender=Portfolio)
+@receiver(post_delete, sender=Asset)
+@receiver(post_delete, sender=AssetTransaction)
+def _record_delete(sender, instance, using=None, origin=None, **kwargs):
+    if not _is_root(instance, origin):
+        return
+    owner_id = _owner_of(instance)
+    if owner_id is not None:
+        record_changes([(owner_id, _KINDS[sender], instance.pk, True)], using)
+
+
+def _snapshot(owner):
+    return {
+        Kind.PORTFOLIO: Portfolio.objects.filter(owner=owner),
+        Kind.ASSET: Asset.objects.filter(portfolio__owner=owner),
+        Kind.TRANSACTION: AssetTransaction.objects.filter(asset__portfolio__owner=owner),
+    }
+
+
+def parse_cursor(value):
+    """Cursor del cliente: (versión, posición), con posición (tipo, último id) o None.
+
+    La posición sólo aparece en páginas de una sincronización completa. None si no hay
+    cursor; ValueError si no es un cursor devuelto por changes_since.
+    """
+    if value is None:
+        return None
+    version, *position = value.split(':')
+    version = int(version)
+    if position:
+        name, last_id = position
+        position = (name, int(last_id))
+        if name not in [name for name, _ in _SERIALIZERS.values()] or position[1] < 0:
+            raise ValueError(value)
+    if version < 0:
+        raise ValueError(value)
+    return version, position or None
+
+
+def _snapshot_page(owner, position, limit):
+    """Hasta `limit` objetos vigentes desde `position` en orden de tipo e id.
+
+    Devuelve (datos, posición del último objeto enviado o None si no quedan más).
+    """
+    data = {name: [] for name, _ in _SERIALIZERS.values()}
+    start, last_id = position or (None, 0)
+    remaining = limit
+    for kind, queryset in _snapshot(owner).items():
+        name, serializer = _SERIALIZERS[kind]
+        if start is not None:
+            if name != start:
+                continue
+            start = None
+        objects = list(queryset.filter(pk__gt=last_id).order_by('id')[:remaining])
+        data[name] = serializer(objects, many=True).data
+        remaining -= len(objects)
+        if not remaining:
+            return data, (name, objects[-1].pk)
+        last_id = 0
+    return data, None
+
+
+def changes_since(owner, since, limit):
+    """Delta del usuario desde el cursor `since` (ver parse_cursor; None: sincronización completa).
+
+    Retorna dict: cursor, reset, has_more, portfolios, assets, transactions (objetos
+    vigentes) y deleted ({portfolios, assets, transactions: [ids]}). Con reset=True el
+    cliente debe reemplazar su copia local por los objetos devueltos; las páginas
+    siguientes de la sincronización completa se añaden a ella.
+    """
+    since, position = since or (None, None)
+    bounds = ChangeLog.objects.filter(owner=owner).aggregate(first=Min('version'), last=Max('version'))
+    current = bounds['last'] or 0
+    # Cursor desconocido (futuro) o anterior a las entradas conservadas: se resincroniza todo.
+    reset = since is None or since > current or (bounds['first'] is not None and since < bounds['first'] - 1)
+    deleted = {name: [] for name, _ in _SERIALIZERS.values()}
+    if reset or position is not None:
+        # La versión queda fijada en la primera página: lo que cambie mientras se
+        # recorre el snapshot llega después como delta desde ella.
+        if reset:
+            since, position = current, None
+        data, position = _snapshot_page(owner, position, limit)
+        cursor = f'{since}:{position[0]}:{position[1]}' if position else str(since)
+        has_more = position is not None or since < current
+        return {'cursor': cursor, 'reset': reset, 'has_more': has_more, **data, 'deleted': deleted}
+
+    entries = [] if since == current else list(
+        ChangeLog.objects.filter(owner=owner, version__gt=since)
+        .order_by('version')
+        .values_list('version', 'kind', 'object_id', 'deleted')[:limit]
+    )
+    latest = {}
+    for _, kind, object_id, is_deleted in entries:
+        latest[(kind, object_id)] = is_deleted
+    querysets = _snapshot(owner)
+    data = {}
+    for kind, (name, serializer) in _SERIALIZERS.items():
+        upserts = sorted(object_id for (k, object_id), is_deleted in latest.items() if k == kind and not is_deleted)
+        objects = list(querysets[kind].filter(pk__in=upserts).order_by('id')) if upserts else []
+        found = {obj.pk for obj in objects}
+        data[name] = serializer(objects, many=True).data
+        # Modificado y borrado después (p. ej. en cascada): se envía como tombstone.
+        deleted[name] = sorted(
+            {object_id for (k, object_id), is_deleted in latest.items() if k == kind and is_deleted}
+            | (set(upserts) - found)
+        )
+    cursor = entries[-1][0] if entries else since
+    return {'cursor': str(cursor), 'reset': False, 'has_more': cursor < current, **data, 'deleted': deleted}
+
+
+def prune(days):
+    """Borra las entradas de más de `days` días salvo la última de cada usuario (guarda su versión)."""
+    cutoff = timezone.now() - timedelta(days=days)
+    latest = ChangeLog.objects.filter(owner=OuterRef('owner')).order_by('-version').values('version')[:1]
+    deleted, _ = ChangeLog.objects.filter(created_at__lt=cutoff).exclude(version=Subquery(latest)).delete()
+    return deleted
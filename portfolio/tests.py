@@ -0,0 +1,1143 @@
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from portfolio import alerts, catalogue, charts, fx, helpers, history, ledger, pricing, risk, simulation, snapshot, streaming, sync, upstream
+from portfolio.models import Asset, AssetLot, AssetTransaction, ChangeLog, ChangeLogCounter, DailyPrice, Portfolio, PriceAlert, Symbol
+from portfolio.lots import consume_lots, replay
+from portfolio.providers import StubProvider
+from portfolio.reconcile import reconcile_chunk
+from portfolio.services import apply_buys, apply_sell, rebuild_portfolio_positions
+from portfolio.upstream import CircuitBreaker, TokenBucket, UpstreamGuard, UpstreamUnavailable
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(upstream.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_refill_at_rate(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        self.assertEqual([bucket.try_acquire() for _ in range(4)], [True, True, True, False])
+        self.clock.advance(0.5)
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_refill_is_capped_at_capacity(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        bucket.try_acquire()
+        self.clock.advance(60)
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [True, True, False])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(upstream.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_allows_a_single_probe(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_probe_failure_reopens_and_success_closes(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.advance(10)
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+
+def _guard(**overrides):
+    options = dict(
+        max_concurrency=2, queue_timeout=0.01, deadline=1.0, rate=1000, burst=1000,
+        failure_threshold=2, reset_timeout=30,
+    )
+    options.update(overrides)
+    return UpstreamGuard(**options)
+
+
+@override_settings(MARKET_STUB_LATENCY=0, MARKET_STUB_FAILURE_RATE=0)
+class UpstreamGuardTests(SimpleTestCase):
+    def setUp(self):
+        self.provider = StubProvider()
+
+    def test_successful_call(self):
+        quotes = _guard().call(self.provider.quotes, ['AAPL'])
+        self.assertEqual(set(quotes), {'AAPL'})
+
+    @override_settings(MARKET_STUB_LATENCY=0.5)
+    def test_deadline_fails_fast(self):
+        guard = _guard(deadline=0.05)
+        started = time.monotonic()
+        with self.assertRaisesMessage(UpstreamUnavailable, 'exceeded'):
+            guard.call(self.provider.quotes, ['AAPL'])
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(guard.breaker.failures, 1)
+
+    @override_settings(MARKET_STUB_LATENCY=0.3)
+    def test_abandoned_calls_keep_their_slot(self):
+        guard = _guard(max_concurrency=1, deadline=0.02)
+        with self.assertRaises(UpstreamUnavailable):
+            guard.call(self.provider.quotes, ['AAPL'])
+        with self.assertRaisesMessage(UpstreamUnavailable, 'too many concurrent'):
+            guard.call(self.provider.quotes, ['AAPL'])
+
+    @override_settings(MARKET_STUB_FAILURE_RATE=1)
+    def test_failures_open_the_breaker(self):
+        guard = _guard(failure_threshold=2)
+        for _ in range(2):
+            with self.assertRaisesMessage(UpstreamUnavailable, 'Stub upstream failure'):
+                guard.call(self.provider.quotes, ['AAPL'])
+        with mock.patch.object(self.provider, 'quotes') as quotes:
+            with self.assertRaisesMessage(UpstreamUnavailable, 'circuit open'):
+                guard.call(self.provider.quotes, ['AAPL'])
+            quotes.assert_not_called()
+
+    def test_stub_histories_from_a_start_date(self):
+        start = date.today() - timedelta(days=30)
+        series = self.provider.histories(['AAPL', 'MSFT'], start=start)['AAPL']
+        self.assertGreaterEqual(len(series), 15)
+        self.assertEqual(str(series.index.tz), 'UTC')
+        self.assertGreaterEqual(series.index[0].date(), start)
+        self.assertEqual(len(self.provider.histories(['AAPL'])['AAPL']), 30)
+
+    def test_rate_limit(self):
+        guard = _guard(rate=0.001, burst=1)
+        guard.call(self.provider.quotes, ['AAPL'])
+        with self.assertRaisesMessage(UpstreamUnavailable, 'rate limited'):
+            guard.call(self.provider.quotes, ['AAPL'])
+
+
+@override_settings(
+    MARKET_PRICE_PROVIDER='portfolio.providers.StubProvider',
+    MARKET_STUB_LATENCY=0,
+    MARKET_STUB_FAILURE_RATE=0,
+    MARKET_QUOTE_TTL=60,
+    MARKET_QUOTE_STALE_GRACE=0,
+    PRICE_ALERTS_ENABLED=False,
+)
+class LastKnownFallbackTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(upstream, '_guard', _guard())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _expire_fresh_quotes(self, *symbols):
+        # Cotización caducada y fuera de la gracia stale-while-revalidate (ya no se revalida).
+        cache.delete_many([pricing._cache_key(s) for s in symbols])
+        later = time.time() + 120
+        patcher = mock.patch.object(pricing.time, 'time', return_value=later)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_serves_last_known_quote_when_upstream_fails(self):
+        fresh = pricing.get_quotes(['aapl'])['AAPL']
+        self.assertNotIn('stale', fresh)
+        self._expire_fresh_quotes('AAPL')
+        with override_settings(MARKET_STUB_FAILURE_RATE=1), mock.patch.object(pricing, '_refresh_in_background') as refresh:
+            quote = pricing.get_quotes(['AAPL', 'MSFT'])
+            refresh.assert_not_called()
+        self.assertEqual(set(quote), {'AAPL'})
+        self.assertTrue(quote['AAPL']['stale'])
+        self.assertEqual(quote['AAPL']['price'], fresh['price'])
+
+    def test_serves_last_known_quote_when_breaker_is_open(self):
+        pricing.get_quotes(['AAPL'])
+        self._expire_fresh_quotes('AAPL')
+        for _ in range(2):
+            upstream._guard.breaker.record_failure()
+        with mock.patch.object(StubProvider, 'quotes') as quotes:
+            quote = pricing.get_quote('AAPL')
+            quotes.assert_not_called()
+        self.assertTrue(quote['stale'])
+
+    def test_fresh_quotes_come_from_cache(self):
+        pricing.get_quotes(['AAPL'])
+        with mock.patch.object(StubProvider, 'quotes') as quotes:
+            quote = pricing.get_quote('AAPL')
+            quotes.assert_not_called()
+        self.assertNotIn('stale', quote)
+
+    def test_legacy_last_known_entry_is_only_a_fallback(self):
+        # Entradas escritas antes de `fetched_at`: no se revalidan, pero sirven con el upstream caído.
+        cache.set(pricing._last_known_key('AAPL'), {'symbol': 'AAPL', 'name': 'AAPL', 'price': 1.0, 'currency': 'USD'})
+        with override_settings(MARKET_STUB_FAILURE_RATE=1), mock.patch.object(pricing, '_refresh_in_background') as refresh:
+            quote = pricing.get_quote('AAPL')
+            refresh.assert_not_called()
+        self.assertEqual(quote, {'symbol': 'AAPL', 'name': 'AAPL', 'price': 1.0, 'currency': 'USD', 'stale': True})
+
+
+@override_settings(
+    MARKET_PRICE_PROVIDER='portfolio.providers.StubProvider',
+    MARKET_STUB_LATENCY=0,
+    MARKET_STUB_FAILURE_RATE=0,
+    MARKET_QUOTE_TTL=60,
+    MARKET_QUOTE_STALE_GRACE=120,
+    PRICE_ALERTS_ENABLED=False,
+)
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(upstream, '_guard', _guard())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_expired_quote_is_served_stale_and_refreshed_once(self):
+        fresh = pricing.get_quote('AAPL')
+        cache.delete(pricing._cache_key('AAPL'))
+        with mock.patch.object(pricing, '_refresher') as refresher:
+            first = pricing.get_quote('AAPL')
+            second = pricing.get_quote('AAPL')
+        self.assertEqual(first, {**fresh, 'stale': True})
+        self.assertEqual(second, first)
+        refresher.submit.assert_called_once_with(pricing._refresh, ['AAPL'])
+
+    def test_refresh_marker_outlives_the_queue_wait(self):
+        with mock.patch.object(pricing, '_refresher'), mock.patch.object(pricing.cache, 'add', return_value=True) as add:
+            pricing._refresh_in_background(['AAPL'])
+        self.assertGreaterEqual(add.call_args.kwargs['timeout'], 120)
+
+    def test_refresh_clears_the_marker(self):
+        cache.add(pricing._refresh_key('AAPL'), True)
+        pricing._refresh(['AAPL'])
+        self.assertIsNone(cache.get(pricing._refresh_key('AAPL')))
+        self.assertNotIn('stale', pricing.get_quote('AAPL'))
+
+
+@override_settings(PRICE_ALERTS_SYNC_INTERVAL=3600)
+class AlertEvaluationTests(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(username='alerts')
+        patcher = mock.patch.object(alerts, '_index', alerts.AlertIndex())
+        self.index = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _alert(self, trigger_price):
+        return PriceAlert.objects.create(
+            owner=self.owner, symbol='AAPL', direction=PriceAlert.Direction.ABOVE,
+            threshold=Decimal(trigger_price), trigger_price=Decimal(trigger_price),
+        )
+
+    def test_crossed_alert_fires_once(self):
+        alert = self._alert('100')
+        fired = alerts.evaluate({'AAPL': {'price': 120}})
+        self.assertEqual([a.pk for a in fired], [alert.pk])
+        self.assertEqual(len(self.index), 0)
+        alert.refresh_from_db()
+        self.assertFalse(alert.active)
+        self.assertEqual(alerts.evaluate({'AAPL': {'price': 130}}), [])
+
+    def test_alert_that_no_longer_crosses_goes_back_with_its_current_price(self):
+        alert = self._alert('100')
+        alerts.get_index()
+        PriceAlert.objects.filter(pk=alert.pk).update(trigger_price=Decimal('150'))
+        self.assertEqual(alerts.evaluate({'AAPL': {'price': 120}}), [])
+        self.assertEqual(self.index.entries[alert.pk], ('AAPL', PriceAlert.Direction.ABOVE, 150.0))
+        self.assertEqual([a.pk for a in alerts.evaluate({'AAPL': {'price': 160}})], [alert.pk])
+
+    def test_candidate_skipped_by_fire_stays_in_the_index(self):
+        # Fila bloqueada por otro proceso (skip_locked): fire no la devuelve.
+        alert = self._alert('100')
+        with mock.patch.object(alerts, 'fire', return_value=[]):
+            alerts.evaluate({'AAPL': {'price': 120}})
+        self.assertIn(alert.pk, self.index.entries)
+        self.assertEqual([a.pk for a in alerts.evaluate({'AAPL': {'price': 120}})], [alert.pk])
+
+    def test_deleted_alert_leaves_the_index(self):
+        alert = self._alert('100')
+        alerts.get_index()
+        alert.delete()
+        self.assertEqual(alerts.evaluate({'AAPL': {'price': 120}}), [])
+        self.assertEqual(len(self.index), 0)
+
+    @override_settings(PRICE_ALERTS_EMAIL=True)
+    def test_triggered_alert_is_emailed_to_its_owner(self):
+        self.owner.email = 'alerts@example.com'
+        self.owner.save()
+        self._alert('100')
+        with self.assertLogs('portfolio.alerts', 'INFO'):
+            alerts.evaluate({'AAPL': {'price': 120}})
+        self.assertEqual([m.to for m in mail.outbox], [['alerts@example.com']])
+        self.assertIn('AAPL', mail.outbox[0].subject)
+
+    def test_bench_alerts_fails_when_the_index_disagrees(self):
+        with mock.patch.object(alerts.AlertIndex, 'crossed', return_value=[-1]):
+            with self.assertRaises(CommandError):
+                call_command('bench_alerts', alerts=100, symbols=10, ticks=1, batch=5, stdout=io.StringIO())
+
+
+class TickHubTests(SimpleTestCase):
+    def test_publish_notifies_only_changed_symbols(self):
+        hub = streaming.TickHub()
+        aapl = streaming.PortfolioSubscription(1, 'USD', {'AAPL': (2.0, 100.0, 1.0)})
+        msft = streaming.PortfolioSubscription(2, 'USD', {'MSFT': (1.0, 50.0, 1.0)})
+        hub.subscribers['AAPL'].add(aapl)
+        hub.subscribers['MSFT'].add(msft)
+        hub.publish({'AAPL': {'price': 60.0}, 'MSFT': {'price': None}})
+        self.assertFalse(msft.wakeup.is_set())
+        self.assertEqual(aapl.drain(), {
+            'portfolio': 1, 'currency': 'USD', 'total_cost': 100.0, 'current_value': 120.0,
+            'total_profit_loss': 20.0, 'assets': {'AAPL': {'price': 60.0, 'value': 120.0}},
+        })
+        hub.publish({'AAPL': {'price': 60.0}})
+        self.assertFalse(aapl.wakeup.is_set())
+
+    @override_settings(STREAM_TICK_INTERVAL=0)
+    def test_failed_tick_is_logged_and_polling_continues(self):
+        hub = streaming.TickHub()
+        subscription = streaming.PortfolioSubscription(1, 'USD', {'AAPL': (1.0, 10.0, 1.0)})
+        quotes = mock.Mock(side_effect=[UpstreamUnavailable('down')] + [{'AAPL': {'price': 11.0}}] * 100)
+
+        async def run():
+            hub.subscribers['AAPL'].add(subscription)
+            task = asyncio.create_task(hub._run())
+            await asyncio.wait_for(subscription.wakeup.wait(), 1)
+            hub.unsubscribe(subscription)
+            await asyncio.wait_for(task, 1)
+
+        with mock.patch.object(streaming, 'get_quotes', quotes), self.assertLogs('portfolio.streaming', 'ERROR'):
+            asyncio.run(run())
+        self.assertGreaterEqual(quotes.call_count, 2)
+        self.assertEqual(subscription.prices, {'AAPL': 11.0})
+
+
+@override_settings(
+    MARKET_PRICE_PROVIDER='portfolio.providers.StubProvider',
+    MARKET_STUB_LATENCY=0,
+    MARKET_STUB_FAILURE_RATE=0,
+    PRICE_ALERTS_ENABLED=False,
+    STREAM_TICK_INTERVAL=0,
+)
+class PortfolioStreamViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner = get_user_model().objects.create_user(username='stream')
+        portfolio = Portfolio.objects.create(owner=self.owner, name='Stream')
+        portfolio.assets.create(symbol='AAPL', quantity=Decimal('2'), average_price=Decimal('100'))
+        self.url = f'/api/portfolios/{portfolio.pk}/stream/'
+        patcher = mock.patch.object(streaming, 'hub', streaming.TickHub())
+        self.hub = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_wsgi_request_is_rejected(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(self.url).status_code, 501)
+
+    async def test_asgi_stream_starts_with_a_snapshot(self):
+        client = AsyncClient()
+        self.assertEqual((await client.get(self.url)).status_code, 403)
+        await client.aforce_login(self.owner)
+        response = await client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        first = await anext(aiter(response.streaming_content))
+        self.assertTrue(first.startswith(b'event: snapshot\n'))
+        self.assertIn(b'"AAPL"', first)
+        # Sin suscriptores el bucle de precios termina.
+        self.hub.subscribers.clear()
+        await asyncio.wait_for(self.hub._task, 1)
+
+
+@override_settings(PRICE_ALERTS_ENABLED=False)
+class ReconcileFifoTests(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='reconcile')
+        portfolio = Portfolio.objects.create(owner=owner, name='FIFO', cost_basis_method=Portfolio.CostBasisMethod.FIFO)
+        apply_buys(portfolio, [('AAPL', '10', '100')])
+        apply_buys(portfolio, [('AAPL', '10', '120')])
+        self.asset = apply_sell(Asset.objects.get(portfolio=portfolio, symbol='AAPL'), '5', '130')
+
+    def _reconcile(self):
+        return reconcile_chunk(self.asset.id - 1, self.asset.id, 100, Decimal('0.01'))[2]
+
+    def _open_lots(self):
+        return sorted(AssetLot.objects.filter(asset=self.asset, remaining_quantity__gt=0).values_list('price', 'remaining_quantity'))
+
+    def test_quantity_fix_rebuilds_the_lots(self):
+        Asset.objects.filter(pk=self.asset.pk).update(quantity=Decimal('40'))
+        AssetLot.objects.filter(asset=self.asset).delete()
+        fields = {m[2] for m in self._reconcile()}
+        self.assertEqual(fields, {'lots', 'quantity'})
+        self.asset.refresh_from_db()
+        self.assertEqual(self.asset.quantity, Decimal('15'))
+        self.assertEqual(self._open_lots(), [(Decimal('100'), Decimal('5')), (Decimal('120'), Decimal('10'))])
+        self.assertEqual(self._reconcile(), [])
+        # La siguiente venta FIFO consume los lotes reconstruidos.
+        asset = apply_sell(self.asset, '5', '130')
+        self.assertEqual(asset.realized_profit_loss, Decimal('300'))
+        self.assertEqual(self._open_lots(), [(Decimal('120'), Decimal('10'))])
+
+    def test_lots_that_do_not_add_up_are_rebuilt(self):
+        AssetLot.objects.filter(asset=self.asset).update(remaining_quantity=Decimal('1'))
+        self.assertEqual([m[2:] for m in self._reconcile()], [('lots', Decimal('2'), Decimal('15'))])
+        self.assertEqual(sum(quantity for _, quantity in self._open_lots()), Decimal('15'))
+
+    def test_dry_run_reports_without_fixing(self):
+        AssetLot.objects.filter(asset=self.asset).delete()
+        _, _, mismatches = reconcile_chunk(self.asset.id - 1, self.asset.id, 100, Decimal('0.01'), fix=False)
+        self.assertEqual([m[2:] for m in mismatches], [('lots', Decimal('0'), Decimal('15'))])
+        self.assertEqual(self._open_lots(), [])
+
+
+class SymbolCatalogueTests(TestCase):
+    def setUp(self):
+        for name, value in (('_index', None), ('CHECK_INTERVAL', 0)):
+            patcher = mock.patch.object(catalogue, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _load(self, rows, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('symbol,name,exchange,currency\n')
+            f.writelines(f'{ticker},{name},NASDAQ,USD\n' for ticker, name in rows)
+        self.addCleanup(os.unlink, f.name)
+        call_command('load_symbols', f.name, *args, stdout=io.StringIO())
+
+    def test_unloaded_catalogue_accepts_any_symbol(self):
+        self.assertTrue(catalogue.is_known('ANYTHING'))
+
+    def test_load_reaches_an_index_built_before_it(self):
+        catalogue.get_index()
+        self._load([('AAPL', 'Apple Inc.'), ('MSFT', 'Microsoft Corporation')])
+        self.assertTrue(catalogue.is_known('AAPL'))
+        self.assertFalse(catalogue.is_known('ZZZZ'))
+
+    def test_empty_catalogue_after_a_load_rejects_symbols(self):
+        self._load([('AAPL', 'Apple Inc.')])
+        self._load([], '--replace')
+        self.assertEqual(Symbol.objects.count(), 0)
+        self.assertFalse(catalogue.is_known('AAPL'))
+
+    def test_search_by_prefix_then_name(self):
+        self._load([('AAPL', 'Apple Inc.'), ('AAP', 'Advance Auto Parts'), ('MSFT', 'Microsoft Corporation')])
+        index = catalogue.get_index()
+        self.assertEqual([r['symbol'] for r in index.search('aap')], ['AAP', 'AAPL'])
+        self.assertEqual([r['symbol'] for r in index.search('microsoft')], ['MSFT'])
+        self.assertEqual(index.search('  '), [])
+
+
+class SimulationTests(SimpleTestCase):
+    def setUp(self):
+        self.returns = np.random.default_rng(7).normal(0.0004, 0.01, (250, 3))
+        self.values = [1000.0, 500.0, 250.0]
+
+    def test_shapes_and_checkpoints(self):
+        for method in simulation.METHODS:
+            days, simulated = simulation.simulate_values(self.returns, self.values, 250, 300, method=method, steps=12, seed=1)
+            self.assertEqual(days[-1], 250)
+            self.assertEqual(len(days), 12)
+            self.assertEqual(simulated.shape, (300, 12))
+            self.assertTrue(np.all(simulated > 0))
+        days, simulated = simulation.simulate_values(self.returns, self.values, 5, 100, steps=12, seed=1)
+        self.assertEqual(days.tolist(), [1, 2, 3, 4, 5])
+
+    def test_seed_is_reproducible(self):
+        for method in simulation.METHODS:
+            first = simulation.simulate_values(self.returns, self.values, 60, 200, method=method, seed=3)[1]
+            second = simulation.simulate_values(self.returns, self.values, 60, 200, method=method, seed=3)[1]
+            other = simulation.simulate_values(self.returns, self.values, 60, 200, method=method, seed=4)[1]
+            np.testing.assert_array_equal(first, second)
+            self.assertFalse(np.array_equal(first, other))
+
+    def test_result_does_not_depend_on_chunk_bytes(self):
+        # Historial corto (conteos) y largo (suma directa de días) para el bootstrap.
+        for returns in (self.returns, np.random.default_rng(8).normal(0, 0.01, (2000, 3))):
+            for method in simulation.METHODS:
+                whole = simulation.simulate_values(returns, self.values, 120, 250, method=method, steps=6, seed=5)[1]
+                chunked = simulation.simulate_values(
+                    returns, self.values, 120, 250, method=method, steps=6, chunk_bytes=50_000, seed=5,
+                )[1]
+                np.testing.assert_allclose(chunked, whole, rtol=1e-6)
+
+    def test_summarize(self):
+        days = np.array([10, 20])
+        simulated = np.column_stack([np.linspace(80, 120, 101), np.linspace(1, 100, 100).tolist() + [200]])
+        result = simulation.summarize(days, simulated, initial_value=50, cost_basis=120, confidence=0.9)
+        percentiles = list(result['percentiles'].values())
+        self.assertEqual(percentiles, sorted(percentiles))
+        self.assertEqual(result['probability_of_loss'], round(49 / 101, 4))
+        self.assertEqual(result['probability_below_cost'], round(100 / 101, 4))
+        self.assertEqual(result['value_at_risk'], 39.0)
+        self.assertEqual(result['conditional_value_at_risk'], 44.0)
+        self.assertEqual([point['day'] for point in result['fan']], [10, 20])
+        for point in result['fan']:
+            self.assertLessEqual(point['p5'], point['p50'])
+            self.assertLessEqual(point['p50'], point['p95'])
+        self.assertIsNone(simulation.summarize(days, simulated, 50, 0)['probability_below_cost'])
+
+
+class SimulateViewTests(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='simulate')
+        self.client.force_login(owner)
+        portfolio = Portfolio.objects.create(owner=owner, name='MC')
+        self.url = f'/api/portfolios/{portfolio.pk}/simulate/'
+
+    def _error(self, body):
+        response = self.client.post(self.url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        return response.json()['error']
+
+    @override_settings(SIMULATION_MAX_PATHS=100000, SIMULATION_MAX_HORIZON_DAYS=2520, SIMULATION_MAX_PATH_DAYS=1000000)
+    def test_invalid_parameters(self):
+        self.assertIn('JSON object', self._error(['x']))
+        self.assertIn('must be integers', self._error({'paths': 'many'}))
+        self.assertIn('method must be one of', self._error({'method': 'garch'}))
+        self.assertIn('horizon_days must be between', self._error({'horizon_days': 0}))
+        self.assertIn('paths must be between', self._error({'paths': 10}))
+        self.assertIn('must not exceed 1000000', self._error({'paths': 10000, 'horizon_days': 250}))
+        self.assertIn('confidence', self._error({'paths': 1000, 'confidence': 1}))
+        self.assertIn('No holdings', self._error({'paths': 1000}))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Concurrent row locks need PostgreSQL')
+@override_settings(PRICE_ALERTS_ENABLED=False)
+class ConcurrentPositionTests(TransactionTestCase):
+    THREADS = 4
+    OPERATIONS = 10
+
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(username='concurrent')
+
+    def _portfolio(self, method):
+        portfolio = Portfolio.objects.create(owner=self.owner, name=method, cost_basis_method=method)
+        return portfolio, apply_buys(portfolio, [('HOT', '100', '100')])['HOT']
+
+    def _run(self, *targets):
+        errors = []
+        barrier = threading.Barrier(len(targets))
+
+        def worker(target):
+            try:
+                barrier.wait()
+                for n in range(self.OPERATIONS):
+                    target(n)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_buys_lose_no_updates(self):
+        portfolio, _ = self._portfolio(Portfolio.CostBasisMethod.AVERAGE)
+        self._run(*[
+            lambda n, i=i: apply_buys(portfolio, [('HOT', '1', 100 + (i + n) % 7), ('COLD', '2', '50')])
+            for i in range(self.THREADS)
+        ])
+        buys = self.THREADS * self.OPERATIONS
+        hot = Asset.objects.get(portfolio=portfolio, symbol='HOT')
+        cost = 100 * 100 + sum(100 + (i + n) % 7 for i in range(self.THREADS) for n in range(self.OPERATIONS))
+        self.assertEqual(hot.quantity, 100 + buys)
+        self.assertAlmostEqual(hot.average_price, Decimal(cost) / (100 + buys), delta=Decimal('0.01'))
+        self.assertEqual(Asset.objects.get(portfolio=portfolio, symbol='COLD').quantity, 2 * buys)
+        self.assertEqual(hot.transactions.count(), 1 + buys)
+
+    def test_concurrent_buys_and_sells_match_the_sequential_ledger(self):
+        for method in Portfolio.CostBasisMethod.values:
+            with self.subTest(method=method):
+                portfolio, asset = self._portfolio(method)
+                self._run(
+                    *[lambda n: apply_buys(portfolio, [('HOT', '1', '110')])] * (self.THREADS // 2),
+                    *[lambda n: apply_sell(asset, '1', '120')] * (self.THREADS // 2),
+                )
+                asset.refresh_from_db()
+                operations = self.THREADS // 2 * self.OPERATIONS
+                self.assertEqual(asset.quantity, 100)
+                # El resultado es el de aplicar las transacciones una a una en el orden del ledger.
+                state = replay(asset.transactions.order_by('created_at', 'id'), method)
+                self.assertEqual(asset.quantity, state['quantity'])
+                self.assertAlmostEqual(asset.average_price, state['average_price'], delta=Decimal('0.01'))
+                self.assertAlmostEqual(asset.realized_profit_loss, state['realized_profit_loss'], delta=Decimal('0.01'))
+                if method == Portfolio.CostBasisMethod.FIFO:
+                    # Todas las ventas salen del lote inicial, sea cual sea el orden.
+                    self.assertEqual(asset.realized_profit_loss, operations * 20)
+                    expected = Decimal((100 - operations) * 100 + operations * 110) / 100
+                    self.assertAlmostEqual(asset.average_price, expected, delta=Decimal('0.01'))
+
+
+def _ledger(*rows):
+    return [
+        AssetTransaction(side=side, quantity=Decimal(quantity), price=Decimal(price))
+        for side, quantity, price in rows
+    ]
+
+
+BUY, SELL = AssetTransaction.Side.BUY, AssetTransaction.Side.SELL
+AVERAGE, FIFO = Portfolio.CostBasisMethod.AVERAGE, Portfolio.CostBasisMethod.FIFO
+
+
+class ReplayTests(SimpleTestCase):
+    def test_average_cost(self):
+        state = replay(_ledger((BUY, 10, 100), (BUY, 10, 120), (SELL, 5, 130), (SELL, 5, 90)), AVERAGE)
+        self.assertEqual(state['quantity'], 10)
+        self.assertEqual(state['average_price'], 110)
+        self.assertEqual([tx.realized_profit_loss for tx in state['sells']], [100, -100])
+        self.assertEqual(state['realized_profit_loss'], 0)
+        self.assertEqual(len(state['lots']), 0)
+
+    def test_fifo_consumes_the_oldest_lots_first(self):
+        state = replay(_ledger((BUY, 10, 100), (BUY, 10, 120), (SELL, 5, 130), (SELL, 10, 130)), FIFO)
+        self.assertEqual([tx.realized_profit_loss for tx in state['sells']], [150, 200])
+        self.assertEqual(state['quantity'], 5)
+        self.assertEqual(state['average_price'], 120)
+        self.assertEqual([(tx.price, remaining) for tx, remaining in state['lots']], [(120, 5)])
+
+    def test_buy_after_selling_out(self):
+        state = replay(_ledger((BUY, 10, 100), (SELL, 10, 110), (BUY, 4, 50)), FIFO)
+        self.assertEqual(state['quantity'], 4)
+        self.assertEqual(state['average_price'], 50)
+        self.assertEqual(state['realized_profit_loss'], 100)
+
+
+@override_settings(PRICE_ALERTS_ENABLED=False)
+class LotEngineTests(TestCase):
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='lots')
+        self.portfolio = Portfolio.objects.create(owner=owner, name='Lots')
+        apply_buys(self.portfolio, [('AAPL', '10', '100')])
+        self.asset = apply_buys(self.portfolio, [('AAPL', '10', '120')])['AAPL']
+
+    def _switch(self, method):
+        self.portfolio.cost_basis_method = method
+        self.portfolio.save()
+        rebuild_portfolio_positions(self.portfolio)
+        self.asset.refresh_from_db()
+
+    def _open_lots(self):
+        return list(self.asset.lots.filter(remaining_quantity__gt=0).values_list('price', 'remaining_quantity'))
+
+    def test_consume_lots_across_lots(self):
+        self._switch(FIFO)
+        self.assertEqual(consume_lots(self.asset, Decimal('15')), 1600)
+        self.assertEqual(self._open_lots(), [(120, 5)])
+
+    def test_fifo_average_after_sells_comes_from_the_remaining_lots(self):
+        self._switch(FIFO)
+        self.assertEqual(self._open_lots(), [(100, 10), (120, 10)])
+        self.assertEqual(self.asset.average_price, 110)
+        apply_sell(self.asset, '5', '130')
+        asset = apply_sell(self.asset, '10', '130')
+        self.assertEqual(asset.average_price, Decimal('120'))
+        self.assertEqual(asset.quantity, 5)
+        self.assertEqual(asset.realized_profit_loss, 350)
+
+    def test_switch_back_to_average_replays_the_ledger(self):
+        self._switch(FIFO)
+        apply_sell(self.asset, '5', '130')
+        self._switch(AVERAGE)
+        self.assertEqual(self._open_lots(), [])
+        self.assertEqual(self.asset.average_price, 110)
+        self.assertEqual(self.asset.realized_profit_loss, 100)
+        self.assertEqual(self.asset.transactions.get(side=SELL).realized_profit_loss, 100)
+
+
+@override_settings(MARKET_FX_TTL=60, MARKET_FX_CURRENCIES=['USD', 'EUR', 'GBP'])
+class FxTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(fx, 'fetch_quotes', return_value={
+            'EURUSD=X': {'price': 1.1}, 'GBPUSD=X': {'price': 1.25},
+        })
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rates_are_fetched_in_one_batch_and_cached(self):
+        self.assertEqual(fx.get_rates(['EUR', 'GBp', 'USD', None], 'usd'), {'EUR': 1.1, 'GBp': 0.0125, 'USD': 1.0})
+        self.assertEqual(sorted(self.fetch.call_args.args[0]), ['EURUSD=X', 'GBPUSD=X'])
+        fx.get_rates(['EUR', 'GBP'], 'USD')
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_unknown_and_unavailable_currencies_are_not_converted(self):
+        self.fetch.side_effect = upstream.UpstreamUnavailable('down')
+        factors = fx.conversion_factors(['USD', None, 'EUR'], 'USD')
+        self.assertEqual(factors[0], 1.0)
+        self.assertTrue(np.isnan(factors[1]))
+        self.assertTrue(np.isnan(factors[2]))
+
+
+@override_settings(
+    MARKET_PRICE_PROVIDER='portfolio.providers.StubProvider',
+    MARKET_STUB_LATENCY=0,
+    MARKET_STUB_FAILURE_RATE=0,
+    MARKET_SNAPSHOT_PATH='',
+    MARKET_FX_CURRENCIES=['USD', 'EUR'],
+    PRICE_ALERTS_ENABLED=False,
+)
+class DashboardCurrencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner = get_user_model().objects.create_user(username='fx')
+        self.client.force_login(self.owner)
+        self.portfolio = Portfolio.objects.create(owner=self.owner, name='FX')
+        self.portfolio.assets.create(symbol='AAPL', quantity=Decimal('2'), average_price=Decimal('100'))
+        patcher = mock.patch.object(fx, 'fetch_quotes', return_value={'USDEUR=X': {'price': 0.5}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_dashboard_converts_to_the_requested_currency(self):
+        usd = self.client.get('/api/portfolios/dashboard/').json()
+        eur = self.client.get('/api/portfolios/dashboard/?currency=eur').json()
+        self.assertEqual((usd['currency'], usd['total_investment_cost']), ('USD', 200.0))
+        self.assertEqual((eur['currency'], eur['total_investment_cost'], eur['fx_basis']), ('EUR', 100.0, 'current_rate'))
+
+    def test_unsupported_currency_is_rejected(self):
+        self.assertEqual(self.client.get('/api/portfolios/dashboard/?currency=XYZ').status_code, 400)
+
+    def test_quote_without_currency_uses_the_portfolio_base(self):
+        with mock.patch.object(helpers, 'get_quotes', return_value={'AAPL': {'price': 150.0, 'currency': None}}):
+            perf = helpers.portfolio_performance(list(self.portfolio.assets.all()), 'EUR', with_transactions=False)
+        (item,) = perf.values()
+        self.assertEqual((item['fx_rate'], item['total_cost'], item['actual_value']), (0.5, 100.0, 150.0))
+
+
+class LttbTests(SimpleTestCase):
+    def test_keeps_endpoints_and_returns_max_points(self):
+        x = np.arange(1000)
+        y = np.sin(x / 25.0)
+        idx = charts.lttb(x, y, 50)
+        self.assertEqual(len(idx), 50)
+        self.assertEqual((idx[0], idx[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(idx) > 0))
+
+    def test_short_series_pass_through(self):
+        for n in (0, 2, 10):
+            np.testing.assert_array_equal(charts.lttb(np.arange(n), np.ones(n), 10), np.arange(n))
+
+    def test_keeps_the_peak(self):
+        y = np.zeros(100)
+        y[57] = 10.0
+        self.assertIn(57, charts.lttb(np.arange(100), y, 10))
+
+
+class MarketQuoteHistoryTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user(username='quotes'))
+        quote = {'symbol': 'AAPL', 'name': 'Apple', 'price': 150.0}
+        patcher = mock.patch('portfolio.views.get_quote', return_value=quote)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_empty_history_returns_the_price(self):
+        # yfinance devuelve un DataFrame vacío (sin DatetimeIndex) cuando no hay cotizaciones.
+        with mock.patch('portfolio.views.get_history', return_value=pd.DataFrame(columns=['Close'])['Close']):
+            response = self.client.get('/api/market/quote/?symbol=AAPL&period=1d')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['price'], response.json()['history']), (150.0, []))
+
+
+class PriceSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'prices.snap')
+
+    def test_round_trip(self):
+        written = snapshot.write_snapshot(self.path, {
+            'MSFT': {'price': 300.5, 'currency': 'USD'},
+            'AAPL': {'price': 150.25, 'currency': None},
+            'NOPRICE': {'price': None},
+            'A' * 17: {'price': 1.0},
+        })
+        self.assertEqual(written, 2)
+        prices, currencies, _ = snapshot.PriceSnapshot(self.path).lookup(['AAPL', 'ZZZ', 'MSFT', 'A' * 17])
+        np.testing.assert_array_equal(prices, [150.25, np.nan, 300.5, np.nan])
+        self.assertEqual(currencies, [None, None, 'USD', None])
+
+    def test_missing_file_reads_as_empty(self):
+        reader = snapshot.PriceSnapshot(self.path)
+        self.assertIsNone(reader.written_at())
+        self.assertEqual(reader.quotes(), {})
+        prices, currencies, _ = reader.lookup(['AAPL'])
+        self.assertTrue(np.isnan(prices[0]))
+        self.assertEqual(currencies, [None])
+
+    def test_reader_follows_a_new_generation_and_drops_stale_entries(self):
+        reader = snapshot.PriceSnapshot(self.path)
+        snapshot.write_snapshot(self.path, {'AAPL': {'price': 100.0}})
+        self.assertEqual(reader.lookup(['AAPL'])[0][0], 100.0)
+        snapshot.write_snapshot(
+            self.path, {'AAPL': {'price': 110.0}, 'MSFT': {'price': 50.0}}, {'MSFT': time.time() - 600},
+        )
+        prices, _, _ = reader.lookup(['AAPL', 'MSFT'], max_age=120)
+        self.assertEqual(prices[0], 110.0)
+        self.assertTrue(np.isnan(prices[1]))
+        self.assertEqual(reader.lookup(['MSFT'])[0][0], 50.0)
+
+
+class RefreshPriceSnapshotTests(TestCase):
+    def test_keeps_unrefreshed_holdings_and_drops_sold_symbols(self):
+        owner = get_user_model().objects.create_user(username='snapshot')
+        portfolio = Portfolio.objects.create(owner=owner, name='Snap')
+        portfolio.assets.create(symbol='AAPL', quantity=Decimal('1'), average_price=Decimal('1'))
+        portfolio.assets.create(symbol='MSFT', quantity=Decimal('1'), average_price=Decimal('1'))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'prices.snap')
+            snapshot.write_snapshot(path, {'MSFT': {'price': 50.0}, 'SOLD': {'price': 1.0}}, {'MSFT': 1000.0})
+            fetch = mock.patch(
+                'portfolio.management.commands.refresh_price_snapshot.fetch_quotes',
+                side_effect=[{'AAPL': {'price': 150.0}}, UpstreamUnavailable('down')],
+            )
+            with fetch:
+                call_command('refresh_price_snapshot', path=path, once=True, batch_size=1,
+                             stdout=io.StringIO(), stderr=io.StringIO())
+            quotes = snapshot.PriceSnapshot(path).quotes()
+        self.assertEqual(sorted(quotes), ['AAPL', 'MSFT'])
+        self.assertEqual(quotes['AAPL'][0]['price'], 150.0)
+        self.assertEqual(quotes['MSFT'], ({'price': 50.0, 'currency': None}, 1000.0))
+
+
+@override_settings(
+    MARKET_PRICE_PROVIDER='portfolio.providers.StubProvider',
+    MARKET_STUB_LATENCY=0,
+    MARKET_STUB_FAILURE_RATE=0,
+    MARKET_QUOTE_TTL=60,
+    MARKET_QUOTE_MISSING_TTL=30,
+    PRICE_ALERTS_ENABLED=False,
+)
+class BatchedQuotesTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(upstream, '_guard', _guard())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _provider(self, known=('AAPL', 'MSFT', 'TSLA')):
+        return mock.patch.object(StubProvider, 'quotes', autospec=True, side_effect=lambda self, symbols: {
+            s: {'symbol': s, 'name': s, 'price': 100.0, 'currency': 'USD'} for s in symbols if s in known
+        })
+
+    def test_cache_misses_are_fetched_in_one_call(self):
+        pricing.get_quotes(['AAPL'])
+        with self._provider() as quotes:
+            result = pricing.get_quotes(['aapl', 'MSFT', 'TSLA', 'msft'])
+        self.assertEqual(sorted(result), ['AAPL', 'MSFT', 'TSLA'])
+        quotes.assert_called_once()
+        self.assertEqual(quotes.call_args.args[1], ['MSFT', 'TSLA'])
+        with self._provider() as quotes:
+            pricing.get_quotes(['AAPL', 'MSFT', 'TSLA'])
+            quotes.assert_not_called()
+
+    def test_unknown_symbols_are_negatively_cached(self):
+        with self._provider() as quotes:
+            self.assertEqual(sorted(pricing.get_quotes(['AAPL', 'NOPE'])), ['AAPL'])
+            self.assertIsNone(pricing.get_quote('NOPE'))
+            self.assertEqual(sorted(pricing.get_quotes(['NOPE', 'MSFT'])), ['MSFT'])
+        self.assertEqual([c.args[1] for c in quotes.call_args_list], [['AAPL', 'NOPE'], ['MSFT']])
+        # Al caducar la marca se vuelve a consultar.
+        cache.delete(pricing._missing_key('NOPE'))
+        with self._provider(known=('NOPE',)) as quotes:
+            self.assertIsNotNone(pricing.get_quote('NOPE'))
+            quotes.assert_called_once()
+
+    @override_settings(MARKET_QUOTE_MISSING_TTL=0)
+    def test_negative_cache_can_be_disabled(self):
+        with self._provider() as quotes:
+            pricing.get_quote('NOPE')
+            pricing.get_quote('NOPE')
+        self.assertEqual(quotes.call_count, 2)
+
+
+class SyncDailyPricesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.today = date.today()
+        self.start = self.today - timedelta(days=60)
+        patcher = mock.patch.object(history, 'get_histories', return_value={})
+        self.get_histories = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _prices(self, symbol, first, last):
+        DailyPrice.objects.bulk_create([
+            DailyPrice(symbol=symbol, date=first + timedelta(days=i), close=100.0)
+            for i in range((last - first).days + 1)
+        ])
+
+    def test_downloads_only_the_missing_ranges_in_one_batch(self):
+        self._prices('FRESH', self.start, self.today)
+        self._prices('BEHIND', self.start, self.today - timedelta(days=10))
+        self._prices('LATE', self.start + timedelta(days=20), self.today)
+        # Un hueco inicial dentro de la tolerancia (fin de semana largo) no se vuelve a pedir.
+        self._prices('TOLERATED', self.start + timedelta(days=5), self.today)
+        history.sync_daily_prices(['FRESH', 'BEHIND', 'LATE', 'NEW', 'TOLERATED'], self.start)
+        self.get_histories.assert_called_once()
+        self.assertEqual(sorted(self.get_histories.call_args.args[0]), ['BEHIND', 'LATE', 'NEW'])
+        self.assertEqual(self.get_histories.call_args.kwargs, {'start': self.start})
+
+    def test_stale_series_resumes_from_its_last_close(self):
+        last = self.today - timedelta(days=10)
+        self._prices('BEHIND', self.start, last)
+        self.get_histories.return_value = {'BEHIND': pd.Series(
+            [100.0, 101.0, 102.0], index=pd.to_datetime([last, last + timedelta(days=1), last + timedelta(days=2)]),
+        )}
+        self.assertEqual(history.sync_daily_prices(['BEHIND'], self.start), 2)
+        self.assertEqual(self.get_histories.call_args.kwargs, {'start': last})
+
+    def test_symbols_are_checked_once_per_marker_ttl(self):
+        history.sync_daily_prices(['NEW'], self.start)
+        history.sync_daily_prices(['NEW'], self.start)
+        self.assertEqual(self.get_histories.call_count, 1)
+
+    def test_failed_download_is_retried(self):
+        self.get_histories.side_effect = UpstreamUnavailable('down')
+        with self.assertLogs('portfolio.history', 'WARNING'):
+            self.assertEqual(history.sync_daily_prices(['NEW'], self.start), 0)
+        self.get_histories.side_effect = None
+        history.sync_daily_prices(['NEW'], self.start)
+        self.assertEqual(self.get_histories.call_count, 2)
+
+
+class RiskMetricsTests(TestCase):
+    # Rentabilidades diarias del benchmark; la cartera (un único holding) las duplica.
+    BENCHMARK = [0.01, -0.02, 0.03, -0.01]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.start = date(2024, 1, 1)
+        rows = []
+        for symbol, scale in (('SPY', 1), ('AAPL', 2)):
+            close = 100.0
+            rows.append(DailyPrice(symbol=symbol, date=self.start, close=close))
+            for i, r in enumerate(self.BENCHMARK, start=1):
+                close *= 1 + scale * r
+                rows.append(DailyPrice(symbol=symbol, date=self.start + timedelta(days=i), close=close))
+        DailyPrice.objects.bulk_create(rows)
+
+    def test_max_drawdown(self):
+        self.assertAlmostEqual(risk.max_drawdown(np.array([0.02, -0.04, 0.06, -0.02])), -0.04)
+        self.assertAlmostEqual(risk.max_drawdown(np.array([0.1, -0.5, 0.2])), -0.5)
+        self.assertEqual(risk.max_drawdown(np.array([0.01, 0.02])), 0.0)
+        self.assertEqual(risk.max_drawdown(np.array([])), 0.0)
+
+    def test_portfolio_risk_known_values(self):
+        metrics = risk.portfolio_risk(['AAPL'], [1.0], 'SPY', self.start, self.start + timedelta(days=10))
+        self.assertEqual(metrics['observations'], 4)
+        # std muestral de [0.02, -0.04, 0.06, -0.02] = 0.044347 por sqrt(252).
+        self.assertAlmostEqual(metrics['annualized_volatility'], 0.703989, places=6)
+        self.assertAlmostEqual(metrics['annualized_return'], 1.26, places=6)
+        self.assertAlmostEqual(metrics['max_drawdown'], -0.04, places=6)
+        self.assertAlmostEqual(metrics['sharpe_ratio'], 1.7898, places=4)
+        self.assertAlmostEqual(metrics['beta'], 2.0, places=4)
+        self.assertEqual(metrics['correlation']['matrix'], [[1.0]])
+
+    def test_not_enough_history(self):
+        self.assertIsNone(risk.portfolio_risk(['AAPL'], [1.0], 'SPY', self.start, self.start + timedelta(days=1)))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Ledger partitioning needs PostgreSQL')
+@override_settings(PRICE_ALERTS_ENABLED=False)
+class PartitionedLedgerTests(TestCase):
+    # El DDL es transaccional en PostgreSQL: el rollback de cada test deshace el particionado.
+    def setUp(self):
+        owner = get_user_model().objects.create_user(username='partitioned')
+        self.portfolio = Portfolio.objects.create(owner=owner, name='Ledger', cost_basis_method=FIFO)
+        apply_buys(self.portfolio, [('AAPL', '10', '100')])
+        with connection.cursor() as cursor:
+            # El FK diferido de los lotes dejaría eventos pendientes que impiden el DROP TABLE.
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        self.assertTrue(ledger.partition(connection))
+        self.assertTrue(ledger.is_partitioned(connection))
+
+    def _partition_of(self, transaction):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT tableoid::regclass::text FROM {AssetTransaction._meta.db_table} WHERE id = %s',
+                [transaction.pk],
+            )
+            return cursor.fetchone()[0]
+
+    def test_reads_and_writes_after_partitioning(self):
+        asset = apply_buys(self.portfolio, [('AAPL', '10', '120')])['AAPL']
+        asset = apply_sell(asset, '15', '130')
+        self.assertEqual((asset.quantity, asset.average_price, asset.realized_profit_loss), (5, 120, 350))
+        sell = asset.transactions.get(side=SELL)
+        table = AssetTransaction._meta.db_table
+        self.assertEqual(self._partition_of(sell), f'{table}_y{sell.created_at.year}')
+        rebuild_portfolio_positions(self.portfolio)
+        self.assertEqual(list(asset.lots.filter(remaining_quantity__gt=0).values_list('price', 'remaining_quantity')), [(120, 5)])
+        # Fuera del rango de las particiones anuales la fila va a DEFAULT (y se mueve al actualizarla).
+        AssetTransaction.objects.filter(pk=sell.pk).update(created_at=sell.created_at.replace(year=2001))
+        self.assertEqual(self._partition_of(sell), f'{table}_default')
+        self.assertEqual(list(asset.transactions.order_by('created_at').values_list('side', flat=True)), [SELL, BUY, BUY])
+
+    def test_deleting_an_asset_removes_its_lots_without_the_foreign_key(self):
+        asset = Asset.objects.get(portfolio=self.portfolio, symbol='AAPL')
+        self.assertEqual(asset.lots.count(), 1)
+        asset.delete()
+        self.assertFalse(AssetLot.objects.exists())
+        self.assertFalse(AssetTransaction.objects.exists())
+
+    def test_unpartition_restores_the_lot_foreign_key(self):
+        self.assertTrue(ledger.unpartition(connection))
+        self.assertFalse(ledger.is_partitioned(connection))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f' AND confrelid = %s::regclass",
+                [AssetLot._meta.db_table, AssetTransaction._meta.db_table],
+            )
+            self.assertIsNotNone(cursor.fetchone())
+        asset = apply_buys(self.portfolio, [('AAPL', '1', '110')])['AAPL']
+        self.assertEqual(asset.quantity, 11)
+
+
+@override_settings(PRICE_ALERTS_ENABLED=False)
+class SyncChangesTests(TestCase):
+    def setUp(self):
+        self.owner = get_user_model().objects.create_user(username='sync')
+        self.client.force_login(self.owner)
+        self.portfolio = Portfolio.objects.create(owner=self.owner, name='Sync')
+        self.assets = apply_buys(self.portfolio, [('AAPL', '1', '100'), ('MSFT', '2', '50')])
+
+    def _sync(self, since=None, limit=1000):
+        return sync.changes_since(self.owner, sync.parse_cursor(since), limit)
+
+    def _ids(self, page):
+        return {name: [row['id'] for row in page[name]] for name in ('portfolios', 'assets', 'transactions')}
+
+    def test_full_sync_is_paginated_and_pinned_to_its_version(self):
+        full = self._sync()
+        pages, cursor = [], None
+        while True:
+            page = self._sync(cursor, limit=2)
+            pages.append(page)
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual([page['reset'] for page in pages], [True, False, False])
+        self.assertEqual(cursor, full['cursor'])
+        for name, ids in self._ids(full).items():
+            self.assertEqual(sum((self._ids(page)[name] for page in pages), []), ids)
+        self.assertEqual(self._sync(cursor)['has_more'], False)
+
+    def test_changes_during_a_paginated_full_sync_arrive_as_a_delta(self):
+        first = self._sync(limit=2)
+        late = apply_buys(self.portfolio, [('TSLA', '1', '10')])['TSLA']
+        page = self._sync(first['cursor'], limit=1000)
+        self.assertFalse(page['reset'])
+        self.assertTrue(page['has_more'])
+        delta = self._sync(page['cursor'])
+        self.assertIn(late.pk, self._ids(delta)['assets'])
+        self.assertFalse(delta['has_more'])
+
+    def test_delta_sends_upserts_and_tombstones(self):
+        cursor = self._sync()['cursor']
+        apply_sell(self.assets['AAPL'], '1', '120')
+        msft = self.assets['MSFT'].pk
+        self.assets['MSFT'].delete()
+        delta = self._sync(cursor)
+        self.assertFalse(delta['reset'])
+        self.assertEqual(self._ids(delta)['assets'], [self.assets['AAPL'].pk])
+        self.assertEqual(len(delta['transactions']), 1)
+        # Borrado en cascada: sólo el tombstone de la raíz.
+        self.assertEqual(delta['deleted'], {'portfolios': [], 'assets': [msft], 'transactions': []})
+        self.assertEqual(self._sync(delta['cursor'])['deleted']['assets'], [])
+
+    def test_modified_then_deleted_object_is_a_tombstone(self):
+        cursor = self._sync()['cursor']
+        asset = self.assets['AAPL']
+        asset.save()
+        sync.record_changes([(self.owner.pk, ChangeLog.Kind.PORTFOLIO, self.portfolio.pk, False)])
+        Portfolio.objects.filter(pk=self.portfolio.pk).delete()
+        delta = self._sync(cursor)
+        self.assertEqual(delta['portfolios'], [])
+        self.assertEqual(delta['deleted']['portfolios'], [self.portfolio.pk])
+        self.assertEqual(delta['deleted']['assets'], [asset.pk])
+
+    def test_delta_is_paginated(self):
+        cursor = self._sync()['cursor']
+        for n in range(3):
+            apply_buys(self.portfolio, [('AAPL', '1', str(100 + n))])
+        page = self._sync(cursor, limit=2)
+        self.assertTrue(page['has_more'])
+        self.assertFalse(self._sync(page['cursor'], limit=1000)['has_more'])
+
+    def test_expired_or_future_cursors_reset(self):
+        self.assertTrue(self._sync(str(int(self._sync()['cursor']) + 5))['reset'])
+        ChangeLog.objects.filter(owner=self.owner).exclude(
+            version=ChangeLog.objects.filter(owner=self.owner).order_by('-version').values('version')[:1],
+        ).delete()
+        self.assertTrue(self._sync('0')['reset'])
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ('abc', '-1', '3:assets', '3:lots:1', '3:assets:-1'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/api/portfolios/sync/', {'since': cursor}).status_code, 400)
+        self.assertEqual(self.client.get('/api/portfolios/sync/').json()['reset'], True)
+
+    def test_orm_version_reservation_matches_the_upsert(self):
+        before = ChangeLogCounter.objects.get(owner=self.owner).version
+        other = get_user_model().objects.create_user(username='other')
+        reserved = sync._reserve_versions_orm('default', {self.owner.pk: 3, other.pk: 2, 10 ** 9: 1})
+        self.assertEqual(reserved, {self.owner.pk: before + 3, other.pk: 2})
+        self.assertEqual(sync._reserve_versions_orm('default', {other.pk: 1}), {other.pk: 3})
@@ -0,0 +1,148 @@
+"""
+Guard para las llamadas al proveedor de datos de mercado.
+
+Cada llamada pasa, en orden, por:
+  - circuit breaker: tras MARKET_BREAKER_FAILURES fallos seguidos se abre y las
+    llamadas fallan al instante durante MARKET_BREAKER_RESET segundos; después deja
+    pasar una sola llamada de prueba (half-open) que lo cierra o lo vuelve a abrir;
+  - token bucket: como máximo MARKET_UPSTREAM_RATE llamadas/s (ráfagas de MARKET_UPSTREAM_BURST);
+  - semáforo: como máximo MARKET_UPSTREAM_MAX_CONCURRENCY llamadas en vuelo por proceso,
+    esperando un hueco MARKET_UPSTREAM_QUEUE_TIMEOUT segundos como mucho;
+  - deadline: la llamada corre en un pool de hilos y se abandona pasados
+    MARKET_UPSTREAM_TIMEOUT segundos. El hueco del semáforo se libera cuando la llamada
+    termina de verdad, de modo que las llamadas colgadas siguen contando para el límite.
+
+Cualquier rechazo se reporta como `UpstreamUnavailable`; la capa de precios decide el
+fallback (precios en caché o último precio conocido).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    """El proveedor no está disponible: breaker abierto, límite alcanzado, timeout o error."""
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.reset_timeout:
+                # Una única llamada de prueba por ventana; el resto sigue fallando rápido
+                # hasta que ésta responda (o se pierda y pase otra ventana).
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning('Market data circuit breaker opened after %s failures', self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class UpstreamGuard:
+    def __init__(self, max_concurrency, queue_timeout, deadline, rate, burst, failure_threshold, reset_timeout):
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.bucket = TokenBucket(rate, burst)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='market-upstream')
+
+    def call(self, fn, *args, **kwargs):
+        if not self.breaker.allow():
+            raise UpstreamUnavailable('circuit open')
+        if not self.bucket.try_acquire():
+            raise UpstreamUnavailable('rate limited')
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise UpstreamUnavailable('too many concurrent upstream calls')
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.deadline)
+        except FutureTimeoutError:
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(f'upstream call exceeded {self.deadline}s') from None
+        except Exception as e:
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(str(e) or e.__class__.__name__) from e
+        self.breaker.record_success()
+        return result
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_guard():
+    """Guard del proceso, creado en el primer uso con los settings MARKET_UPSTREAM_* / MARKET_BREAKER_*."""
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                _guard = UpstreamGuard(
+                    max_concurrency=settings.MARKET_UPSTREAM_MAX_CONCURRENCY,
+                    queue_timeout=settings.MARKET_UPSTREAM_QUEUE_TIMEOUT,
+                    deadline=settings.MARKET_UPSTREAM_TIMEOUT,
+                    rate=settings.MARKET_UPSTREAM_RATE,
+                    burst=settings.MARKET_UPSTREAM_BURST,
+                    failure_threshold=settings.MARKET_BREAKER_FAILURES,
+                    reset_timeout=settings.MARKET_BREAKER_RESET,
+                )
+    return _guard
+
+
+def guarded_call(fn, *args, **kwargs):
+    return get_guard().call(fn, *args, **kwargs)
@@ -1,11 +1,15 @@
 from rest_framework.routers import DefaultRouter
-from portfolio.views import PortfolioViewSet, AssetViewSet, MarketQuoteView
+from portfolio.views import PortfolioViewSet, AssetViewSet, PriceAlertViewSet, MarketQuoteView, MarketQuotesView, SymbolSearchView, portfolio_stream
 from django.urls import path
 
 router = DefaultRouter()
 router.register(r'portfolios', PortfolioViewSet, basename='portfolio')
 router.register(r'assets', AssetViewSet, basename='asset')
+router.register(r'alerts', PriceAlertViewSet, basename='alert')
 
 urlpatterns = router.urls + [
 	path('market/quote/', MarketQuoteView.as_view(), name='market-quote'),
+	path('market/quotes/', MarketQuotesView.as_view(), name='market-quotes'),
+	path('market/symbols/', SymbolSearchView.as_view(), name='market-symbols'),
+	path('portfolios/<int:pk>/stream/', portfolio_stream, name='portfolio-stream'),
 ]
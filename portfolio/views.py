@@ -1,13 +1,29 @@
 
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import Portfolio, Asset, AssetTransaction
-from .serializers import PortfolioSerializer, AssetSerializer, AssetTransactionSerializer
-from django.db import transaction
-import yfinance as yf
-from .helpers import asset_weighted_performance
+from . import analytics
+from .models import Portfolio, Asset, AssetTransaction, PriceAlert
+from .serializers import PortfolioSerializer, AssetSerializer, AssetTransactionSerializer, PriceAlertSerializer
+from .history import sync_daily_prices
+from .pricing import get_histories, get_history, get_quote, get_quotes, normalize_symbol
+from .services import apply_buy, apply_buys, apply_sell, lock_assets, rebuild_portfolio_positions
+from .sync import changes_since, parse_cursor
+from .upstream import UpstreamUnavailable
+
+# Los módulos de analítica (charts, helpers, risk, simulation, streaming...) dependen de
+# NumPy: se usan a través de `analytics`, que los importa en el primer acceso.
+
+# Costos y valores en otra divisa se convierten al tipo de cambio actual.
+FX_BASIS = 'current_rate'
 
 class IsOwner(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -25,11 +41,24 @@ class PortfolioViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsOwner]
 
     def get_queryset(self):
-        return Portfolio.objects.filter(owner=self.request.user).prefetch_related('assets')
+        return Portfolio.objects.filter(owner=self.request.user).prefetch_related('assets__transactions', 'assets__lots')
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def perform_update(self, serializer):
+        previous_method = serializer.instance.cost_basis_method
+        # El método nuevo y las posiciones recalculadas se confirman juntos.
+        with transaction.atomic(using=router.db_for_write(Portfolio)):
+            if serializer.validated_data.get('cost_basis_method', previous_method) != previous_method:
+                # Los assets se bloquean antes de guardar: el change log (contador del
+                # usuario) se toma siempre después de las filas de assets.
+                list(lock_assets(serializer.instance.assets.all()).values_list('pk'))
+            portfolio = serializer.save()
+            # Cambiar el método de costo exige reproducir el ledger de cada asset.
+            if portfolio.cost_basis_method != previous_method:
+                rebuild_portfolio_positions(portfolio)
+
     def retrieve(self, request, *args, **kwargs):
         """GET /api/portfolios/<id>/
         Devuelve los datos originales del portfolio más:
@@ -39,19 +68,21 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         """
         instance = self.get_object()
         serializer = self.get_serializer(instance)
-        assets = instance.assets.all().prefetch_related('transactions')
+        # Assets y transacciones ya vienen prefetched (get_queryset): no hay consultas por asset.
+        assets = instance.assets.all()
 
         from decimal import Decimal as D
         total_cost = D('0')
         total_profit_loss = D('0')
+        realized_profit_loss = D('0')
 
-        perf_by_asset_id = {}
-        for asset in assets:
-            perf = asset_weighted_performance(asset)
-            perf_by_asset_id[asset.id] = perf
+        # Métricas convertidas a la divisa base del portfolio (cotizaciones y FX por lotes).
+        perf_by_asset_id = analytics.helpers.portfolio_performance(assets, instance.base_currency)
+        for perf in perf_by_asset_id.values():
             if 'error' not in perf:
                 total_cost += D(str(perf.get('total_cost', 0)))
                 total_profit_loss += D(str(perf.get('total_profit_loss', 0)))
+                realized_profit_loss += D(str(perf.get('realized_profit_loss', 0)))
 
         if total_cost > 0:
             performance_pct = (total_profit_loss / total_cost) * 100
@@ -87,9 +118,11 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                             merged = {
                                 'id': b.get('id'),
                                 'created_at': b.get('created_at'),
-                                # Replace price with buy_price for clarity.
-                                'price': p.get('buy_price', b.get('price')),
+                                'side': p.get('side', b.get('side')),
+                                # Replace price with buy_price/sell_price for clarity.
+                                'price': p.get('buy_price', p.get('sell_price', b.get('price'))),
                                 'quantity': p.get('quantity', b.get('quantity')),
+                                'remaining_quantity': p.get('remaining_quantity'),
                                 'actual_price': p.get('actual_price'),
                                 'profit_loss': p.get('profit_loss'),
                                 'performance_pct': p.get('performance_pct'),
@@ -102,8 +135,10 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                     else:
                         for p in perf_queue:
                             enriched_tx.append({
-                                'price': p.get('buy_price'),
+                                'side': p.get('side'),
+                                'price': p.get('buy_price', p.get('sell_price')),
                                 'quantity': p.get('quantity'),
+                                'remaining_quantity': p.get('remaining_quantity'),
                                 'actual_price': p.get('actual_price'),
                                 'profit_loss': p.get('profit_loss'),
                                 'performance_pct': p.get('performance_pct'),
@@ -112,9 +147,13 @@ class PortfolioViewSet(viewsets.ModelViewSet):
                     enriched_tx = base_transactions
 
                 asset_item.update({
+                    'currency': perf.get('currency'),
+                    'fx_rate': perf.get('fx_rate'),
+                    'stale': perf.get('stale', False),
                     'total_cost': perf.get('total_cost'),
                     'actual_value': perf.get('actual_value'),
                     'total_profit_loss': perf.get('total_profit_loss'),
+                    'realized_profit_loss': perf.get('realized_profit_loss'),
                     'performance_pct': perf.get('performance'),
                     'total_quantity_calc': perf.get('total_quantity'),
                     'transactions': enriched_tx,
@@ -125,9 +164,12 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         data['assets'] = enriched_assets
         # Métricas agregadas del portafolio a nivel raíz (sin nueva clave agrupadora).
         data.update({
+            'currency': instance.base_currency,
+            'fx_basis': FX_BASIS,
             'total_cost': float(round(total_cost, 2)),
             'current_value': float(round(current_value, 2)),
             'total_profit_loss': float(round(total_profit_loss, 2)),
+            'realized_profit_loss': float(round(realized_profit_loss, 2)),
             'performance_pct': float(round(performance_pct, 2)),
         })
         return Response(data)
@@ -138,54 +180,219 @@ class PortfolioViewSet(viewsets.ModelViewSet):
 
         Crea un nuevo asset dentro del portfolio especificado. Ignora cualquier valor de 'portfolio' enviado
         en el payload y fuerza la asociación al portfolio de la URL.
+        Acepta también una lista de compras, que se aplican en un único round trip.
         """
         portfolio = self.get_object()
-        data = request.data.copy()
-        data.pop('portfolio', None) 
-        serializer = AssetSerializer(data=data)
+        many = isinstance(request.data, list)
+        items = request.data if many else [request.data]
+        data = []
+        for item in items:
+            item = dict(item.items()) if hasattr(item, 'items') else item
+            if isinstance(item, dict):
+                item.pop('portfolio', None)
+            data.append(item)
+        serializer = AssetSerializer(data=data if many else data[0], many=many)
         serializer.is_valid(raise_exception=True)
-        symbol = serializer.validated_data['symbol']
-        qty_new = serializer.validated_data['quantity']
-        price_new = serializer.validated_data['average_price']
-        with transaction.atomic():
-            
-            asset = (
-                Asset.objects.select_for_update()
-                .filter(portfolio=portfolio, symbol=symbol)
-                .first()
+        validated = serializer.validated_data if many else [serializer.validated_data]
+        buys = [
+            (item['symbol'], item['quantity'], item['average_price'])
+            for item in validated
+        ]
+        assets = apply_buys(portfolio, buys)
+        out = AssetSerializer(list(assets.values()), many=True, context={'request': request})
+        return Response(out.data if many else out.data[0], status=status.HTTP_201_CREATED)
+
+
+    @action(detail=True, methods=["get"], url_path="risk")
+    def risk(self, request, pk=None):
+        """GET /api/portfolios/<id>/risk/?years=1&benchmark=SPY
+
+        Volatilidad anualizada, máximo drawdown, Sharpe, beta frente al benchmark y matriz de
+        correlación de los holdings, calculados sobre el historial diario almacenado. Los pesos
+        son el valor actual de cada holding en la divisa base del portfolio.
+        """
+
+        portfolio = self.get_object()
+        benchmark = normalize_symbol(request.query_params.get('benchmark') or settings.RISK_BENCHMARK_SYMBOL)
+        try:
+            years = int(request.query_params.get('years', 1))
+        except ValueError:
+            return Response({'error': 'years must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        years = max(1, min(years, settings.RISK_MAX_YEARS))
+        end = timezone.now().date()
+        start = end - timedelta(days=365 * years)
+
+        assets = [asset for asset in portfolio.assets.all() if asset.quantity > 0]
+        perf = analytics.helpers.portfolio_performance(assets, portfolio.base_currency, with_transactions=False)
+        values = {
+            asset.symbol: perf[asset.id]['actual_value']
+            for asset in assets
+            if 'error' not in perf[asset.id] and perf[asset.id]['actual_value'] > 0
+        }
+        if not values:
+            return Response({'error': 'No holdings with a current price'}, status=status.HTTP_400_BAD_REQUEST)
+        symbols = sorted(values)
+        total_value = sum(values.values())
+        weights = [values[s] / total_value for s in symbols]
+
+        sync_daily_prices(sorted(set(symbols) | {benchmark}), start)
+        metrics = analytics.risk.portfolio_risk(symbols, weights, benchmark, start, end, settings.RISK_FREE_RATE)
+        if metrics is None:
+            return Response({'error': 'Not enough price history'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'benchmark': benchmark,
+            'start': start,
+            'end': end,
+            'currency': portfolio.base_currency,
+            **metrics,
+        })
+
+    @action(detail=True, methods=["post"], url_path="simulate")
+    def simulate(self, request, pk=None):
+        """POST /api/portfolios/<id>/simulate/
+
+        Proyección Monte Carlo del valor de las posiciones actuales (cantidades de cada asset,
+        sin operar) a `horizon_days` días hábiles. Cuerpo opcional: horizon_days (250), paths,
+        method ("bootstrap" remuestrea días históricos; "cholesky" usa normales correlacionadas),
+        years de historial (1), confidence (0.95), steps (puntos del fan chart, 12) y seed.
+        Devuelve percentiles del valor final, probabilidad de pérdida frente al valor actual y
+        frente al costo, VaR/CVaR como pérdidas y el fan chart. No modela el riesgo de divisa:
+        los valores se convierten a la divisa base con el tipo de cambio actual.
+
+        Corre de forma síncrona en el worker: la descarga del historial que falte pasa por
+        el guard del upstream (con su deadline) y el cálculo se limita con
+        SIMULATION_MAX_PATH_DAYS (paths x horizon_days) y SIMULATION_MAX_STEPS.
+        """
+
+        portfolio = self.get_object()
+        data = request.data
+        if not isinstance(data, dict):
+            return Response({'error': 'The request body must be a JSON object'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            horizon = int(data.get('horizon_days', 250))
+            paths = int(data.get('paths', settings.SIMULATION_DEFAULT_PATHS))
+            years = int(data.get('years', 1))
+            steps = int(data.get('steps', 12))
+            confidence = float(data.get('confidence', 0.95))
+            seed = data.get('seed')
+            seed = int(seed) if seed is not None else None
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'horizon_days, paths, years, steps and seed must be integers; confidence a number'},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            if asset is None:
-                asset = Asset.objects.create(
-                    portfolio=portfolio,
-                    symbol=symbol,
-                    quantity=qty_new,
-                    average_price=price_new,
-                )
-            else:
-                total_cost = asset.quantity * asset.average_price + qty_new * price_new
-                new_total_qty = asset.quantity + qty_new
-                asset.quantity = new_total_qty
-                asset.average_price = total_cost / new_total_qty
-                asset.save(update_fields=['quantity', 'average_price'])
-            AssetTransaction.objects.create(asset=asset, quantity=qty_new, price=price_new)
-        out = AssetSerializer(asset, context={'request': request})
-        return Response(out.data, status=status.HTTP_201_CREATED)
+        method = data.get('method', analytics.simulation.METHODS[0])
+        if method not in analytics.simulation.METHODS:
+            return Response({'error': f"method must be one of: {', '.join(analytics.simulation.METHODS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= horizon <= settings.SIMULATION_MAX_HORIZON_DAYS:
+            return Response(
+                {'error': f'horizon_days must be between 1 and {settings.SIMULATION_MAX_HORIZON_DAYS}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 100 <= paths <= settings.SIMULATION_MAX_PATHS:
+            return Response(
+                {'error': f'paths must be between 100 and {settings.SIMULATION_MAX_PATHS}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if paths * horizon > settings.SIMULATION_MAX_PATH_DAYS:
+            return Response(
+                {'error': f'paths * horizon_days must not exceed {settings.SIMULATION_MAX_PATH_DAYS}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 0.5 <= confidence < 1:
+            return Response({'error': 'confidence must be in [0.5, 1)'}, status=status.HTTP_400_BAD_REQUEST)
+        steps = max(1, min(steps, settings.SIMULATION_MAX_STEPS))
+        years = max(1, min(years, settings.RISK_MAX_YEARS))
+        end = timezone.now().date()
+        start = end - timedelta(days=365 * years)
+
+        assets = [asset for asset in portfolio.assets.all() if asset.quantity > 0]
+        perf = analytics.helpers.portfolio_performance(assets, portfolio.base_currency, with_transactions=False)
+        holdings = {}
+        for asset in assets:
+            item = perf[asset.id]
+            if 'error' in item or item['actual_value'] <= 0:
+                continue
+            # Varios assets con el mismo símbolo se simulan como un único holding.
+            holding = holdings.setdefault(asset.symbol, {'quantity': 0.0, 'value': 0.0, 'cost': 0.0})
+            holding['quantity'] += float(asset.quantity)
+            holding['value'] += item['actual_value']
+            holding['cost'] += item['total_cost']
+        if not holdings:
+            return Response({'error': 'No holdings with a current price'}, status=status.HTTP_400_BAD_REQUEST)
+        symbols = sorted(holdings)
+
+        sync_daily_prices(symbols, start)
+        _, returns = analytics.risk.return_matrix(symbols, start, end)
+        if len(returns) < 20:
+            return Response({'error': 'Not enough price history'}, status=status.HTTP_400_BAD_REQUEST)
+        values = [holdings[s]['value'] for s in symbols]
+        checkpoints, simulated = analytics.simulation.simulate_values(
+            returns, values, horizon, paths, method=method, steps=steps,
+            chunk_bytes=settings.SIMULATION_CHUNK_BYTES, seed=seed,
+        )
+        initial_value = sum(values)
+        result = analytics.simulation.summarize(
+            checkpoints, simulated, initial_value, sum(h['cost'] for h in holdings.values()), confidence,
+        )
+        return Response({
+            'currency': portfolio.base_currency,
+            'method': method,
+            'paths': paths,
+            'horizon_days': horizon,
+            'start': start,
+            'end': end,
+            'observations': int(len(returns)),
+            'holdings': [
+                {
+                    'symbol': s,
+                    'quantity': round(holdings[s]['quantity'], 4),
+                    'value': round(holdings[s]['value'], 2),
+                    'weight': round(holdings[s]['value'] / initial_value, 6),
+                }
+                for s in symbols
+            ],
+            **result,
+        })
 
+    @action(detail=False, methods=["get"], url_path="sync")
+    def sync_changes(self, request):
+        """GET /api/portfolios/sync/?since=<cursor>
 
-    # suma total de los activos del portafolio
+        Devuelve sólo lo que cambió desde `since`: portfolios, assets y transacciones creados
+        o modificados (representación plana) y los ids borrados en `deleted`, más el nuevo
+        `cursor`. Sin `since`, o con un cursor caducado, envía todo con `reset: true`,
+        paginado igual que los deltas (SYNC_PAGE_SIZE objetos por página).
+        Con `has_more: true` hay más cambios: se repite la llamada con el nuevo cursor.
+        """
+        try:
+            since = parse_cursor(request.query_params.get('since'))
+        except ValueError:
+            return Response({'error': 'since must be a cursor returned by this endpoint'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes_since(request.user, since, settings.SYNC_PAGE_SIZE))
+
+    # suma total de los activos del portafolio, en la divisa de reporte del usuario
+    # (?currency=EUR para sobrescribirla). Costo y valor se convierten al tipo de cambio
+    # actual (no al de la fecha de cada compra): la respuesta lo indica en fx_basis.
     @action(detail=False, methods=["get"], url_path="dashboard")
     def get_dashboard_info(self, request):
-        portfolios = Portfolio.objects.filter(owner=request.user).prefetch_related('assets')
+
+        portfolios = Portfolio.objects.filter(owner=request.user).prefetch_related('assets__transactions')
+        currency = (request.query_params.get('currency') or request.user.reporting_currency).upper()
+        if 'currency' in request.query_params and currency not in settings.MARKET_FX_CURRENCIES:
+            return Response(
+                {'error': f"Unsupported currency; use one of: {', '.join(settings.MARKET_FX_CURRENCIES)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         total_portfolios = portfolios.count()
         total_investment_cost = 0
         total_profit_loss = 0
 
-        for portfolio in portfolios:
-            for asset in portfolio.assets.all():
-                perf = asset_weighted_performance(asset)
-                if 'error' not in perf:
-                    total_investment_cost += perf.get('total_cost', 0)
-                    total_profit_loss += perf.get('total_profit_loss', 0)
+        assets = [asset for portfolio in portfolios for asset in portfolio.assets.all()]
+        for perf in analytics.helpers.portfolio_performance(assets, currency, with_transactions=False).values():
+            if 'error' not in perf:
+                total_investment_cost += perf.get('total_cost', 0)
+                total_profit_loss += perf.get('total_profit_loss', 0)
 
         if total_investment_cost > 0:
             total_performance_pct = (total_profit_loss / total_investment_cost) * 100
@@ -195,6 +402,8 @@ class PortfolioViewSet(viewsets.ModelViewSet):
         total_current_value = total_investment_cost + total_profit_loss
 
         return Response({
+            "currency": currency,
+            "fx_basis": FX_BASIS,
             "total_current_value": total_current_value,
             "total_investment_cost": total_investment_cost,
             "total_profit_loss": total_profit_loss,
@@ -208,7 +417,7 @@ class AssetViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsOwner]
 
     def get_queryset(self):
-        return Asset.objects.filter(portfolio__owner=self.request.user).select_related('portfolio').prefetch_related('transactions')
+        return Asset.objects.filter(portfolio__owner=self.request.user).select_related('portfolio').prefetch_related('transactions', 'lots')
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -216,33 +425,30 @@ class AssetViewSet(viewsets.ModelViewSet):
         portfolio = serializer.validated_data['portfolio']
         if portfolio.owner != request.user:
             return Response({'detail': 'Cannot add asset to a portfolio you do not own.'}, status=status.HTTP_403_FORBIDDEN)
-        symbol = serializer.validated_data['symbol']
-        qty_new = serializer.validated_data['quantity']
-        price_new = serializer.validated_data['average_price']
-        with transaction.atomic():
-            asset = (
-                Asset.objects.select_for_update()
-                .filter(portfolio=portfolio, symbol=symbol)
-                .first()
-            )
-            if asset is None:
-                asset = Asset.objects.create(
-                    portfolio=portfolio,
-                    symbol=symbol,
-                    quantity=qty_new,
-                    average_price=price_new,
-                )
-            else:
-                total_cost = asset.quantity * asset.average_price + qty_new * price_new
-                new_total_qty = asset.quantity + qty_new
-                asset.quantity = new_total_qty
-                asset.average_price = total_cost / new_total_qty
-                asset.save(update_fields=['quantity', 'average_price'])
-            AssetTransaction.objects.create(asset=asset, quantity=qty_new, price=price_new)
+        asset = apply_buy(
+            portfolio,
+            serializer.validated_data['symbol'],
+            serializer.validated_data['quantity'],
+            serializer.validated_data['average_price'],
+        )
         output = self.get_serializer(asset)
         headers = self.get_success_headers(output.data)
         return Response(output.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(detail=True, methods=["post"], url_path="sell")
+    def sell(self, request, pk=None):
+        """POST /api/assets/<id>/sell/  {quantity, price}
+
+        Registra una venta. La ganancia/pérdida realizada se calcula con el método de
+        costo del portfolio (FIFO o costo promedio).
+        """
+        asset = self.get_object()
+        serializer = AssetTransactionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        asset = apply_sell(asset, serializer.validated_data['quantity'], serializer.validated_data['price'])
+        output = self.get_serializer(asset)
+        return Response(output.data, status=status.HTTP_201_CREATED)
+
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
         ctx['request'] = self.request
@@ -264,39 +470,185 @@ class AssetViewSet(viewsets.ModelViewSet):
         return self.update(request, *args, **kwargs)
 
 
-class MarketQuoteView(APIView):
-    """GET /api/market/quote/?symbol=TSLA&period=5d
+class PriceAlertViewSet(viewsets.ModelViewSet):
+    """/api/alerts/  Alertas de precio o de % de P&L del usuario (?active=true|false para filtrar).
+
+    Las alertas se evalúan en cada refresco de cotizaciones; al dispararse quedan inactivas
+    con triggered_at y triggered_price. Reactivarlas (active=true) las vuelve a armar.
+    """
+    serializer_class = PriceAlertSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = PriceAlert.objects.filter(owner=self.request.user).select_related('asset')
+        active = self.request.query_params.get('active')
+        if active is not None:
+            queryset = queryset.filter(active=active.lower() in ('1', 'true', 'yes'))
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
 
-    Returns: {symbol, name, price, period}
-    period is optional (default '1d'); we don't currently return history to keep it light.
+def _history_options(request):
+    """Lee max_points y encoding del query string; devuelve (max_points, encoding) o un Response 400."""
+    encoding = request.query_params.get('encoding', 'plain')
+    if encoding not in ('plain', 'delta'):
+        return Response({'error': "encoding must be 'plain' or 'delta'"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        max_points = int(request.query_params.get('max_points', settings.MARKET_HISTORY_MAX_POINTS))
+    except ValueError:
+        return Response({'error': 'max_points must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    return max(3, min(max_points, settings.MARKET_HISTORY_MAX_POINTS_LIMIT)), encoding
+
+
+def _compact_close(close, max_points, encoding):
+    """Historial compacto de una serie de cierres: None sin serie y [] si viene vacía."""
+    if close is None:
+        return None
+    if close.empty:
+        return []
+    return analytics.charts.compact_history(close.index.as_unit('s').asi8, close.to_numpy(), max_points, encoding)
+
+
+class MarketQuoteView(APIView):
+    """GET /api/market/quote/?symbol=TSLA&period=5d&max_points=300&encoding=delta
+
+    Returns: {symbol, name, price, stale, period, history}
+    period is optional (default '1d'). stale=true means the last known price is served while
+    it is refreshed in the background (or because the upstream is unavailable). history is columnar ({t: [...], v: [...]}) and
+    downsampled with LTTB to at most max_points (default MARKET_HISTORY_MAX_POINTS);
+    encoding=delta sends delta-encoded integers (see portfolio.charts.compact_history).
+    An empty history (no trading in the period) is returned as [] along with the price.
     """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
+
         symbol = request.query_params.get('symbol')
         if not symbol:
             return Response({'error': 'Missing required query parameter: symbol'}, status=status.HTTP_400_BAD_REQUEST)
         period = request.query_params.get('period', '1d')
+        history_options = _history_options(request)
+        if isinstance(history_options, Response):
+            return history_options
+        max_points, encoding = history_options
 
         try:
-            ticker = yf.Ticker(symbol)
-            info = getattr(ticker, 'info', {}) or {}
-            name = info.get('shortName') or info.get('longName') or symbol
-            price = info.get('regularMarketPrice')
-            hist = getattr(ticker.history(period=period), 'Close', None)
-            if price is None:
-                # Fallback a fast_info si está disponible.
-                fast_info = getattr(ticker, 'fast_info', None)
-                if fast_info:
-                    price = getattr(fast_info, 'lastPrice', None) or getattr(fast_info, 'last_price', None)
-            if price is None:
+            quote = get_quote(symbol)
+            if quote is None:
                 return Response({'error': 'Price not available for symbol', 'symbol': symbol}, status=status.HTTP_404_NOT_FOUND)
+            try:
+                close = get_history(symbol, period)
+            except UpstreamUnavailable:
+                close = None
+            history = _compact_close(close, max_points, encoding)
             return Response({
-                'symbol': symbol.upper(),
-                'name': name,
-                'price': price,
+                'symbol': quote['symbol'],
+                'name': quote['name'],
+                'price': quote['price'],
+                'stale': quote.get('stale', False),
                 'period': period,
-                'history': hist
+                'history': history
             })
         except Exception as e:
             return Response({'error': 'Unable to fetch data', 'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class MarketQuotesView(APIView):
+    """GET /api/market/quotes/?symbols=AAPL,MSFT&history=true&period=5d
+
+    Returns: {quotes: [{symbol, name, price, currency, stale?, history?}], missing: [...]}
+    Resuelve todos los símbolos (máx. MARKET_QUOTES_MAX_SYMBOLS) con una sola consulta por
+    lotes y la caché local. history es opcional y usa el mismo formato que MarketQuoteView.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+
+        raw = request.query_params.get('symbols', '')
+        symbols = list(dict.fromkeys(normalize_symbol(s) for s in raw.split(',') if s.strip()))
+        if not symbols:
+            return Response({'error': 'Missing required query parameter: symbols'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(symbols) > settings.MARKET_QUOTES_MAX_SYMBOLS:
+            return Response(
+                {'error': f'At most {settings.MARKET_QUOTES_MAX_SYMBOLS} symbols per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        include_history = request.query_params.get('history', 'false').lower() in ('1', 'true', 'yes')
+        period = request.query_params.get('period', '1d')
+        history_options = _history_options(request)
+        if isinstance(history_options, Response):
+            return history_options
+        max_points, encoding = history_options
+
+        try:
+            quotes = get_quotes(symbols)
+            try:
+                histories = get_histories(list(quotes), period) if include_history and quotes else {}
+            except UpstreamUnavailable:
+                histories = {}
+        except Exception as e:
+            return Response({'error': 'Unable to fetch data', 'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        results = []
+        for symbol in symbols:
+            quote = quotes.get(symbol)
+            if quote is None:
+                continue
+            item = dict(quote)
+            if include_history:
+                item['history'] = _compact_close(histories.get(symbol), max_points, encoding)
+            results.append(item)
+        return Response({
+            'quotes': results,
+            'missing': [s for s in symbols if s not in quotes],
+        })
+
+
+class SymbolSearchView(APIView):
+    """GET /api/market/symbols/?q=appl&limit=10
+
+    Returns: {results: [{symbol, name, exchange, currency}]}
+    Autocompletado sobre el catálogo local (manage.py load_symbols): tickers por prefijo
+    y nombres por similitud de trigramas, sin llamadas a la red.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Missing required query parameter: q'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, 50))
+        return Response({'results': analytics.catalogue.get_index().search(query, limit)})
+
+
+async def portfolio_stream(request, pk):
+    """GET /api/portfolios/<id>/stream/  (text/event-stream)
+
+    Envía un evento 'snapshot' con la valoración actual y después eventos 'valuation'
+    con los assets cuyo valor cambió y los totales del portfolio. Requiere servir
+    investportfolio.asgi:application (uvicorn / gunicorn con worker ASGI): bajo WSGI
+    Django consumiría el stream entero antes de responder y ocuparía el worker para
+    siempre, así que responde 501.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'Streaming requires the ASGI application (investportfolio.asgi:application).'},
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+        )
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_403_FORBIDDEN)
+    portfolio = await Portfolio.objects.filter(pk=pk, owner=user).prefetch_related('assets').afirst()
+    if portfolio is None:
+        return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    subscription = await sync_to_async(analytics.streaming.build_subscription)(portfolio)
+    response = StreamingHttpResponse(analytics.streaming.hub.stream(subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response